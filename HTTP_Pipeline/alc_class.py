@@ -2,7 +2,34 @@ from suds.client import Client  # pip install suds-jurko
 from suds.transport.https import HttpAuthenticated
 from urllib.request import HTTPSHandler
 import ssl
-from datetime import datetime
+import threading
+from datetime import datetime, timedelta
+
+# Timestamp format used by the ALC SOAP interface for query bounds and returned samples
+ALC_TIME_FORMAT = "%m/%d/%Y %I:%M:%S %p"
+# ALC_TIME_FORMAT with fractional seconds, accepted for since times
+ALC_SINCE_FORMAT = "%m/%d/%Y %I:%M:%S.%f %p"
+# Timestamp format of the samples written back to SkySpark
+ALC_ROW_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Bounds on the sub-window size used when paging long trend pulls
+MIN_CHUNK = timedelta(hours=1)
+MAX_CHUNK = timedelta(days=31)
+
+
+def parse_since(since):
+    """
+    Parse a since time in ``mm/dd/yyyy hh:mm:ss AM/PM`` format with optional fractional seconds.
+
+    Returns
+    -------
+    since : datetime
+    The time to the microsecond.
+
+    """
+    try:
+        return datetime.strptime(since, ALC_SINCE_FORMAT)
+    except ValueError:
+        return datetime.strptime(since, ALC_TIME_FORMAT)
 
 
 class _Custom_Transport(HttpAuthenticated):
@@ -38,9 +65,13 @@ class _Custom_Transport(HttpAuthenticated):
 
 class alc_client():
 
-    def __init__(self, username=None, password=None):
+    def __init__(self, username=None, password=None, hedger=None, chunk_records=10000, initial_chunk_hours=24):
         self.username = username
         self.password = password
+        self.hedger = hedger  # Optional hedged_caller from hedge_class.py for tail latency
+        self.chunk_records = chunk_records  # Most records asked of the ALC server in one getTrendData call
+        self.initial_chunk_hours = initial_chunk_hours  # First sub-window size before the sample rate is known
+        self._local = threading.local()  # Connection of each thread, see _client()
         return
 
     ##################################################################################################
@@ -69,7 +100,50 @@ class alc_client():
     # End _connect()
     ##################################################################################################
 
-    def collect_data(self, trend_log_paths, start_time, final_time, columns=None):
+    def _client(self):
+        """
+        Return the connection of the calling thread, connecting on its first call. A suds client is not
+        shared between threads, and keeping one per thread saves fetching and parsing the WSDL on
+        every request.
+
+        Returns
+        -------
+        client : suds.client.Client
+        The connection client with which to call services.
+
+        """
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self._connect()
+        return client
+
+    ##################################################################################################
+    # End _client()
+    ##################################################################################################
+
+    def _get_trend_data(self, client, log, start_time, final_time, limit_from_start, max_records):
+        """
+        Call getTrendData on the ALC server, hedging the request when a hedger is configured.
+        Hedged requests run on the hedger's threads, each with that thread's own connection.
+
+        Returns
+        -------
+        r : list
+        Flat list of alternating timestamps and values returned by the ALC server.
+
+        """
+        def fetch(connection):
+            return connection.service.getTrendData(log, start_time, final_time, limit_from_start, max_records)
+
+        if self.hedger:
+            return self.hedger.call(lambda: fetch(self._client()))
+        return fetch(client)
+
+    ##################################################################################################
+    # End _get_trend_data()
+    ##################################################################################################
+
+    def collect_data(self, trend_log_paths, start_time, final_time, columns=None, since=None):
 
         """
         Collect data from ALC server via SOAP interface.
@@ -89,6 +163,9 @@ class alc_client():
         A list of strings in the same order as trend_log_paths to rename the
         corresponding trend_log_path column header in the returned pandas
         DataFrame.
+        since : string, default = None
+        Optional time in ``mm/dd/yyyy hh:mm:ss AM/PM`` format, fractional seconds allowed. When given,
+        collection starts no earlier than its second and only samples newer than it are returned.
 
         Returns
         -------
@@ -103,46 +180,180 @@ class alc_client():
 
         """
 
-        # Gather trend data
-        limit_from_start = True
-        max_records = 0
-        client = self._connect()
-        i = 1
+        if since:
+            since = parse_since(since)
+            # Nothing newer than since can exist in the requested window
+            if since >= datetime.strptime(final_time, ALC_TIME_FORMAT):
+                return {"value": []}
+
+        client = self._client()
 
         if not columns:
             columns = trend_log_paths
 
         for log, column in zip(trend_log_paths, columns):
-
+            dictlist = []
             try:
-                r = client.service.getTrendData(log, start_time, final_time, limit_from_start, max_records)
-
-                # Parse and convert to dictionary
-                time = r[::2]
-                data = [float(x) for x in r[1::2]]
+                for rows in self._iter_chunks(client, log, start_time, final_time, since):
+                    dictlist.extend(rows)
 
             except Exception as e:
                 print("\nError getting meter data: ", str(e), "\n")
+                status = self._error_status(e)
+                if status:
+                    return status
+                raise
 
-                if 'does not exist' in str(e):  # Query incorrect
-                    return 204
+        holdingDict = {}
+        holdingDict["value"] = dictlist
 
-                elif 'Unauthorized' in str(e):  # Credentials incorrect
-                    return 401
+        return holdingDict
 
-                elif 'Trends are not enabled' in str(e):  # Trend data not enabled
-                    return 501
+    ##################################################################################################
+    # End collect_data()
+    ##################################################################################################
 
-        dictionary = dict(zip(time, data))
-        dictlist = []
-        holdingDict = {}
+    def stream_data(self, trend_log_path, start_time, final_time, since=None):
+        """
+        Collect data for one trend log in sub-windows, handing back each sub-window's rows as soon as it
+        arrives so long pulls can be written out without holding the whole range in memory.
 
-        for key, value in dictionary.items():
-            dictlist.append([str(datetime.strptime(key, "%m/%d/%Y %I:%M:%S %p").strftime("%Y-%m-%d %H:%M:%S")), value])
-        holdingDict["value"] = dictlist
+        Parameters
+        ----------
+        trend_log_path : str
+        Path to the trend log on the ALC server.
+        start_time : string
+        Start time of data collection in ``mm/dd/yyyy hh:mm:ss AM/PM`` format.
+        final_time : string
+        Final time of data collection in ``mm/dd/yyyy hh:mm:ss AM/PM`` format.
+        since : string, default = None
+        Optional time in ``mm/dd/yyyy hh:mm:ss AM/PM`` format, fractional seconds allowed. Only samples
+        newer than it are returned.
 
-        return holdingDict
+        Returns
+        -------
+        chunks : generator or int
+        Generator of lists of [DateTime, Data] rows in time order, or an error status code if the first
+        sub-window failed. Errors in later sub-windows are raised from the generator.
+
+        """
+        if since:
+            since = parse_since(since)
+
+        chunks = self._iter_chunks(self._client(), trend_log_path, start_time, final_time, since)
+        try:
+            first = next(chunks, [])
+        except Exception as e:
+            print("\nError getting meter data: ", str(e), "\n")
+            status = self._error_status(e)
+            if status:
+                return status
+            raise
+
+        def stream():
+            yield first
+            for rows in chunks:
+                yield rows
+
+        return stream()
+
+    ##################################################################################################
+    # End stream_data()
+    ##################################################################################################
+
+    def _error_status(self, e):
+        """
+        Map an ALC server error to the status code handed back to SkySpark.
+
+        Returns
+        -------
+        status : int or None
+        204, 401 or 501, or None for errors without a status.
+
+        """
+        if 'does not exist' in str(e):  # Query incorrect
+            return 204
+
+        elif 'Unauthorized' in str(e):  # Credentials incorrect
+            return 401
+
+        elif 'Trends are not enabled' in str(e):  # Trend data not enabled
+            return 501
+
+        return None
+
+    ##################################################################################################
+    # End _error_status()
+    ##################################################################################################
+
+    def _iter_chunks(self, client, log, start_time, final_time, since=None):
+        """
+        Page through a trend log in sub-windows. Each sub-window is sized from the sample rate seen in
+        the previous one so a reply holds about chunk_records samples, and a reply cut off at
+        chunk_records is continued from its last sample.
+
+        Parameters
+        ----------
+        client : suds.client.Client
+        The connection client with which to call services.
+        log : str
+        Path to the trend log on the ALC server.
+        start_time : string
+        Start time of data collection in ``mm/dd/yyyy hh:mm:ss AM/PM`` format.
+        final_time : string
+        Final time of data collection in ``mm/dd/yyyy hh:mm:ss AM/PM`` format.
+        since : datetime, default = None
+        Only samples newer than it are returned.
+
+        Returns
+        -------
+        chunks : generator
+        Generator of lists of [DateTime, Data] rows in time order without duplicate timestamps.
+
+        """
+        limit_from_start = True
+        chunk_start = datetime.strptime(start_time, ALC_TIME_FORMAT)
+        final = datetime.strptime(final_time, ALC_TIME_FORMAT)
+        span = timedelta(hours=self.initial_chunk_hours)
+        last = since
+
+        # Only ask ALC for the part of the window from the second of since
+        if since and since > chunk_start:
+            chunk_start = since.replace(microsecond=0)
+
+        while chunk_start <= final:
+            chunk_end = min(chunk_start + span, final)
+            r = self._get_trend_data(client, log, chunk_start.strftime(ALC_TIME_FORMAT),
+                                     chunk_end.strftime(ALC_TIME_FORMAT), limit_from_start, self.chunk_records)
+
+            # Parse, dropping samples already handed back by an overlapping sub-window
+            rows = []
+            for key, value in zip(r[::2], r[1::2]):
+                timestamp = datetime.strptime(key, ALC_TIME_FORMAT)
+                if last and timestamp <= last:
+                    continue
+                rows.append([str(timestamp.strftime(ALC_ROW_FORMAT)), float(value)])
+                last = timestamp
+            if rows:
+                yield rows
+
+            count = len(r) // 2
+            if count >= self.chunk_records and last and last > chunk_start:
+                # Reply was cut off at max_records, continue from its last sample
+                chunk_start = last
+                continue
+
+            if chunk_end >= final:
+                break
+            # Size the next sub-window from this one's sample rate
+            if count:
+                seconds = max((chunk_end - chunk_start).total_seconds(), 1)
+                span = timedelta(seconds=0.8 * self.chunk_records * seconds / count)
+            else:
+                span = span * 2
+            span = min(max(span, MIN_CHUNK), MAX_CHUNK)
+            chunk_start = chunk_end
 
 ##################################################################################################
-# End collect_data()
+# End _iter_chunks()
 ##################################################################################################
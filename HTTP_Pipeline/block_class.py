@@ -0,0 +1,420 @@
+import struct
+from bisect import bisect_left
+from datetime import date
+from time_utils import EPOCH_ORDINAL, to_micros
+
+# Samples per sealed block. Blocks are decoded whole, so this bounds the work of a range read.
+BLOCK_SIZE = 512
+# Missing values are stored as this NaN bit pattern and decoded back to None
+NULL_BITS = 0x7FF8DEADBEEF0000
+# Largest int stored exactly as a float. Values are stored as floats and ints are flagged per sample.
+MAX_EXACT_INT = 2 ** 53
+
+
+class _bit_writer():
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._acc = 0
+        self._bits = 0
+        return
+
+    def write(self, value, nbits):
+        """
+        Append the low nbits of value.
+        """
+        self._acc = (self._acc << nbits) | (value & ((1 << nbits) - 1))
+        self._bits += nbits
+        while self._bits >= 8:
+            self._bits -= 8
+            self._buffer.append((self._acc >> self._bits) & 0xFF)
+        self._acc &= (1 << self._bits) - 1
+
+    def getvalue(self):
+        """
+        Return the written bits as bytes, padded with zeros to a whole byte.
+        """
+        if self._bits:
+            return bytes(self._buffer) + bytes([(self._acc << (8 - self._bits)) & 0xFF])
+        return bytes(self._buffer)
+
+
+class _bit_reader():
+
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+        return
+
+    def read(self, nbits):
+        """
+        Read the next nbits as an unsigned int.
+        """
+        first = self._pos >> 3
+        last = (self._pos + nbits + 7) >> 3
+        chunk = int.from_bytes(self._data[first:last], 'big')
+        shift = last * 8 - self._pos - nbits
+        self._pos += nbits
+        return (chunk >> shift) & ((1 << nbits) - 1)
+
+    def read_bit(self):
+        """
+        Read the next single bit.
+        """
+        byte = self._data[self._pos >> 3]
+        bit = (byte >> (7 - (self._pos & 7))) & 1
+        self._pos += 1
+        return bit
+
+
+def _float_bits(value):
+    if value is None:
+        return NULL_BITS
+    return struct.unpack('>Q', struct.pack('>d', value))[0]
+
+
+def _bits_float(bits):
+    if bits == NULL_BITS:
+        return None
+    return struct.unpack('>d', struct.pack('>Q', bits))[0]
+
+
+def encode_block(micros, values):
+    """
+    Encode timestamps with delta-of-delta and values with Gorilla style XOR compression.
+
+    Parameters
+    ----------
+    micros : list of int
+    Timestamps in microseconds since the epoch, in time order.
+    values : list of float or int
+    Sample values. None is stored as a missing value.
+
+    Returns
+    -------
+    data : bytes
+    Encoded block.
+
+    """
+    writer = _bit_writer()
+    writer.write(micros[0], 64)
+    previous_bits = _float_bits(values[0])
+    writer.write(previous_bits, 64)
+
+    previous_time = micros[0]
+    previous_delta = 0
+    leading = trailing = -1
+
+    for time_us, value in zip(micros[1:], values[1:]):
+        # Timestamps: zigzag encoded delta-of-delta in size buckets
+        delta = time_us - previous_time
+        dod = delta - previous_delta
+        zigzag = (dod << 1) ^ (dod >> 63)
+        if zigzag == 0:
+            writer.write(0, 1)
+        elif zigzag < (1 << 7):
+            writer.write(0b10, 2)
+            writer.write(zigzag, 7)
+        elif zigzag < (1 << 12):
+            writer.write(0b110, 3)
+            writer.write(zigzag, 12)
+        elif zigzag < (1 << 32):
+            writer.write(0b1110, 4)
+            writer.write(zigzag, 32)
+        else:
+            writer.write(0b1111, 4)
+            writer.write(zigzag, 64)
+        previous_time = time_us
+        previous_delta = delta
+
+        # Values: XOR with the previous value, storing only the meaningful bits
+        bits = _float_bits(value)
+        xor = bits ^ previous_bits
+        previous_bits = bits
+        if xor == 0:
+            writer.write(0, 1)
+            continue
+        new_leading = min(64 - xor.bit_length(), 31)
+        new_trailing = (xor & -xor).bit_length() - 1
+        if leading >= 0 and new_leading >= leading and new_trailing >= trailing:
+            writer.write(0b10, 2)
+            writer.write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading, trailing = new_leading, new_trailing
+            length = 64 - leading - trailing
+            writer.write(0b11, 2)
+            writer.write(leading, 5)
+            writer.write(length & 63, 6)  # 64 meaningful bits is stored as 0
+            writer.write(xor >> trailing, length)
+
+    return writer.getvalue()
+
+
+def decode_block(data, count):
+    """
+    Decode a block written by encode_block.
+
+    Parameters
+    ----------
+    data : bytes
+    Encoded block.
+    count : int
+    Number of samples in the block.
+
+    Returns
+    -------
+    micros, values : list of int, list of float
+    Timestamps in microseconds since the epoch and sample values.
+
+    """
+    reader = _bit_reader(data)
+    previous_time = reader.read(64)
+    previous_bits = reader.read(64)
+    micros = [previous_time]
+    values = [_bits_float(previous_bits)]
+
+    previous_delta = 0
+    leading = trailing = 0
+
+    for _ in range(count - 1):
+        if reader.read_bit() == 0:
+            zigzag = 0
+        elif reader.read_bit() == 0:
+            zigzag = reader.read(7)
+        elif reader.read_bit() == 0:
+            zigzag = reader.read(12)
+        elif reader.read_bit() == 0:
+            zigzag = reader.read(32)
+        else:
+            zigzag = reader.read(64)
+        dod = (zigzag >> 1) ^ -(zigzag & 1)
+        previous_delta += dod
+        previous_time += previous_delta
+        micros.append(previous_time)
+
+        if reader.read_bit() == 1:
+            if reader.read_bit() == 1:
+                leading = reader.read(5)
+                length = reader.read(6) or 64
+                trailing = 64 - leading - length
+            previous_bits ^= reader.read(64 - leading - trailing) << trailing
+        values.append(_bits_float(previous_bits))
+
+    return micros, values
+
+
+class compressed_block():
+
+    __slots__ = ('first', 'last', 'count', 'data', 'ints')
+
+    def __init__(self, micros, values):
+        """
+        Immutable block of encoded samples with its time range. Bit i of ints is set when value i was
+        an int, so it is decoded back to an int.
+        """
+        self.first = micros[0]
+        self.last = micros[-1]
+        self.count = len(micros)
+        self.data = encode_block(micros, values)
+        self.ints = sum(1 << index for index, value in enumerate(values) if type(value) is int)
+        return
+
+    def decode(self):
+        micros, values = decode_block(self.data, self.count)
+        if self.ints:
+            values = [int(value) if self.ints >> index & 1 else value for index, value in enumerate(values)]
+        return micros, values
+
+
+##################################################################################################
+# End Class compressed_block
+##################################################################################################
+
+class compressed_series():
+
+    def __init__(self, block_size=BLOCK_SIZE):
+        """
+        Time series stored as sealed compressed blocks plus a short uncompressed tail. Timestamp strings
+        are rebuilt on decode from the layout of the first row, so every row must share that layout.
+        Timestamps are kept to the microsecond. Values must be numbers or None, and ints and floats
+        come back with their own type.
+
+        Parameters
+        ----------
+        block_size : int, default = BLOCK_SIZE
+        Samples per sealed block.
+
+        """
+        self.block_size = block_size
+        self._blocks = []
+        self._block_ends = []
+        self._tail_micros = []
+        self._tail_values = []
+        self._layout = None
+        return
+
+    ##################################################################################################
+    # End __init__()
+    ##################################################################################################
+
+    def __len__(self):
+        return sum(block.count for block in self._blocks) + len(self._tail_micros)
+
+    @property
+    def nbytes(self):
+        """
+        Approximate bytes used by the encoded blocks and the uncompressed tail.
+        """
+        return sum(len(block.data) for block in self._blocks) + 16 * len(self._tail_micros)
+
+    @property
+    def first(self):
+        """
+        Timestamp of the oldest sample in microseconds since the epoch, or None if empty.
+        """
+        if self._blocks:
+            return self._blocks[0].first
+        return self._tail_micros[0] if self._tail_micros else None
+
+    @property
+    def last(self):
+        """
+        Timestamp of the newest sample in microseconds since the epoch, or None if empty.
+        """
+        if self._tail_micros:
+            return self._tail_micros[-1]
+        return self._blocks[-1].last if self._blocks else None
+
+    ##################################################################################################
+    # End properties
+    ##################################################################################################
+
+    def _layout_of(self, text):
+        """
+        Describe how a timestamp string is laid out around its ``YYYY-MM-DD hh:mm:ss`` part: the date
+        separator, the number of fractional digits and the suffix after them.
+        """
+        digits = 0
+        if text[19:20] == '.':
+            while 20 + digits < len(text) and text[20 + digits].isdigit():
+                digits += 1
+            # Digits past the microsecond cannot be rebuilt unless they are zeros
+            if text[26:20 + digits].strip('0'):
+                raise ValueError("Timestamp %s is finer than a microsecond" % text)
+        return text[10], digits, text[20 + digits if digits else 19:]
+
+    def extend(self, rows):
+        """
+        Append rows that are newer than every stored sample.
+
+        Parameters
+        ----------
+        rows : list
+        List of [DateTime, Data] rows in time order.
+
+        Raises
+        ------
+        ValueError
+        A row is out of order, its timestamp does not share the series layout or its value is not a
+        number. Rows before it are kept.
+
+        """
+        for text, value in rows:
+            layout = self._layout_of(text)
+            if self._layout is None:
+                self._layout = layout
+            elif layout != self._layout:
+                raise ValueError("Timestamp %s does not match the series layout" % text)
+
+            # Strings and booleans would come back as floats, only numbers are stored
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError("Value %r at %s is not a number" % (value, text))
+            if isinstance(value, int) and abs(value) > MAX_EXACT_INT:
+                raise ValueError("Value %r at %s does not fit a float" % (value, text))
+
+            micros = to_micros(text)
+            last = self.last
+            if last is not None and micros <= last:
+                raise ValueError("Timestamp %s is not newer than the last sample" % text)
+            self._tail_micros.append(micros)
+            self._tail_values.append(value)
+
+            if len(self._tail_micros) >= self.block_size:
+                block = compressed_block(self._tail_micros, self._tail_values)
+                self._blocks.append(block)
+                self._block_ends.append(block.last)
+                self._tail_micros = []
+                self._tail_values = []
+
+    ##################################################################################################
+    # End extend()
+    ##################################################################################################
+
+    def rows(self, start=None, end=None):
+        """
+        Decode the rows between two times, decoding only the blocks that overlap them.
+
+        Parameters
+        ----------
+        start : int, default = None
+        Start in microseconds since the epoch, inclusive. Open when None.
+        end : int, default = None
+        End in microseconds since the epoch, inclusive. Open when None.
+
+        Returns
+        -------
+        rows : list
+        List of [DateTime, Data] rows in time order.
+
+        """
+        rows = []
+        index = 0 if start is None else bisect_left(self._block_ends, start)
+        for block in self._blocks[index:]:
+            if end is not None and block.first > end:
+                break
+            micros, values = block.decode()
+            self._append_rows(rows, micros, values, start, end)
+        self._append_rows(rows, self._tail_micros, self._tail_values, start, end)
+        return rows
+
+    ##################################################################################################
+    # End rows()
+    ##################################################################################################
+
+    def _append_rows(self, rows, micros, values, start, end):
+        """
+        Format the samples inside [start, end] as rows.
+        """
+        separator, digits, suffix = self._layout
+        first = 0 if start is None else bisect_left(micros, start)
+        day_text = {}
+        for index in range(first, len(micros)):
+            if end is not None and micros[index] > end:
+                break
+            # Build the timestamp text arithmetically, formatting each calendar day only once
+            days, day_micros = divmod(micros[index], 86400000000)
+            if days not in day_text:
+                day_text[days] = date.fromordinal(days + EPOCH_ORDINAL).isoformat() + separator
+            seconds, remainder = divmod(day_micros, 1000000)
+            minutes, seconds = divmod(seconds, 60)
+            hours, minutes = divmod(minutes, 60)
+            text = '%s%02d:%02d:%02d' % (day_text[days], hours, minutes, seconds)
+            if digits:
+                text += '.' + ('%06d' % remainder).ljust(digits, '0')[:digits]
+            rows.append([text + suffix, values[index]])
+
+    ##################################################################################################
+    # End _append_rows()
+    ##################################################################################################
+
+    def drop_blocks(self, max_samples):
+        """
+        Drop the oldest whole blocks until at most max_samples remain, or only the tail is left.
+        """
+        while self._blocks and len(self) > max_samples:
+            self._blocks.pop(0)
+            self._block_ends.pop(0)
+
+##################################################################################################
+# End drop_blocks()
+##################################################################################################
@@ -0,0 +1,274 @@
+import threading
+from datetime import timedelta
+from collections import OrderedDict
+from block_class import compressed_series
+from time_utils import datetime_micros, moment_key, timestamp_key, to_datetime, to_micros
+
+
+class series_cache():
+
+    def __init__(self, max_series=500, max_samples=100000):
+        """
+        Bounded in-memory cache of time series rows keyed by point. Each point keeps one contiguous
+        window of coverage so a request can be served when its window lies inside what is cached.
+        Rows are held as compressed_series blocks of a few bytes per sample.
+
+        Parameters
+        ----------
+        max_series : int, default = 500
+        Number of points kept. The least recently used point is evicted first.
+        max_samples : int, default = 100000
+        Number of rows kept per point. The oldest blocks of rows are dropped first.
+
+        """
+        self.max_series = max_series
+        self.max_samples = max_samples
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+        return
+
+    ##################################################################################################
+    # End __init__()
+    ##################################################################################################
+
+    def get(self, key, start, end):
+        """
+        Return the cached rows of a point for a window if the window is fully covered.
+
+        Parameters
+        ----------
+        key : tuple
+        Cache key of the point, (route, point).
+        start : datetime
+        Start of the requested window, inclusive.
+        end : datetime
+        End of the requested window, inclusive.
+
+        Returns
+        -------
+        rows : list or None
+        List of [DateTime, Data] rows inside the window, or None if the window is not fully covered.
+
+        """
+        with self._lock:
+            entry = self._series.get(key)
+            if entry is None or start < entry['start'] or end > entry['end']:
+                return None
+            self._series.move_to_end(key)
+            return self._slice(entry, start, end)
+
+    ##################################################################################################
+    # End get()
+    ##################################################################################################
+
+    def covered_until(self, key, start):
+        """
+        Find how far the cached coverage of a point reaches from a window start.
+
+        Parameters
+        ----------
+        key : tuple
+        Cache key of the point, (route, point).
+        start : datetime
+        Start of the requested window.
+
+        Returns
+        -------
+        end : datetime or None
+        End of the cached coverage, or None if start is not inside the cached coverage.
+
+        """
+        with self._lock:
+            entry = self._series.get(key)
+            if entry is None or not entry['start'] <= start <= entry['end']:
+                return None
+            return entry['end']
+
+    ##################################################################################################
+    # End covered_until()
+    ##################################################################################################
+
+    def coverage(self, key):
+        """
+        Return the cached coverage window of a point.
+
+        Parameters
+        ----------
+        key : tuple
+        Cache key of the point, (route, point).
+
+        Returns
+        -------
+        window : tuple or None
+        (start, end) datetimes of the cached coverage, or None if the point is not cached.
+
+        """
+        with self._lock:
+            entry = self._series.get(key)
+            if entry is None:
+                return None
+            return entry['start'], entry['end']
+
+    ##################################################################################################
+    # End coverage()
+    ##################################################################################################
+
+    def put(self, key, start, end, rows, key_format):
+        """
+        Add the rows of a fetched window. Overlapping or adjacent coverage is merged, otherwise the
+        window replaces what was cached for the point.
+
+        Parameters
+        ----------
+        key : tuple
+        Cache key of the point, (route, point).
+        start : datetime
+        Start of the fetched window, inclusive.
+        end : datetime
+        End of the fetched window, inclusive.
+        rows : list
+        List of [DateTime, Data] rows in time order with ISO like timestamp strings.
+        key_format : string
+        strftime format that renders a window bound comparable to the first 19 characters of a row timestamp.
+
+        Raises
+        ------
+        ValueError
+        The rows are out of order or their timestamps do not share one layout. Nothing is cached.
+
+        """
+        rows = list(rows)
+        with self._lock:
+            entry = self._series.get(key)
+            if entry is not None and entry['start'] <= start <= entry['end'] <= end:
+                # New rows continue the cached coverage, append them to the existing blocks
+                series = entry['series']
+                if series.last is not None:
+                    rows = [row for row in rows if to_micros(row[0]) > series.last]
+                try:
+                    series.extend(rows)
+                except ValueError:
+                    del self._series[key]
+                    raise
+                entry['end'] = end
+
+            else:
+                if entry is not None and start <= entry['end'] and end >= entry['start']:
+                    before = self._slice(entry, entry['start'], start, include_end=False)
+                    after = self._slice(entry, end, entry['end'], include_start=False)
+                    rows = before + rows + after
+                    start = min(start, entry['start'])
+                    end = max(end, entry['end'])
+                series = compressed_series()
+                series.extend(rows)
+                entry = {'start': start, 'end': end, 'series': series}
+
+            self._trim(entry)
+            self._series[key] = entry
+            self._series.move_to_end(key)
+            while len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+
+    ##################################################################################################
+    # End put()
+    ##################################################################################################
+
+    def read_through(self, key, start, end, fetch, key_format, since=None, now=None, settle=0):
+        """
+        Return the rows of a point's window, serving the part the cache covers and fetching the rest.
+
+        Parameters
+        ----------
+        key : tuple
+        Cache key of the point, (route, point).
+        start : datetime
+        Start of the requested window, inclusive.
+        end : datetime
+        End of the requested window, inclusive.
+        fetch : callable
+        Function taking (start, end) datetimes that returns the returned_dict for a window, or an
+        error status code.
+        key_format : string
+        strftime format that renders a window bound comparable to the first 19 characters of a row timestamp.
+        since : datetime, default = None
+        Only rows newer than since, to the microsecond, are returned.
+        now : datetime, default = None
+        Current time in the same timezone as the window bounds.
+        settle : float, default = 0
+        Seconds before now that are never cached so samples that arrive late upstream are not missed.
+
+        Returns
+        -------
+        returned_dict : dictionary or int
+        Dictionary with Tree structure of {value -> [[DateTime,Data]*]}, or the error status code
+        returned by fetch.
+
+        """
+        if since is not None and since > start:
+            # Windows are cached on whole seconds, rows within the second are filtered below
+            start = since.replace(microsecond=0)
+
+        rows = self.get(key, start, end)
+        if rows is None:
+            covered = self.covered_until(key, start)
+            cached = self.get(key, start, covered) if covered is not None else None
+            # Fetch only what the cache does not cover
+            fetch_start = covered if cached is not None else start
+
+            ret = fetch(fetch_start, end)
+            if not isinstance(ret, dict) or 'value' not in ret:
+                return ret
+
+            fetched = ret['value']
+            rows = fetched
+            if cached is not None:
+                boundary = covered.strftime(key_format)
+                rows = cached + [row for row in fetched if row[0][:19] > boundary]
+
+            # Cache the fetched part, leaving out the newest samples that may still arrive
+            settled = end if now is None else min(end, now - timedelta(seconds=settle))
+            if settled > fetch_start:
+                last = settled.strftime(key_format)
+                try:
+                    self.put(key, fetch_start, settled, [row for row in fetched if row[0][:19] <= last], key_format)
+                except ValueError as e:  # Rows the compressed blocks cannot hold are served uncached
+                    print("\nError caching data: ", str(e), "\n")
+
+        if since is not None:
+            since = moment_key(since, key_format)
+            rows = [row for row in rows if timestamp_key(row[0]) > since]
+
+        return {"value": rows}
+
+    ##################################################################################################
+    # End read_through()
+    ##################################################################################################
+
+    def _slice(self, entry, start, end, include_start=True, include_end=True):
+        """
+        Return the rows of a cache entry between two window bounds.
+        """
+        # Bounds have whole second resolution and rows compare on their whole second
+        low = datetime_micros(start) + (0 if include_start else 1000000)
+        high = datetime_micros(end) + (999999 if include_end else -1)
+        return entry['series'].rows(low, high)
+
+    ##################################################################################################
+    # End _slice()
+    ##################################################################################################
+
+    def _trim(self, entry):
+        """
+        Drop the oldest blocks of a cache entry past max_samples and move its coverage start up to match.
+        """
+        series = entry['series']
+        if len(series) <= self.max_samples:
+            return
+        series.drop_blocks(self.max_samples)
+        # Coverage now starts at the second of the oldest kept row
+        if series.first is not None:
+            entry['start'] = to_datetime(series.first - series.first % 1000000)
+
+##################################################################################################
+# End _trim()
+##################################################################################################
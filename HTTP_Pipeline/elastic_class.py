@@ -1,27 +1,74 @@
 import json
 import requests as req
 from requests import Response
+from datetime import datetime
+from time_utils import fraction_micros, moment_key, timestamp_key
+
+# Timestamp format used for the start, end and since fields of an ElasticSearch query
+ELASTIC_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def parse_since(since):
+    """
+    Parse a since timestamp in ``YYYY-MM-DDThh:mm:ss`` format with optional fractional seconds.
+
+    Returns
+    -------
+    since : datetime
+    The timestamp to the microsecond.
+
+    """
+    return datetime.strptime(since[:19], ELASTIC_TIME_FORMAT).replace(microsecond=fraction_micros(since))
 
 
 class elastic_client():
 
-    def __init__(self, uri=None, headers=None, username=None, password=None):
+    def __init__(self, uri=None, headers=None, username=None, password=None, hedger=None):
         self.uri = uri
         self.headers = headers
         self.username = username
         self.password = password
+        self.hedger = hedger  # Optional hedged_caller from hedge_class.py for tail latency
         return
 
     ##################################################################################################
     # End __init__()
     ##################################################################################################
-    def get_timeseries(self, data):
+    def _post(self, data):
+        """
+        Send the query to ElasticSearch, hedging the request when a hedger is configured.
+
+        Parameters
+        ----------
+        data : string
+        JSON query string for the ElasticSearch endpoint
+
+        Returns
+        -------
+        ret : requests.Response
+        Response from the ElasticSearch endpoint
+
+        """
+        def post():
+            return req.post(self.uri, headers=self.headers, auth=(self.username, self.password), data=data)
+
+        if self.hedger:
+            return self.hedger.call(post)
+        return post()
+
+    ##################################################################################################
+    # End _post()
+    ##################################################################################################
+    def get_timeseries(self, data, since=None):
         """
         Function to get time series data from ElasticSearch for an endpoint and parse results
         Parameters
         ----------
         data : string
         String composed of metrics to find exact point in ElasticSearch
+        since : string, default = None
+        Optional UTC timestamp in ``YYYY-MM-DDThh:mm:ss`` format with optional fractional seconds. When
+        given, the query start is moved up to its second and only samples newer than it are returned.
 
         Returns
         -------
@@ -36,11 +83,34 @@ class elastic_client():
         """
 
         returned_dict = {}
+
+        if since:
+            try:
+                since = parse_since(since)
+                query = json.loads(data)
+                end = datetime.strptime(query['end'], ELASTIC_TIME_FORMAT)
+                start = query['start']
+            except (ValueError, KeyError, TypeError) as e:  # Malformed since or query, not an upstream failure
+                print("\nError parsing query: ", str(e), "\n")
+                return 404
+            # Nothing newer than since can exist in the requested window
+            if since >= end:
+                returned_dict["value"] = []
+                return returned_dict
+            # Only ask ElasticSearch for the part of the window from the second of since
+            if since.strftime(ELASTIC_TIME_FORMAT) > start:
+                query['start'] = since.strftime(ELASTIC_TIME_FORMAT)
+                data = json.dumps(query)
+            since = moment_key(since, ELASTIC_TIME_FORMAT)
+
         try:
-            ret = req.post(self.uri, headers=self.headers, auth=(self.username, self.password), data=data)
+            ret = self._post(data)
             var = json.loads(ret.json())
             value_list = []
             for item in var['value']:
+                # Timestamps are ISO strings, compared with their fractional seconds
+                if since and timestamp_key(item[0]) <= since:
+                    continue
                 value_list.append([item[0], item[1]])
 
             returned_dict["value"] = value_list
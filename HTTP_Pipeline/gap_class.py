@@ -0,0 +1,336 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+# Format of the window bounds stored with each gap
+GAP_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+# Suffix of a gap file while a retry of it is running
+CLAIMED_SUFFIX = '.claimed'
+
+
+class gap_queue():
+
+    def __init__(self, directory='gaps', base_delay=60, max_delay=3600, interval=30, claim_timeout=3600):
+        """
+        Persistent queue of point windows that failed upstream. Gaps are retried in the background with
+        exponential backoff and marked as filled once the upstream returns their data, so SkySpark can
+        pull just those windows again. Each point's gaps are kept in a directory of their own, so
+        resolving the gaps of a point that has none costs a single directory lookup.
+
+        Parameters
+        ----------
+        directory : string, default = 'gaps'
+        Directory holding a sub-directory per point with one JSON file per gap.
+        base_delay : float, default = 60
+        Seconds before the first retry of a gap. Each failed retry doubles the delay.
+        max_delay : float, default = 3600
+        Longest delay between retries of a gap.
+        interval : float, default = 30
+        Seconds between checks for due retries.
+        claim_timeout : float, default = 3600
+        Seconds after which the claim of a retry that never finished, for example in a worker that was
+        killed, is released so the gap is retried again.
+
+        """
+        self.directory = directory
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.interval = interval
+        self.claim_timeout = claim_timeout
+        self._health = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        return
+
+    ##################################################################################################
+    # End __init__()
+    ##################################################################################################
+
+    def _point_directory(self, route, point):
+        """
+        Return the directory holding a point's gaps, named by the sha1 of the route and point.
+        """
+        digest = hashlib.sha1('|'.join([route, point]).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    ##################################################################################################
+    # End _point_directory()
+    ##################################################################################################
+
+    def _file_name(self, gap, suffix='.json'):
+        """
+        Return the file holding a gap. Gap ids are the sha1 of the route, point and window.
+        """
+        return os.path.join(self._point_directory(gap['route'], gap['point']), gap['id'] + suffix)
+
+    ##################################################################################################
+    # End _file_name()
+    ##################################################################################################
+
+    def _write(self, gap):
+        """
+        Store a gap, writing to a temporary file first so a crash never leaves a half written gap.
+        """
+        file_name = self._file_name(gap)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        temp_name = "%s.%d.tmp" % (file_name, os.getpid())
+        with open(temp_name, 'w') as file_gap:
+            json.dump(gap, file_gap)
+        os.replace(temp_name, file_name)
+
+    ##################################################################################################
+    # End _write()
+    ##################################################################################################
+
+    def _entries(self, directory):
+        """
+        Read the gaps stored in a point's directory, claimed ones included.
+
+        Returns
+        -------
+        entries : list
+        List of (file name, gap) pairs.
+
+        """
+        try:
+            names = os.listdir(directory)
+        except OSError:  # The point has no gaps
+            return []
+
+        entries = []
+        for name in names:
+            if not (name.endswith('.json') or name.endswith(CLAIMED_SUFFIX)):
+                continue
+            file_name = os.path.join(directory, name)
+            try:
+                with open(file_name, 'r') as file_gap:
+                    entries.append((file_name, json.load(file_gap)))
+            except (OSError, ValueError):  # Removed or being replaced by another worker
+                continue
+        return entries
+
+    ##################################################################################################
+    # End _entries()
+    ##################################################################################################
+
+    def record(self, route, point, start, end):
+        """
+        Record a window that failed upstream. A window already in the queue is left as it is.
+
+        Parameters
+        ----------
+        route : string
+        Route the window was requested on, elastic or alc.
+        point : string
+        Point of the window: the elastic query without its start and end, or the ALC trend log path.
+        start : datetime
+        Start of the failed window.
+        end : datetime
+        End of the failed window.
+
+        """
+        start = start.strftime(GAP_TIME_FORMAT)
+        end = end.strftime(GAP_TIME_FORMAT)
+        gap_id = hashlib.sha1('|'.join([route, point, start, end]).encode('utf-8')).hexdigest()
+
+        gap = {'id': gap_id, 'route': route, 'point': point, 'start': start, 'end': end,
+               'status': 'pending', 'attempts': 0, 'next_try': time.time() + self.base_delay, 'filled_at': None}
+        with self._lock:
+            if os.path.exists(self._file_name(gap)) or os.path.exists(self._file_name(gap, CLAIMED_SUFFIX)):
+                return
+            self._write(gap)
+
+    ##################################################################################################
+    # End record()
+    ##################################################################################################
+
+    def resolve(self, route, point, start, end):
+        """
+        Remove the gaps of a point that lie inside a window that was just served successfully.
+
+        Parameters
+        ----------
+        route : string
+        Route the window was requested on.
+        point : string
+        Point of the window.
+        start : datetime
+        Start of the served window.
+        end : datetime
+        End of the served window.
+
+        """
+        start = start.strftime(GAP_TIME_FORMAT)
+        end = end.strftime(GAP_TIME_FORMAT)
+        # Claimed gaps are removed too, their retry then finds its claim gone and drops its result
+        for file_name, gap in self._entries(self._point_directory(route, point)):
+            if gap['route'] == route and gap['point'] == point and start <= gap['start'] and gap['end'] <= end:
+                try:
+                    os.remove(file_name)
+                except OSError:  # Already resolved by another worker
+                    pass
+
+    ##################################################################################################
+    # End resolve()
+    ##################################################################################################
+
+    def list(self, status=None):
+        """
+        List the queued gaps.
+
+        Parameters
+        ----------
+        status : string, default = None
+        Only list gaps with this status, pending or filled.
+
+        Returns
+        -------
+        gaps : list of dictionary
+        Gaps sorted by route, point and start. Elastic windows are in UTC and ALC windows in server
+        local time.
+
+        """
+        gaps = [gap for _, gap in self._all_entries() if status is None or gap['status'] == status]
+        return sorted(gaps, key=lambda gap: (gap['route'], gap['point'], gap['start']))
+
+    ##################################################################################################
+    # End list()
+    ##################################################################################################
+
+    def _all_entries(self):
+        """
+        Read the gaps of every point as (file name, gap) pairs.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            entries.extend(self._entries(os.path.join(self.directory, name)))
+        return entries
+
+    ##################################################################################################
+    # End _all_entries()
+    ##################################################################################################
+
+    def report(self, route, healthy):
+        """
+        Record whether the last upstream call of a route succeeded.
+        """
+        self._health[route] = healthy
+
+    ##################################################################################################
+    # End report()
+    ##################################################################################################
+
+    def start(self, fetchers, on_filled=None):
+        """
+        Start the background thread that retries due gaps.
+
+        Parameters
+        ----------
+        fetchers : dictionary
+        Dictionary of {route -> function(point, start, end)} returning the returned_dict of a window,
+        or an error status code.
+        on_filled : callable, default = None
+        Function called with (gap, returned_dict) when a gap is filled, for example to cache its rows.
+
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(fetchers, on_filled), name='gap_queue',
+                                        daemon=True)
+        self._thread.start()
+
+    ##################################################################################################
+    # End start()
+    ##################################################################################################
+
+    def _run(self, fetchers, on_filled):
+        """
+        Retry due gaps until the process exits.
+        """
+        while True:
+            time.sleep(self.interval)
+            probed = set()
+            entries = sorted(self._all_entries(), key=lambda entry: (entry[1]['route'], entry[1]['point'],
+                                                                     entry[1]['start']))
+            for file_name, gap in entries:
+                if file_name.endswith(CLAIMED_SUFFIX):
+                    self._release_stale(file_name)
+                    continue
+                route = gap['route']
+                if gap['status'] != 'pending':
+                    continue
+                if gap['next_try'] > time.time() or route not in fetchers:
+                    continue
+                # While a route is failing only one gap per check is retried, as a probe
+                if route in probed:
+                    continue
+                if not self._health.get(route, True):
+                    probed.add(route)
+                self._retry(gap, fetchers[route], on_filled)
+                if not self._health.get(route, True):
+                    probed.add(route)
+
+    ##################################################################################################
+    # End _run()
+    ##################################################################################################
+
+    def _release_stale(self, claimed_name):
+        """
+        Put back a claimed gap whose retry has not finished within claim_timeout.
+        """
+        try:
+            if time.time() - os.path.getmtime(claimed_name) > self.claim_timeout:
+                os.rename(claimed_name, claimed_name[:-len(CLAIMED_SUFFIX)] + '.json')
+        except OSError:  # Finished or resolved meanwhile
+            pass
+
+    ##################################################################################################
+    # End _release_stale()
+    ##################################################################################################
+
+    def _retry(self, gap, fetch, on_filled):
+        """
+        Fetch a gap's window again and mark it filled, or back off its next retry. The gap is claimed by
+        renaming its file, which only one process sharing the directory can do.
+        """
+        claimed_name = self._file_name(gap, CLAIMED_SUFFIX)
+        try:
+            os.rename(self._file_name(gap), claimed_name)
+            os.utime(claimed_name)  # The claim times out from now
+        except OSError:  # Resolved, or claimed by another worker
+            return
+
+        start = datetime.strptime(gap['start'], GAP_TIME_FORMAT)
+        end = datetime.strptime(gap['end'], GAP_TIME_FORMAT)
+        try:
+            ret = fetch(gap['point'], start, end)
+        except Exception as e:
+            print("\nError retrying gap: ", str(e), "\n")
+            ret = None
+
+        filled = isinstance(ret, dict) and 'value' in ret
+        self._health[gap['route']] = filled
+        if filled:
+            gap['status'] = 'filled'
+            gap['filled_at'] = time.time()
+        else:
+            gap['attempts'] += 1
+            gap['next_try'] = time.time() + min(self.base_delay * 2 ** gap['attempts'], self.max_delay)
+
+        with self._lock:
+            try:
+                os.remove(claimed_name)
+            except OSError:  # Resolved while the retry was running
+                return
+            self._write(gap)
+        if filled and on_filled:
+            on_filled(gap, ret)
+
+##################################################################################################
+# End _retry()
+##################################################################################################
@@ -0,0 +1,194 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class hedged_caller():
+
+    def __init__(self, delay=None, percentile=95, window=200, min_samples=20, budget=0.05, concurrency=4):
+        """
+        Parameters
+        ----------
+        delay : float, default = None
+        Seconds to wait on a call before sending a duplicate. When None the rolling percentile
+        of recent call latencies is used instead.
+        percentile : float, default = 95
+        Percentile of recent latencies used as the hedge delay when no fixed delay is given.
+        window : int, default = 200
+        Number of recent call latencies kept for the rolling percentile.
+        min_samples : int, default = 20
+        Calls are not hedged until this many latencies have been recorded.
+        budget : float, default = 0.05
+        Maximum fraction of calls that may send a duplicate request.
+        concurrency : int, default = 4
+        Number of calls expected to run at once. Primaries run in a pool of concurrency threads plus one
+        per hedge slot, and duplicates in a separate pool of hedge slots sized from budget * concurrency.
+        A hedged call holds its slot until both of its requests have returned, so requests that lost
+        the race never take more than the hedge slots and a new primary always finds a free thread.
+        A call is not hedged while every slot is held.
+
+        """
+        self.delay = delay
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.budget = budget
+        self.calls = 0
+        self.hedges = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.hedge_slots = max(int(math.ceil(budget * concurrency)), 1)
+        self._slots = threading.BoundedSemaphore(self.hedge_slots)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency + self.hedge_slots)
+        self._hedge_executor = ThreadPoolExecutor(max_workers=self.hedge_slots)
+        return
+
+    ##################################################################################################
+    # End __init__()
+    ##################################################################################################
+
+    def _hedge_delay(self):
+        """
+        Find how long a call may run before a duplicate is sent.
+
+        Returns
+        -------
+        delay : float or None
+        Seconds to wait before hedging, or None if not enough latencies are known yet.
+
+        """
+        if self.delay is not None:
+            return self.delay
+
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+
+        index = max(int(math.ceil(self.percentile / 100.0 * len(ordered))) - 1, 0)
+        return ordered[index]
+
+    ##################################################################################################
+    # End _hedge_delay()
+    ##################################################################################################
+
+    def _take_budget(self):
+        """
+        Reserve one hedge from the budget and a hedge slot if both are free.
+
+        Returns
+        -------
+        bool
+        True if a duplicate request may be sent. The slot is then released by _hold_slot.
+
+        """
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            if self.hedges + 1 <= self.budget * self.calls:
+                self.hedges += 1
+                return True
+        self._slots.release()
+        return False
+
+    ##################################################################################################
+    # End _take_budget()
+    ##################################################################################################
+
+    def _hold_slot(self, futures):
+        """
+        Release a hedge slot once every request of the hedged call has returned, also the one that
+        lost the race.
+        """
+        remaining = [len(futures)]
+
+        def release(future):
+            with self._lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._slots.release()
+
+        for future in futures:
+            future.add_done_callback(release)
+
+    ##################################################################################################
+    # End _hold_slot()
+    ##################################################################################################
+
+    def call(self, function, hedge_function=None):
+        """
+        Run an upstream call and send a duplicate if it has not returned within the hedge delay.
+        Whichever reply arrives first is used.
+
+        Parameters
+        ----------
+        function : callable
+        Zero argument callable making the upstream request.
+        hedge_function : callable, default = None
+        Zero argument callable used for the duplicate request, for clients that cannot share
+        a connection between threads. Defaults to function.
+
+        Returns
+        -------
+        result : object
+        Return value of the first call to complete successfully.
+
+        Raises
+        ------
+        Exception
+        Whatever the upstream call raised if no call completed successfully.
+
+        """
+        with self._lock:
+            self.calls += 1
+
+        started = time.time()
+        delay = self._hedge_delay()
+        primary = self._executor.submit(function)
+
+        if delay is None:
+            result = primary.result()
+            self._record(time.time() - started)
+            return result
+
+        done, pending = wait([primary], timeout=delay)
+        if done or not self._take_budget():
+            result = primary.result()
+            self._record(time.time() - started)
+            return result
+
+        hedge = self._hedge_executor.submit(hedge_function or function)
+        self._hold_slot([primary, hedge])
+        done, pending = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        first = done.pop()
+
+        # Fall back to the other request if the first one to finish failed
+        if first.exception() is not None and pending:
+            first = pending.pop()
+
+        result = first.result()
+        self._record(time.time() - started)
+        return result
+
+    ##################################################################################################
+    # End call()
+    ##################################################################################################
+
+    def _record(self, latency):
+        """
+        Record the latency of a completed call for the rolling percentile.
+
+        Parameters
+        ----------
+        latency : float
+        Seconds the call took.
+
+        """
+        with self._lock:
+            self._latencies.append(latency)
+
+##################################################################################################
+# End _record()
+##################################################################################################
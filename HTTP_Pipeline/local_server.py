@@ -1,34 +1,359 @@
 from http.server import BaseHTTPRequestHandler, HTTPServer
+import os
+import signal
 import time
 import json
 import urllib.parse
 import yaml  # pip install pyyaml
-from alc_class import alc_client
-from elastic_class import elastic_client
+from alc_class import alc_client, ALC_TIME_FORMAT, ALC_SINCE_FORMAT, ALC_ROW_FORMAT
+from alc_class import parse_since as parse_alc_since
+from elastic_class import elastic_client, ELASTIC_TIME_FORMAT
+from elastic_class import parse_since as parse_elastic_since
 from google_calendar_class import google_cal_client
-from datetime import datetime
+from hedge_class import hedged_caller
+from profiler_class import route_profiler
+from cache_class import series_cache
+from prefetch_class import prefetch_scheduler
+from watermark_class import watermark_store
+from gap_class import gap_queue, GAP_TIME_FORMAT
+from datetime import datetime, timedelta
 
 # Host name and port number that server will operate under for Skyspark to discover
 hostName = "localhost"
 hostPort = 9000
 
+# Number of worker processes sharing the listening socket. Values above 1 pre-fork workers so the
+# CPU-bound parsing and serialization of large responses runs on several cores (POSIX hosts only).
+# Every worker keeps its own window cache. The prefetcher and the gap retry thread run in the first
+# worker only. Workers share the requests they see and the prefetched windows through PREFETCH_DIR, so
+# the prefetcher learns from every worker's requests and its windows warm every worker's cache.
+NUM_WORKERS = 1
+
 # URI and headers for Elastic Search POST request.
 REMOTE_URI_NERSC = 'https://fn.nersc.gov/t/get_timeseries/get_timeseries'
 REMOTE_HEADERS_NERSC = {"Content-Type": "application/json; charset=utf8"}
 
+# Hedged upstream requests for tail latency. A duplicate request is sent when a call has not returned
+# within HEDGE_DELAY seconds, or the rolling HEDGE_PERCENTILE latency when HEDGE_DELAY is None.
+# HEDGE_BUDGET caps the fraction of calls that may be duplicated.
+HEDGE_ENABLED = False
+HEDGE_DELAY = None
+HEDGE_PERCENTILE = 95
+HEDGE_BUDGET = 0.05
+# Upstream calls expected at once per client in one process: the request handler, the prefetcher and
+# the gap retry thread. Sizes the hedger's thread pools.
+HEDGE_CONCURRENCY = 3
+
+
+def _make_hedger():
+    """
+    Build a hedged_caller from the hedging settings, or None if hedging is disabled.
+    """
+    if not HEDGE_ENABLED:
+        return None
+    return hedged_caller(delay=HEDGE_DELAY, percentile=HEDGE_PERCENTILE, budget=HEDGE_BUDGET,
+                         concurrency=HEDGE_CONCURRENCY)
+
+
+# On-demand profiling of route handlers. A request is profiled when it carries the "X-Profile: 1"
+# header or is sampled at PROFILE_SAMPLE_RATE. The newest PROFILE_KEEP stats files per route are kept
+# under PROFILE_DIR and summarized by the profile route.
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_DIR = 'profiles'
+PROFILE_KEEP = 20
+PROFILER = route_profiler(directory=PROFILE_DIR, sample_rate=PROFILE_SAMPLE_RATE, keep=PROFILE_KEEP)
+
+# Predictive cache warming. Windows requested on the elastic and alc routes are cached in memory and
+# each point's next window is prefetched up to PREFETCH_LEAD seconds before its next expected poll.
+# The poll period is learned per point unless PREFETCH_PERIOD is set. The newest CACHE_SETTLE seconds
+# of a window are never cached so samples that arrive late upstream are not missed.
+CACHE_ENABLED = True
+CACHE_MAX_SERIES = 500
+CACHE_MAX_SAMPLES = 100000
+CACHE_SETTLE = 300
+PREFETCH_LEAD = 600
+PREFETCH_PERIOD = None
+# Directory through which pre-forked workers share prefetching, used when NUM_WORKERS is above 1
+PREFETCH_DIR = 'prefetch'
+
+# Per trend log watermark (how far ALC has been fetched) and a tail of recent samples, stored under
+# ALC_WATERMARK_DIR and loaded into the cache at start up so ALC requests only fetch newer samples,
+# also after a restart. Set ALC_WATERMARK_DIR to None to keep ALC windows in memory only.
+ALC_WATERMARK_DIR = 'alc_watermarks'
+ALC_WATERMARK_TAIL_HOURS = 48
+
+# ALC windows longer than this many days skip the cache and are written back sub-window by
+# sub-window as they arrive from the ALC server, keeping memory bounded on long historical pulls
+ALC_STREAM_DAYS = 7
+
+# Windows that fail upstream (connection errors, timeouts, unexpected replies) are answered with 503
+# and queued under GAP_DIR. Queued windows are retried in the background, starting GAP_RETRY_DELAY
+# seconds after the failure and doubling up to GAP_MAX_RETRY_DELAY, and listed by the gaps route once
+# filled so SkySpark can pull them again. Set GAP_DIR to None to disable the queue.
+GAP_DIR = 'gaps'
+GAP_RETRY_DELAY = 60
+GAP_MAX_RETRY_DELAY = 3600
+
+# Status codes the upstream clients return for an answered request, passed on to SkySpark as they are
+UPSTREAM_STATUSES = (204, 401, 404, 501)
+
+# Routes served by MyServer, matched against the end of the request path
+ROUTES = ["elastic", "alc", "calendar", "profile", "gaps"]
+
 # Read in authentication credentials from yaml configuration file
 with open('authentication.yaml', 'r') as file_auth:
     authentication_yaml = yaml.load(file_auth)
 
-# Declare ALC client from alc_class.py with credentials from yaml file
-ALC_CLIENT = alc_client(username=authentication_yaml['ALC']['username'],
-                        password=authentication_yaml['ALC']['password'])
-# Declare ELASTIC client from elastic_class.py with credentials from yaml file
-ELASTIC_CLIENT = elastic_client(uri=REMOTE_URI_NERSC, headers=REMOTE_HEADERS_NERSC,
-                                username=authentication_yaml['ElasticSearch']['username'],
-                                password=authentication_yaml['ElasticSearch']['password'])
-# Declare CALENDAR client from google_calendar_class.py. Credentials supplied through JSON file
-CALENDAR_CLIENT = google_cal_client()
+
+def _init_clients():
+    """
+    Declare the upstream clients used by the route handlers. Called once at start up and again in
+    every pre-forked worker so no worker shares connection or thread pool state with another.
+    """
+    global ALC_CLIENT, ELASTIC_CLIENT, CALENDAR_CLIENT, CACHE, PREFETCHER, WATERMARKS, GAPS
+
+    # Declare ALC client from alc_class.py with credentials from yaml file
+    ALC_CLIENT = alc_client(username=authentication_yaml['ALC']['username'],
+                            password=authentication_yaml['ALC']['password'],
+                            hedger=_make_hedger())
+    # Declare ELASTIC client from elastic_class.py with credentials from yaml file
+    ELASTIC_CLIENT = elastic_client(uri=REMOTE_URI_NERSC, headers=REMOTE_HEADERS_NERSC,
+                                    username=authentication_yaml['ElasticSearch']['username'],
+                                    password=authentication_yaml['ElasticSearch']['password'],
+                                    hedger=_make_hedger())
+    # Declare CALENDAR client from google_calendar_class.py. Credentials supplied through JSON file
+    CALENDAR_CLIENT = google_cal_client()
+    # Declare window cache and the scheduler that warms it
+    CACHE = series_cache(max_series=CACHE_MAX_SERIES, max_samples=CACHE_MAX_SAMPLES)
+    PREFETCHER = prefetch_scheduler(CACHE, lead=PREFETCH_LEAD, period=PREFETCH_PERIOD, settle=CACHE_SETTLE,
+                                    directory=PREFETCH_DIR if NUM_WORKERS > 1 else None,
+                                    fetchers={'elastic': _fetch_elastic, 'alc': _fetch_alc})
+    # Declare ALC watermarks and load the stored tails into the cache
+    WATERMARKS = None
+    if CACHE_ENABLED and ALC_WATERMARK_DIR:
+        WATERMARKS = watermark_store(directory=ALC_WATERMARK_DIR, tail_hours=ALC_WATERMARK_TAIL_HOURS,
+                                     time_format=ALC_ROW_FORMAT)
+        WATERMARKS.load(CACHE)
+    # Declare the queue of windows that failed upstream
+    GAPS = None
+    if GAP_DIR:
+        GAPS = gap_queue(directory=GAP_DIR, base_delay=GAP_RETRY_DELAY, max_delay=GAP_MAX_RETRY_DELAY)
+
+
+def _start_background():
+    """
+    Start the background threads of the current process, the prefetcher and the gap retry thread.
+    Threads do not survive a fork, so with pre-forked workers they are started in one worker only.
+    """
+    if CACHE_ENABLED:
+        PREFETCHER.start()
+    if GAPS:
+        GAPS.start({'elastic': _retry_fetch(_fetch_elastic), 'alc': _retry_fetch(_fetch_alc)},
+                   on_filled=_gap_filled)
+
+
+def _fetch_elastic(point, start, end):
+    """
+    Fetch an elastic point's window from ElasticSearch.
+    :param point: string
+    JSON query string without its start and end
+    :param start: datetime
+    Start of the window in UTC
+    :param end: datetime
+    End of the window in UTC
+    :return:
+    returned_dict : dictionary or int
+    Dictionary with Tree structure of {value -> [[DateTime,Data]*]}, or an error status code
+    """
+    window = dict(json.loads(point), start=start.strftime(ELASTIC_TIME_FORMAT), end=end.strftime(ELASTIC_TIME_FORMAT))
+    return ELASTIC_CLIENT.get_timeseries(data=json.dumps(window))
+
+
+def _fetch_alc(log, start, end):
+    """
+    Fetch an ALC trend log's window from the ALC server.
+    :param log: string
+    Path to the trend log on the ALC server
+    :param start: datetime
+    Start of the window in server local time
+    :param end: datetime
+    End of the window in server local time
+    :return:
+    holdingDict : dictionary or int
+    Dictionary with Tree structure of {value -> [[DateTime,Data]*]}, or an error status code
+    """
+    return ALC_CLIENT.collect_data(trend_log_paths=[log], start_time=start.strftime(ALC_TIME_FORMAT),
+                                   final_time=end.strftime(ALC_TIME_FORMAT))
+
+
+def _elastic_point(data):
+    """
+    Split an elastic query into its point and window.
+    :param data: string
+    JSON query string for the ElasticSearch endpoint
+    :return:
+    window : tuple or None
+    (point, start, end) with the point as a JSON string without start and end, or None if the
+    query has no valid window
+    """
+    try:
+        query = json.loads(data)
+        start = datetime.strptime(query.pop('start'), ELASTIC_TIME_FORMAT)
+        end = datetime.strptime(query.pop('end'), ELASTIC_TIME_FORMAT)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return None
+    return json.dumps(query, sort_keys=True), start, end
+
+
+def _call_upstream(route, window, function):
+    """
+    Call an upstream fetch for a route, queueing the window as a gap when the upstream fails without
+    a status for SkySpark and resolving queued gaps the window covers when it succeeds.
+    :param route: string
+    Route being served, elastic or alc
+    :param window: tuple
+    (point, start, end) of the requested window, or None if the request has no window
+    :param function: callable
+    Zero argument function returning the returned_dict or an error status code
+    :return:
+    returned_dict : dictionary or int
+    Dictionary with Tree structure of {value -> [[DateTime,Data]*]}, or an error status code. 503 is
+    returned when the upstream failed.
+    """
+    try:
+        ret = function()
+    except Exception as e:
+        print("\nError getting upstream data: ", str(e), "\n")
+        ret = None
+
+    if isinstance(ret, dict) and 'value' in ret:
+        if GAPS:
+            GAPS.report(route, True)
+            if window:
+                GAPS.resolve(route, *window)
+        return ret
+    if ret in UPSTREAM_STATUSES:
+        if GAPS:
+            GAPS.report(route, True)
+        return ret
+
+    if GAPS:
+        GAPS.report(route, False)
+        if window:
+            GAPS.record(route, *window)
+    return 503
+
+
+def _retry_fetch(fetch):
+    """
+    Wrap a fetch for the gap queue so a window the upstream answers with no data counts as filled.
+    """
+    def retry(point, start, end):
+        ret = fetch(point, start, end)
+        return {"value": []} if ret == 204 else ret
+    return retry
+
+
+def _gap_filled(gap, ret):
+    """
+    Cache the rows of a filled gap so pulling it again does not go upstream. Only gaps that touch a
+    point's cached coverage are cached, since a window apart from it would replace that coverage.
+    """
+    if not CACHE_ENABLED:
+        return
+    key = (gap['route'], gap['point'])
+    key_format, now = (ELASTIC_TIME_FORMAT, datetime.utcnow()) if gap['route'] == 'elastic' \
+        else (ALC_ROW_FORMAT, datetime.now())
+    start = datetime.strptime(gap['start'], GAP_TIME_FORMAT)
+    end = min(datetime.strptime(gap['end'], GAP_TIME_FORMAT), now - timedelta(seconds=CACHE_SETTLE))
+
+    coverage = CACHE.coverage(key)
+    if end <= start or (coverage is not None and (start > coverage[1] or end < coverage[0])):
+        return
+    last = end.strftime(key_format)
+    try:
+        CACHE.put(key, start, end, [row for row in ret['value'] if row[0][:19] <= last], key_format)
+    except ValueError as e:
+        print("\nError caching data: ", str(e), "\n")
+        return
+    if gap['route'] == 'alc' and WATERMARKS:
+        WATERMARKS.save(CACHE, gap['point'])
+
+
+def _elastic_window(data, since=None):
+    """
+    Serve an elastic query through the window cache.
+    :param data: string
+    JSON query string for the ElasticSearch endpoint
+    :param since: string
+    Optional UTC timestamp, only samples newer than it are returned
+    :return:
+    returned_dict : dictionary or int
+    Dictionary with Tree structure of {value -> [[DateTime,Data]*]}, or an error status code
+    """
+    window = _elastic_point(data)
+    if window is None:  # Not a windowed query, let ElasticSearch report the error
+        return ELASTIC_CLIENT.get_timeseries(data=data, since=since)
+    point, start, end = window
+    key = ('elastic', point)
+
+    def fetch(fetch_start, fetch_end):
+        return _fetch_elastic(point, fetch_start, fetch_end)
+
+    if since:
+        try:
+            since = parse_elastic_since(since)
+        except ValueError as e:  # Malformed since, not an upstream failure
+            print("\nError parsing since: ", str(e), "\n")
+            return 404
+
+    PREFETCHER.observe(key, start, end, fetch, ELASTIC_TIME_FORMAT)
+    PREFETCHER.load(key)
+    # ElasticSearch windows are in UTC
+    return CACHE.read_through(key, start, end, fetch, ELASTIC_TIME_FORMAT, since=since,
+                              now=datetime.utcnow(), settle=CACHE_SETTLE)
+
+
+def _alc_window(log, start_date, end_date, since=None):
+    """
+    Serve an ALC trend query through the window cache.
+    :param log: string
+    Path to the trend log on the ALC server
+    :param start_date: string
+    Start time in ALC format
+    :param end_date: string
+    End time in ALC format
+    :param since: string
+    Optional time in ALC format, only samples newer than it are returned
+    :return:
+    holdingDict : dictionary or int
+    Dictionary with Tree structure of {value -> [[DateTime,Data]*]}, or an error status code
+    """
+    start = datetime.strptime(start_date, ALC_TIME_FORMAT)
+    end = datetime.strptime(end_date, ALC_TIME_FORMAT)
+    key = ('alc', log)
+
+    def fetch(fetch_start, fetch_end):
+        return _fetch_alc(log, fetch_start, fetch_end)
+
+    if since:
+        try:
+            since = parse_alc_since(since)
+        except ValueError as e:  # Malformed since, not an upstream failure
+            print("\nError parsing since: ", str(e), "\n")
+            return 404
+
+    PREFETCHER.observe(key, start, end, fetch, ALC_ROW_FORMAT)
+    PREFETCHER.load(key)
+    # ALC windows are in server local time
+    ret = CACHE.read_through(key, start, end, fetch, ALC_ROW_FORMAT, since=since,
+                             now=datetime.now(), settle=CACHE_SETTLE)
+    if WATERMARKS:
+        WATERMARKS.save(CACHE, log)
+    return ret
+
+
+_init_clients()
 
 
 class MyServer(BaseHTTPRequestHandler):
@@ -48,91 +373,290 @@ class MyServer(BaseHTTPRequestHandler):
 
         """
 
-        if self.path.endswith("elastic"):
-            unquoted_path = urllib.parse.unquote_plus(self.path)
-            items = unquoted_path.split('?')  # Payload = 1
-            data = items[1]
-
-            ret = ELASTIC_CLIENT.get_timeseries(data=data)
-
-            # URI path not found
-            if ret == 404:
-                self.send_response(404)
-                self.end_headers()
-            # Incorrect query returned no results
-            if ret == 204:
-                self.send_response(204)
-                self.end_headers()
-            # Unauthorized with given credentials
-            elif ret == 401:
-                self.send_response(401)
-                self.end_headers()
-            # Write back JSON data
-            else:
-                payload = json.dumps(ret)
-                self.send_response(200)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(payload.encode('utf-8'))
-
-        elif self.path.endswith("alc"):
-            unquoted_path = urllib.parse.unquote_plus(self.path)
-            items = unquoted_path.split('?')  # Log = 1, start_date = 2, end = 3
-            data = [items[1]]  # Logs go in as a list
-            start_date = datetime.strptime(items[2], "%Y-%m-%d %I:%M:%S %p").strftime("%m/%d/%Y %I:%M:%S %p")
-
-            end_date = datetime.strptime(items[3], "%Y-%m-%d %I:%M:%S %p").strftime("%m/%d/%Y %I:%M:%S %p")
-
-            ret = ALC_CLIENT.collect_data(trend_log_paths=data, start_time=start_date, final_time=end_date)
-
-            # Incorrect query returned no results
-            if ret == 204:
-                self.send_response(204)
-                self.end_headers()
-            # Unauthorized with given credentials
-            elif ret == 401:
-                self.send_response(401)
-                self.end_headers()
-            # Trends for the specified point are not enabled on server side
-            elif ret == 501:
-                self.send_response(501)
-                self.end_headers()
-            # Write back JSON data
-            else:
-                payload = json.dumps(ret)
-                self.send_response(200)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(payload.encode('utf-8'))
-
-        elif self.path.endswith("calendar"):
-            unquoted_path = urllib.parse.unquote_plus(self.path)
-            items = unquoted_path.split('?')  # ID = 1, start_time = 2, end_time = 3
-            data = items[1]
-            start_time = items[2]
-            end_time = items[3]
-
-            ret = CALENDAR_CLIENT.get_events(start=start_time, end=end_time, calendar_id=data)
-
-            # Incorrect query returned no results
-            if ret == 204:
-                self.send_response(204)
-                self.end_headers()
-            # Unauthorized with given credentials
-            elif ret == 401:
-                self.send_response(401)
-                self.end_headers()
-            # Trends for the specified point are not enabled on server side
-            elif ret == 501:
-                self.send_response(501)
-                self.end_headers()
-            # Write back JSON data
-            else:
-                payload = json.dumps(ret)
-                self.send_response(200)
-                self.send_header("Content-type", "application/json")
-                self.end_headers()
-                self.wfile.write(payload.encode('utf-8'))
+        route = self._route()
+        if route is None:
+            return
+
+        handler = getattr(self, '_handle_' + route)
+        if route != 'profile' and PROFILER.should_profile(self.headers):
+            PROFILER.run(route, handler)
+        else:
+            handler()
+
+    def _route(self):
+        """Find the route named at the end of the request path
+        Returns
+        -------
+        route : str or None
+        Name of the route, or None if the path does not end with a known route.
+
+        """
+        for route in ROUTES:
+            if self.path.endswith(route):
+                return route
+        return None
+
+    def _handle_elastic(self):
+        """Handle the elastic route by querying ElasticSearch and writing back the time series."""
+        unquoted_path = urllib.parse.unquote_plus(self.path)
+        items = unquoted_path.split('?')  # Payload = 1, optional since = 2
+        data = items[1]
+        # Only return data newer than since when SkySpark supplies its hisEnd
+        since = items[2] if len(items) > 3 else None
+
+        if CACHE_ENABLED:
+            ret = _call_upstream('elastic', _elastic_point(data), lambda: _elastic_window(data, since=since))
+        else:
+            ret = _call_upstream('elastic', _elastic_point(data),
+                                 lambda: ELASTIC_CLIENT.get_timeseries(data=data, since=since))
+
+        # URI path not found
+        if ret == 404:
+            self.send_response(404)
+            self.end_headers()
+        # Upstream failed, the window is queued for retry
+        elif ret == 503:
+            self.send_response(503)
+            self.end_headers()
+        # Incorrect query returned no results
+        elif ret == 204:
+            self.send_response(204)
+            self.end_headers()
+        # Unauthorized with given credentials
+        elif ret == 401:
+            self.send_response(401)
+            self.end_headers()
+        # Write back JSON data
+        else:
+            payload = json.dumps(ret)
+            self.send_response(200)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(payload.encode('utf-8'))
+
+    def _handle_alc(self):
+        """Handle the alc route by querying the ALC server and writing back the trend data."""
+        unquoted_path = urllib.parse.unquote_plus(self.path)
+        items = unquoted_path.split('?')  # Log = 1, start_date = 2, end = 3, optional since = 4
+        data = [items[1]]  # Logs go in as a list
+        start_date = datetime.strptime(items[2], "%Y-%m-%d %I:%M:%S %p").strftime("%m/%d/%Y %I:%M:%S %p")
+
+        end_date = datetime.strptime(items[3], "%Y-%m-%d %I:%M:%S %p").strftime("%m/%d/%Y %I:%M:%S %p")
+
+        since = None
+        if len(items) > 5:
+            # Fractional seconds are kept so samples within the second after since are not dropped
+            try:
+                since = datetime.strptime(items[4], "%Y-%m-%d %I:%M:%S.%f %p")
+            except ValueError:
+                since = datetime.strptime(items[4], "%Y-%m-%d %I:%M:%S %p")
+            since = since.strftime(ALC_SINCE_FORMAT)
+
+        window = (items[1], datetime.strptime(start_date, ALC_TIME_FORMAT),
+                  datetime.strptime(end_date, ALC_TIME_FORMAT))
+        if window[2] - window[1] > timedelta(days=ALC_STREAM_DAYS):
+            self._stream_alc(window, start_date, end_date, since)
+            return
+
+        if CACHE_ENABLED:
+            ret = _call_upstream('alc', window, lambda: _alc_window(items[1], start_date, end_date, since=since))
+        else:
+            ret = _call_upstream('alc', window,
+                                 lambda: ALC_CLIENT.collect_data(trend_log_paths=data, start_time=start_date,
+                                                                 final_time=end_date, since=since))
+
+        # Upstream failed, the window is queued for retry
+        if ret == 503:
+            self.send_response(503)
+            self.end_headers()
+        # Incorrect query returned no results
+        elif ret == 204:
+            self.send_response(204)
+            self.end_headers()
+        # Unauthorized with given credentials
+        elif ret == 401:
+            self.send_response(401)
+            self.end_headers()
+        # Trends for the specified point are not enabled on server side
+        elif ret == 501:
+            self.send_response(501)
+            self.end_headers()
+        # Write back JSON data
+        else:
+            payload = json.dumps(ret)
+            self.send_response(200)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(payload.encode('utf-8'))
+
+    def _stream_alc(self, window, start_date, end_date, since=None):
+        """Write back a long ALC pull sub-window by sub-window instead of building it in memory."""
+        try:
+            chunks = ALC_CLIENT.stream_data(window[0], start_date, end_date, since=since)
+        except Exception as e:
+            print("\nError getting upstream data: ", str(e), "\n")
+            chunks = 503
+            if GAPS:
+                GAPS.report('alc', False)
+                GAPS.record('alc', *window)
+
+        # First sub-window failed with a status for SkySpark
+        if isinstance(chunks, int):
+            self.send_response(chunks)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        # A later sub-window failing leaves the JSON unterminated, so SkySpark sees the pull as failed
+        self.wfile.write(b'{"value": [')
+        separator = b''
+        try:
+            for rows in chunks:
+                if rows:
+                    self.wfile.write(separator + json.dumps(rows)[1:-1].encode('utf-8'))
+                    separator = b', '
+        except Exception as e:
+            print("\nError streaming ALC data: ", str(e), "\n")
+            if GAPS:
+                GAPS.report('alc', False)
+                GAPS.record('alc', *window)
+            return
+        self.wfile.write(b']}')
+        if GAPS:
+            GAPS.resolve('alc', *window)
+
+    def _handle_calendar(self):
+        """Handle the calendar route by querying Google Calendar and writing back room bookings."""
+        unquoted_path = urllib.parse.unquote_plus(self.path)
+        items = unquoted_path.split('?')  # ID = 1, start_time = 2, end_time = 3
+        data = items[1]
+        start_time = items[2]
+        end_time = items[3]
+
+        ret = CALENDAR_CLIENT.get_events(start=start_time, end=end_time, calendar_id=data)
+
+        # Incorrect query returned no results
+        if ret == 204:
+            self.send_response(204)
+            self.end_headers()
+        # Unauthorized with given credentials
+        elif ret == 401:
+            self.send_response(401)
+            self.end_headers()
+        # Trends for the specified point are not enabled on server side
+        elif ret == 501:
+            self.send_response(501)
+            self.end_headers()
+        # Write back JSON data
+        else:
+            payload = json.dumps(ret)
+            self.send_response(200)
+            self.send_header("Content-type", "application/json")
+            self.end_headers()
+            self.wfile.write(payload.encode('utf-8'))
+
+    def _handle_profile(self):
+        """Write back a summary of the hottest functions per profiled route, optionally for one route."""
+        unquoted_path = urllib.parse.unquote_plus(self.path)
+        items = unquoted_path.split('?')  # Optional route = 1
+        route = items[1] if len(items) > 2 and items[1] else None
+
+        # Only summarize routes the server actually serves
+        if route is not None and route not in ROUTES:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        payload = json.dumps(PROFILER.summary(route=route))
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(payload.encode('utf-8'))
+
+    def _handle_gaps(self):
+        """Write back the queued gaps, optionally only those with one status such as filled."""
+        unquoted_path = urllib.parse.unquote_plus(self.path)
+        items = unquoted_path.split('?')  # Optional status = 1
+        status = items[1] if len(items) > 2 and items[1] else None
+
+        payload = json.dumps({"gaps": GAPS.list(status=status) if GAPS else []})
+        self.send_response(200)
+        self.send_header("Content-type", "application/json")
+        self.end_headers()
+        self.wfile.write(payload.encode('utf-8'))
+
+
+def _spawn_worker(my_server, background=False):
+    """
+    Fork a worker process that serves requests from the shared listening socket.
+    :param my_server: HTTPServer
+    Server bound to the listening socket shared by all workers
+    :param background: bool
+    Whether the worker also runs the prefetcher and the gap retry thread
+    :return:
+    pid : int
+    Process ID of the new worker
+    """
+    pid = os.fork()
+    if pid:
+        return pid
+
+    # Worker process: build its own clients and serve until terminated
+    exit_code = 0
+    try:
+        _init_clients()
+        if background:
+            _start_background()
+        my_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print("\nWorker %d stopped: %s\n" % (os.getpid(), str(e)))
+        exit_code = 1
+    finally:
+        os._exit(exit_code)
+
+
+def _serve_prefork(my_server, num_workers):
+    """
+    Supervise pre-forked workers sharing the listening socket and restart any worker that exits
+    until keyboard termination. Only the first worker, and the worker that replaces it, runs the
+    prefetcher and the gap retry thread, so upstreams see each prefetch and retry once. The other
+    workers load the prefetched windows from PREFETCH_DIR.
+    :param my_server: HTTPServer
+    Server bound to the listening socket shared by all workers
+    :param num_workers: int
+    Number of worker processes to keep running
+    :return:
+    None
+    """
+    workers = {}
+    for slot in range(num_workers):
+        workers[_spawn_worker(my_server, background=slot == 0)] = (time.time(), slot)
+
+    try:
+        while True:
+            pid, status = os.wait()
+            worker = workers.pop(pid, None)
+            if worker is None:
+                continue
+            started, slot = worker
+            print(time.asctime(), "Worker %d exited with status %d, restarting" % (pid, status))
+            # Avoid a tight restart loop when a worker fails straight away
+            if time.time() - started < 1:
+                time.sleep(1)
+            workers[_spawn_worker(my_server, background=slot == 0)] = (time.time(), slot)
+    except KeyboardInterrupt:
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError:  # Worker already exited on the same interrupt
+                pass
+        print("Keyboard interrupt. Server terminated")
+        my_server.socket.close()
 
 
 def main():
@@ -146,6 +670,13 @@ def main():
     my_server = HTTPServer((hostName, hostPort), MyServer)
     print(time.asctime(), "Server Starts - %s:%s" % (hostName, hostPort))
 
+    # Pre-fork workers on the shared socket when configured and supported
+    if NUM_WORKERS > 1 and hasattr(os, 'fork'):
+        print(time.asctime(), "Starting %d worker processes" % NUM_WORKERS)
+        _serve_prefork(my_server, NUM_WORKERS)
+        return
+
+    _start_background()
     try:  # Run server forever or until keyboard termination.
         my_server.serve_forever()
     except KeyboardInterrupt:
@@ -154,4 +685,3 @@ def main():
 
 
 main()
-
@@ -0,0 +1,336 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Format of the window bounds stored in the shared directory
+PREFETCH_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+class prefetch_scheduler():
+
+    def __init__(self, cache, lead=600, period=None, interval=30, max_patterns=500, settle=0, directory=None,
+                 fetchers=None):
+        """
+        Learn the point/window pattern of incoming requests and fetch each point's next window into
+        the cache shortly before the next poll is expected.
+
+        Parameters
+        ----------
+        cache : series_cache
+        Cache that prefetched windows are written to.
+        lead : float, default = 600
+        Seconds before the expected poll that the next window is fetched. Each point uses a random
+        part of the lead so upstream load is spread out.
+        period : float, default = None
+        Seconds between polls of a point, for example 21600 for the 6 hour SkySpark sync. When None
+        the period and window step are learned from consecutive requests for the point.
+        interval : float, default = 30
+        Seconds between checks for due prefetches.
+        max_patterns : int, default = 500
+        Number of points whose request pattern is tracked.
+        settle : float, default = 0
+        Seconds at the end of a window that are left for the poll itself to fetch, so samples that
+        arrive late upstream are not missed by the cache.
+        directory : string, default = None
+        Directory shared by pre-forked workers. Every worker stores the requests it observes there, the
+        worker running the background thread learns from all of them, and each prefetched window is
+        stored there for every worker to load with load(). When None, patterns and windows stay in
+        this process.
+        fetchers : dictionary, default = None
+        Functions taking (point, start, end) that fetch a window, by route. Used to prefetch points
+        observed by other workers, required with directory.
+
+        """
+        self.cache = cache
+        self.lead = lead
+        self.period = period
+        self.interval = interval
+        self.max_patterns = max_patterns
+        self.settle = settle
+        self.directory = directory
+        self.fetchers = fetchers or {}
+        self._patterns = {}
+        self._loaded = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        return
+
+    ##################################################################################################
+    # End __init__()
+    ##################################################################################################
+
+    def observe(self, key, start, end, fetch, key_format):
+        """
+        Record a request for a point's window.
+
+        Parameters
+        ----------
+        key : tuple
+        Cache key of the point, (route, point).
+        start : datetime
+        Start of the requested window.
+        end : datetime
+        End of the requested window.
+        fetch : callable
+        Function taking (start, end) datetimes that returns the returned_dict for a window, or an
+        error status code.
+        key_format : string
+        strftime format passed to the cache for the point's rows.
+
+        """
+        now = time.time()
+        self._record(key, start, end, fetch, key_format, now)
+        if self.directory:
+            self._write(key, '.observed.json', {'key': list(key), 'seen': now, 'format': key_format,
+                                                'start': start.strftime(PREFETCH_TIME_FORMAT),
+                                                'end': end.strftime(PREFETCH_TIME_FORMAT)})
+
+    ##################################################################################################
+    # End observe()
+    ##################################################################################################
+
+    def _record(self, key, start, end, fetch, key_format, seen):
+        """
+        Update a point's request pattern with a request seen at time seen.
+        """
+        with self._lock:
+            previous = self._patterns.get(key)
+            # Each point gets its own share of the lead time so prefetches are spread out
+            pattern = {'seen': seen, 'start': start, 'end': end, 'fetch': fetch, 'format': key_format,
+                       'period': self.period, 'step': None, 'done': False,
+                       'lead': random.uniform(0.5, 1.0) * self.lead}
+
+            if self.period is not None:
+                pattern['step'] = timedelta(seconds=self.period)
+            elif previous is not None and start != previous['start']:
+                pattern['period'] = seen - previous['seen']
+                pattern['step'] = start - previous['start']
+
+            if previous is None and len(self._patterns) >= self.max_patterns:
+                oldest = min(self._patterns, key=lambda k: self._patterns[k]['seen'])
+                del self._patterns[oldest]
+            self._patterns[key] = pattern
+
+    ##################################################################################################
+    # End _record()
+    ##################################################################################################
+
+    def _file_name(self, key, suffix):
+        """
+        Return a shared file of a point, named by the sha1 of the route and point.
+        """
+        digest = hashlib.sha1('|'.join(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + suffix)
+
+    ##################################################################################################
+    # End _file_name()
+    ##################################################################################################
+
+    def _write(self, key, suffix, stored):
+        """
+        Store a shared file, writing to a temporary file first so a worker never reads a half written one.
+
+        Returns
+        -------
+        mtime : float or None
+        Modification time of the stored file, or None if it could not be written.
+
+        """
+        file_name = self._file_name(key, suffix)
+        temp_name = "%s.%d.tmp" % (file_name, os.getpid())
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temp_name, 'w') as file_shared:
+                json.dump(stored, file_shared)
+            os.replace(temp_name, file_name)
+            return os.stat(file_name).st_mtime
+        except OSError as e:
+            print("\nError writing prefetch file: ", str(e), "\n")
+            return None
+
+    ##################################################################################################
+    # End _write()
+    ##################################################################################################
+
+    def _read_observed(self):
+        """
+        Record the requests that other workers stored in the shared directory since the last check.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except OSError:  # Nothing observed yet
+            return
+
+        for name in names:
+            if not name.endswith('.observed.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r') as file_observed:
+                    observed = json.load(file_observed)
+                key = tuple(observed['key'])
+                start = datetime.strptime(observed['start'], PREFETCH_TIME_FORMAT)
+                end = datetime.strptime(observed['end'], PREFETCH_TIME_FORMAT)
+                fetcher = self.fetchers[key[0]]
+            except (OSError, ValueError, KeyError):  # Being replaced, unreadable or of an unknown route
+                continue
+
+            with self._lock:
+                previous = self._patterns.get(key)
+            if previous is not None and previous['seen'] >= observed['seen']:
+                continue
+
+            def fetch(fetch_start, fetch_end, fetcher=fetcher, point=key[1]):
+                return fetcher(point, fetch_start, fetch_end)
+
+            self._record(key, start, end, fetch, observed['format'], observed['seen'])
+
+    ##################################################################################################
+    # End _read_observed()
+    ##################################################################################################
+
+    def load(self, key):
+        """
+        Load the window of a point that the prefetcher stored in the shared directory, if it is newer
+        than what this worker has cached. Costs one stat when nothing new was prefetched.
+
+        Parameters
+        ----------
+        key : tuple
+        Cache key of the point, (route, point).
+
+        """
+        if not self.directory:
+            return
+        file_name = self._file_name(key, '.window.json')
+        try:
+            mtime = os.stat(file_name).st_mtime
+        except OSError:  # Nothing prefetched for the point
+            return
+        with self._lock:
+            if self._loaded.get(key) == mtime:
+                return
+            self._loaded[key] = mtime
+
+        try:
+            with open(file_name, 'r') as file_window:
+                window = json.load(file_window)
+            start = datetime.strptime(window['start'], PREFETCH_TIME_FORMAT)
+            end = datetime.strptime(window['end'], PREFETCH_TIME_FORMAT)
+        except (OSError, ValueError, KeyError) as e:
+            print("\nError loading prefetched window: ", str(e), "\n")
+            return
+
+        # Never replace newer coverage with an older window
+        coverage = self.cache.coverage(key)
+        if coverage is not None and end <= coverage[1]:
+            return
+        try:
+            self.cache.put(key, start, end, window['rows'], window['format'])
+        except ValueError as e:
+            print("\nError caching data: ", str(e), "\n")
+
+    ##################################################################################################
+    # End load()
+    ##################################################################################################
+
+    def start(self):
+        """
+        Start the background thread that runs due prefetches.
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='prefetch_scheduler', daemon=True)
+        self._thread.start()
+
+    ##################################################################################################
+    # End start()
+    ##################################################################################################
+
+    def _run(self):
+        """
+        Check for due prefetches until the process exits.
+        """
+        while True:
+            time.sleep(self.interval)
+            if self.directory:
+                self._read_observed()
+            for key, pattern in self._due():
+                self._prefetch(key, pattern)
+
+    ##################################################################################################
+    # End _run()
+    ##################################################################################################
+
+    def _due(self):
+        """
+        Find the points whose next poll is within their lead time and mark them as prefetched.
+
+        Returns
+        -------
+        due : list
+        List of (key, pattern) pairs to prefetch.
+
+        """
+        now = time.time()
+        due = []
+        with self._lock:
+            for key, pattern in self._patterns.items():
+                if pattern['done'] or pattern['step'] is None:
+                    continue
+                if pattern['seen'] + pattern['period'] - pattern['lead'] <= now:
+                    pattern['done'] = True
+                    due.append((key, pattern))
+        return due
+
+    ##################################################################################################
+    # End _due()
+    ##################################################################################################
+
+    def _prefetch(self, key, pattern):
+        """
+        Fetch the expected next window of a point into the cache. Only data that already exists is
+        fetched, the rest of the window is fetched when the poll arrives.
+
+        Parameters
+        ----------
+        key : tuple
+        Cache key of the point, (route, point).
+        pattern : dictionary
+        Learned request pattern of the point.
+
+        """
+        start = pattern['start'] + pattern['step']
+        end = pattern['end'] + pattern['step']
+        # Window bounds are naive and in the point's own timezone, so cap the window at the last
+        # poll's end moved forward by the time elapsed since that poll, less the settle time
+        elapsed = time.time() - pattern['seen'] - self.settle
+        end = min(end, pattern['end'] + timedelta(seconds=elapsed))
+        if end <= start:
+            return
+
+        try:
+            ret = pattern['fetch'](start, end)
+        except Exception as e:
+            print("\nError prefetching data: ", str(e), "\n")
+            return
+
+        if isinstance(ret, dict) and 'value' in ret:
+            try:
+                self.cache.put(key, start, end, ret['value'], pattern['format'])
+            except ValueError as e:  # Rows the compressed blocks cannot hold are fetched by the poll
+                print("\nError caching data: ", str(e), "\n")
+                return
+            if self.directory:
+                mtime = self._write(key, '.window.json', {'start': start.strftime(PREFETCH_TIME_FORMAT),
+                                                          'end': end.strftime(PREFETCH_TIME_FORMAT),
+                                                          'format': pattern['format'], 'rows': ret['value']})
+                with self._lock:
+                    self._loaded[key] = mtime
+
+##################################################################################################
+# End _prefetch()
+##################################################################################################
@@ -0,0 +1,188 @@
+import cProfile
+import os
+import pstats
+import random
+import threading
+import time
+
+
+class route_profiler():
+
+    def __init__(self, directory='profiles', sample_rate=0.0, keep=20, header='X-Profile'):
+        """
+        Parameters
+        ----------
+        directory : string, default = 'profiles'
+        Directory that per route profile stats are written under.
+        sample_rate : float, default = 0.0
+        Fraction of requests to profile without the admin header.
+        keep : int, default = 20
+        Number of stats files kept per route. Older files are removed.
+        header : string, default = 'X-Profile'
+        Request header that forces profiling of a single request when set to 1 or true.
+
+        """
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.header = header
+        self._count = 0
+        self._lock = threading.Lock()
+        return
+
+    ##################################################################################################
+    # End __init__()
+    ##################################################################################################
+
+    def should_profile(self, headers):
+        """
+        Decide whether the current request is profiled.
+
+        Parameters
+        ----------
+        headers : http.client.HTTPMessage
+        Headers of the incoming request.
+
+        Returns
+        -------
+        bool
+        True if the admin header is set or the request is sampled.
+
+        """
+        if str(headers.get(self.header, '')).lower() in ('1', 'true'):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    ##################################################################################################
+    # End should_profile()
+    ##################################################################################################
+
+    def run(self, route, function):
+        """
+        Run a route handler under cProfile and write the stats for the route.
+
+        Parameters
+        ----------
+        route : string
+        Name of the route being handled, used as the stats sub directory.
+        function : callable
+        Zero argument route handler.
+
+        Returns
+        -------
+        result : object
+        Return value of the route handler.
+
+        """
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return function()
+        finally:
+            profile.disable()
+            self._write(route, profile)
+
+    ##################################################################################################
+    # End run()
+    ##################################################################################################
+
+    def _write(self, route, profile):
+        """
+        Write profile stats to the route directory and remove the oldest files past the keep limit.
+
+        Parameters
+        ----------
+        route : string
+        Name of the profiled route.
+        profile : cProfile.Profile
+        Finished profile of the route handler.
+
+        """
+        route_dir = os.path.join(self.directory, route)
+        os.makedirs(route_dir, exist_ok=True)
+
+        with self._lock:
+            self._count += 1
+            count = self._count
+        file_name = "%s-%d-%d.prof" % (time.strftime("%Y%m%d-%H%M%S"), os.getpid(), count)
+        profile.dump_stats(os.path.join(route_dir, file_name))
+
+        stats_files = self._stats_files(route)
+        for old_file in stats_files[:-self.keep]:
+            try:
+                os.remove(old_file)
+            except OSError:  # Already rotated out by another process
+                pass
+
+    ##################################################################################################
+    # End _write()
+    ##################################################################################################
+
+    def _stats_files(self, route):
+        """
+        List the stats files of a route from oldest to newest.
+
+        Parameters
+        ----------
+        route : string
+        Name of the profiled route.
+
+        Returns
+        -------
+        stats_files : list of str
+        Paths of the route's stats files.
+
+        """
+        route_dir = os.path.join(self.directory, route)
+        if not os.path.isdir(route_dir):
+            return []
+        stats_files = [os.path.join(route_dir, name) for name in os.listdir(route_dir) if name.endswith('.prof')]
+        return sorted(stats_files, key=os.path.getmtime)
+
+    ##################################################################################################
+    # End _stats_files()
+    ##################################################################################################
+
+    def summary(self, route=None, limit=20):
+        """
+        Summarize the hottest functions of each profiled route over its kept stats files.
+
+        Parameters
+        ----------
+        route : string, default = None
+        Only summarize this route. All profiled routes are summarized when None.
+        limit : int, default = 20
+        Number of functions listed per route.
+
+        Returns
+        -------
+        returned_dict : dictionary
+        Dictionary with Tree structure of {route -> {requests, functions -> [{function, calls, tottime, cumtime}*]}}
+        with functions sorted by own time.
+
+        """
+        returned_dict = {}
+        if route:
+            routes = [route]
+        elif os.path.isdir(self.directory):
+            routes = sorted(os.listdir(self.directory))
+        else:
+            routes = []
+
+        for name in routes:
+            stats_files = self._stats_files(name)
+            if not stats_files:
+                continue
+            stats = pstats.Stats(*stats_files)
+            rows = []
+            for (file_name, line, function), (cc, nc, tottime, cumtime, callers) in stats.stats.items():
+                rows.append({"function": "%s:%d(%s)" % (file_name, line, function), "calls": nc,
+                             "tottime": round(tottime, 6), "cumtime": round(cumtime, 6)})
+            rows.sort(key=lambda row: row["tottime"], reverse=True)
+            returned_dict[name] = {"requests": len(stats_files), "functions": rows[:limit]}
+
+        return returned_dict
+
+##################################################################################################
+# End summary()
+##################################################################################################
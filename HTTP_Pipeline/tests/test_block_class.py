@@ -0,0 +1,72 @@
+"""Tests of the compressed time-series blocks in block_class"""
+import math
+import random
+
+import pytest
+
+from block_class import compressed_series, decode_block, encode_block
+from time_utils import datetime_micros, to_datetime, to_micros
+
+
+def test_block_round_trip():
+    rng = random.Random(0)
+    micros = [1500000000000000]
+    for _ in range(999):
+        # Regular steps with jitter and the odd long gap exercise every delta-of-delta bucket
+        micros.append(micros[-1] + rng.choice([900000000, 900000000, 900000017, 3600000000, 86400000000 * 40]))
+    values = [rng.choice([None, 0.0, -1.5, 1e300, 5e-324, math.inf, -math.inf, rng.uniform(-1e6, 1e6)])
+              for _ in micros]
+    values[1:20] = [42.25] * 19
+
+    decoded_micros, decoded_values = decode_block(encode_block(micros, values), len(micros))
+    assert decoded_micros == micros
+    assert decoded_values == values
+
+
+def test_block_round_trip_nan_bits():
+    decoded = decode_block(encode_block([0, 1], [math.nan, 1.0]), 2)[1]
+    assert math.isnan(decoded[0]) and decoded[1] == 1.0
+
+
+def test_series_rows_and_ranges():
+    series = compressed_series(block_size=4)
+    rows = [["2019-03-06T20:%02d:00.125Z" % minute, minute if minute % 3 else float(minute)] for minute in range(10)]
+    series.extend(rows)
+    assert len(series) == 10
+    assert series.rows() == rows
+    assert [type(value) for _, value in series.rows()] == [type(value) for _, value in rows]
+
+    start = to_micros("2019-03-06T20:03:00.125Z")
+    end = to_micros("2019-03-06T20:07:00")
+    assert series.rows(start, end) == rows[3:7]
+    assert series.first == to_micros(rows[0][0]) and series.last == to_micros(rows[-1][0])
+
+
+def test_series_drop_blocks():
+    series = compressed_series(block_size=4)
+    series.extend([["2019-03-06 20:%02d:00" % minute, 1.0] for minute in range(10)])
+    series.drop_blocks(6)
+    assert len(series) == 6
+    assert series.rows()[0][0] == "2019-03-06 20:04:00"
+    # Only whole blocks are dropped, the uncompressed tail is kept
+    series.drop_blocks(1)
+    assert len(series) == 2
+
+
+@pytest.mark.parametrize("rows", [
+    [["2019-03-06 20:00:00", 1.0], ["2019-03-06 20:00:00", 2.0]],           # Not newer
+    [["2019-03-06 20:00:00", 1.0], ["2019-03-06T20:01:00", 2.0]],           # Other layout
+    [["2019-03-06 20:00:00", "1.0"]],                                       # Not a number
+    [["2019-03-06 20:00:00", True]],
+    [["2019-03-06 20:00:00", 2 ** 60]],                                     # Int past a float
+    [["2019-03-06 20:00:00.1234567", 1.0]],                                 # Finer than a microsecond
+])
+def test_series_rejects_rows(rows):
+    with pytest.raises(ValueError):
+        compressed_series().extend(rows)
+
+
+def test_time_utils_round_trip():
+    micros = to_micros("2019-03-06T20:00:01.250Z")
+    assert to_datetime(micros).isoformat() == "2019-03-06T20:00:01.250000"
+    assert datetime_micros(to_datetime(micros)) == micros
@@ -0,0 +1,72 @@
+"""Tests of the window cache series_cache"""
+from datetime import datetime, timedelta
+
+from cache_class import series_cache
+
+FORMAT = "%Y-%m-%dT%H:%M:%S"
+KEY = ('elastic', 'query')
+START = datetime(2019, 3, 6, 20)
+
+
+def rows_between(start, end, step=timedelta(minutes=15)):
+    rows = []
+    while start <= end:
+        rows.append([start.strftime(FORMAT) + ".000Z", float(start.minute)])
+        start += step
+    return rows
+
+
+class upstream():
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, start, end):
+        self.calls.append((start, end))
+        return {"value": rows_between(start, end)}
+
+
+def test_read_through_fetches_only_the_uncovered_part():
+    cache = series_cache()
+    fetch = upstream()
+    first = cache.read_through(KEY, START, START + timedelta(hours=1), fetch, FORMAT)
+    second = cache.read_through(KEY, START, START + timedelta(hours=2), fetch, FORMAT)
+    assert first == {"value": rows_between(START, START + timedelta(hours=1))}
+    assert second == {"value": rows_between(START, START + timedelta(hours=2))}
+    assert fetch.calls == [(START, START + timedelta(hours=1)), (START + timedelta(hours=1), START + timedelta(hours=2))]
+
+    cache.read_through(KEY, START + timedelta(minutes=30), START + timedelta(hours=2), fetch, FORMAT)
+    assert len(fetch.calls) == 2
+
+
+def test_settle_keeps_the_newest_samples_uncached():
+    cache = series_cache()
+    fetch = upstream()
+    end = START + timedelta(hours=1)
+    cache.read_through(KEY, START, end, fetch, FORMAT, now=end, settle=1800)
+    assert cache.coverage(KEY) == (START, START + timedelta(minutes=30))
+    cache.read_through(KEY, START, end, fetch, FORMAT, now=end, settle=1800)
+    assert fetch.calls[-1] == (START + timedelta(minutes=30), end)
+
+
+def test_since_filters_to_the_microsecond():
+    cache = series_cache()
+    rows = [["2019-03-06T20:00:01.100Z", 1], ["2019-03-06T20:00:01.300Z", 2], ["2019-03-06T20:00:02.000Z", 3]]
+    ret = cache.read_through(KEY, START, START + timedelta(hours=1), lambda start, end: {"value": rows}, FORMAT,
+                             since=datetime(2019, 3, 6, 20, 0, 1, 250000))
+    assert ret == {"value": rows[1:]}
+
+
+def test_error_status_is_passed_on_and_not_cached():
+    cache = series_cache()
+    assert cache.read_through(KEY, START, START + timedelta(hours=1), lambda start, end: 503, FORMAT) == 503
+    assert cache.coverage(KEY) is None
+
+
+def test_disjoint_window_replaces_the_cached_one():
+    cache = series_cache()
+    cache.put(KEY, START, START + timedelta(hours=1), rows_between(START, START + timedelta(hours=1)), FORMAT)
+    later = START + timedelta(days=1)
+    cache.put(KEY, later, later + timedelta(hours=1), rows_between(later, later + timedelta(hours=1)), FORMAT)
+    assert cache.coverage(KEY) == (later, later + timedelta(hours=1))
+    assert cache.get(KEY, later, later + timedelta(hours=1)) == rows_between(later, later + timedelta(hours=1))
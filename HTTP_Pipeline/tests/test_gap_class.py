@@ -0,0 +1,89 @@
+"""Tests of the persistent retry queue gap_class"""
+import os
+import time
+from datetime import datetime
+
+from gap_class import CLAIMED_SUFFIX, gap_queue
+
+START = datetime(2019, 3, 6, 20)
+END = datetime(2019, 3, 6, 21)
+
+
+def test_record_once(tmp_path):
+    gaps = gap_queue(directory=str(tmp_path), base_delay=60)
+    gaps.record('alc', '#log', START, END)
+    gaps.record('alc', '#log', START, END)
+    queued = gaps.list()
+    assert len(queued) == 1
+    assert queued[0]['status'] == 'pending' and queued[0]['attempts'] == 0
+    assert queued[0]['start'] == '2019-03-06T20:00:00'
+    assert queued[0]['next_try'] > time.time() + 50
+
+
+def test_backoff_doubles_up_to_max(tmp_path):
+    gaps = gap_queue(directory=str(tmp_path), base_delay=60, max_delay=200)
+    gaps.record('alc', '#log', START, END)
+    delays = []
+    for _ in range(3):
+        before = time.time()
+        gaps._retry(gaps.list()[0], lambda point, start, end: 503, None)
+        delays.append(round(gaps.list()[0]['next_try'] - before))
+    assert delays == [120, 200, 200]
+    assert gaps.list()[0]['attempts'] == 3
+    assert gaps._health['alc'] is False
+
+
+def test_filled_gap(tmp_path):
+    gaps = gap_queue(directory=str(tmp_path))
+    gaps.record('elastic', 'query', START, END)
+    filled = []
+    gaps._retry(gaps.list()[0], lambda point, start, end: {'value': [[point, 1.0]]},
+                lambda gap, ret: filled.append((gap['point'], ret)))
+    assert gaps.list(status='filled')[0]['filled_at'] is not None
+    assert gaps.list(status='pending') == []
+    assert filled == [('query', {'value': [['query', 1.0]]})]
+
+
+def test_claim_by_rename(tmp_path):
+    first = gap_queue(directory=str(tmp_path))
+    second = gap_queue(directory=str(tmp_path))
+    first.record('alc', '#log', START, END)
+    gap = first.list()[0]
+    calls = []
+
+    def fetch(point, start, end):
+        # While the first worker's retry runs, the second cannot claim the same gap
+        second._retry(gap, lambda *args: calls.append('second'), None)
+        calls.append('first')
+        return {'value': []}
+
+    first._retry(gap, fetch, None)
+    assert calls == ['first']
+    assert first.list()[0]['status'] == 'filled'
+
+
+def test_resolve_drops_claimed_retry(tmp_path):
+    gaps = gap_queue(directory=str(tmp_path))
+    gaps.record('alc', '#log', START, END)
+    gaps.record('alc', '#log', END, datetime(2019, 3, 6, 22))
+
+    def fetch(point, start, end):
+        gaps.resolve('alc', '#log', START, END)
+        return {'value': []}
+
+    gaps._retry(gaps.list()[0], fetch, None)
+    remaining = gaps.list()
+    assert [gap['start'] for gap in remaining] == ['2019-03-06T21:00:00']
+
+
+def test_stale_claim_is_released(tmp_path):
+    gaps = gap_queue(directory=str(tmp_path), claim_timeout=10)
+    gaps.record('alc', '#log', START, END)
+    gap = gaps.list()[0]
+    claimed = gaps._file_name(gap, CLAIMED_SUFFIX)
+    os.rename(gaps._file_name(gap), claimed)
+    gaps._release_stale(claimed)
+    assert os.path.exists(claimed)
+    os.utime(claimed, (time.time() - 60, time.time() - 60))
+    gaps._release_stale(claimed)
+    assert os.path.exists(gaps._file_name(gap)) and not os.path.exists(claimed)
@@ -0,0 +1,70 @@
+"""Tests of the predictive prefetcher prefetch_scheduler"""
+from datetime import datetime, timedelta
+
+from cache_class import series_cache
+from prefetch_class import prefetch_scheduler
+
+FORMAT = "%Y-%m-%dT%H:%M:%S"
+KEY = ('elastic', 'query')
+START = datetime(2019, 3, 6, 20)
+HOUR = timedelta(hours=1)
+
+
+def fetch_point(point, start, end):
+    rows = []
+    while start <= end:
+        rows.append([start.strftime(FORMAT) + ".000Z", 1.0])
+        start += timedelta(minutes=15)
+    return {"value": rows}
+
+
+def make_due(scheduler):
+    # Move the last poll far enough back that the next one is within its lead time
+    for pattern in scheduler._patterns.values():
+        pattern['seen'] -= 10 ** 6
+
+
+def test_learns_the_step_and_prefetches_the_next_window():
+    cache = series_cache()
+    scheduler = prefetch_scheduler(cache)
+    fetch = lambda start, end: fetch_point('query', start, end)
+    scheduler.observe(KEY, START, START + HOUR, fetch, FORMAT)
+    scheduler.observe(KEY, START + HOUR, START + 2 * HOUR, fetch, FORMAT)
+    assert scheduler._patterns[KEY]['step'] == HOUR
+
+    make_due(scheduler)
+    for key, pattern in scheduler._due():
+        scheduler._prefetch(key, pattern)
+    assert cache.coverage(KEY) == (START + 2 * HOUR, START + 3 * HOUR)
+    assert scheduler._due() == []
+
+
+def test_workers_share_observations_and_windows(tmp_path):
+    fetchers = {'elastic': fetch_point}
+    first = prefetch_scheduler(series_cache(), directory=str(tmp_path), fetchers=fetchers)
+    other = prefetch_scheduler(series_cache(), directory=str(tmp_path), fetchers=fetchers)
+
+    # Polls served by another worker teach the first worker's prefetcher
+    other.observe(KEY, START, START + HOUR, None, FORMAT)
+    first._read_observed()
+    other.observe(KEY, START + HOUR, START + 2 * HOUR, None, FORMAT)
+    first._read_observed()
+    assert first._patterns[KEY]['step'] == HOUR
+
+    make_due(first)
+    for key, pattern in first._due():
+        first._prefetch(key, pattern)
+    assert other.cache.coverage(KEY) is None
+    other.load(KEY)
+    assert other.cache.coverage(KEY) == (START + 2 * HOUR, START + 3 * HOUR)
+
+
+def test_load_keeps_newer_coverage(tmp_path):
+    first = prefetch_scheduler(series_cache(), directory=str(tmp_path), fetchers={'elastic': fetch_point})
+    other = prefetch_scheduler(series_cache(), directory=str(tmp_path), fetchers={'elastic': fetch_point})
+    first._prefetch(KEY, {'start': START - HOUR, 'end': START, 'step': HOUR, 'seen': 0,
+                          'fetch': lambda start, end: fetch_point('query', start, end), 'format': FORMAT})
+    later = START + 5 * HOUR
+    other.cache.put(KEY, later, later + HOUR, fetch_point('query', later, later + HOUR)['value'], FORMAT)
+    other.load(KEY)
+    assert other.cache.coverage(KEY) == (later, later + HOUR)
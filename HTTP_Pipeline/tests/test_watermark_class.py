@@ -0,0 +1,52 @@
+"""Tests of the ALC watermark store watermark_class"""
+from datetime import datetime, timedelta
+
+from cache_class import series_cache
+from watermark_class import watermark_store
+
+FORMAT = "%Y-%m-%d %H:%M:%S"
+LOG = '#lbnl_59-bl-024/fan_spd'
+START = datetime(2019, 3, 6)
+
+
+def rows_between(start, end):
+    rows = []
+    while start <= end:
+        rows.append([start.strftime(FORMAT), 1.0])
+        start += timedelta(hours=1)
+    return rows
+
+
+def cache_with(end):
+    cache = series_cache()
+    cache.put(('alc', LOG), START, end, rows_between(START, end), FORMAT)
+    return cache
+
+
+def test_save_and_load_tail(tmp_path):
+    end = START + timedelta(days=3)
+    store = watermark_store(directory=str(tmp_path), tail_hours=24)
+    store.save(cache_with(end), LOG)
+
+    cache = series_cache()
+    watermark_store(directory=str(tmp_path), tail_hours=24).load(cache)
+    assert cache.coverage(('alc', LOG)) == (end - timedelta(hours=24), end)
+    assert cache.get(('alc', LOG), end - timedelta(hours=24), end) == rows_between(end - timedelta(hours=24), end)
+
+
+def test_newer_watermark_is_not_replaced(tmp_path):
+    newer = watermark_store(directory=str(tmp_path))
+    newer.save(cache_with(START + timedelta(days=2)), LOG)
+    older = watermark_store(directory=str(tmp_path))
+    older.save(cache_with(START + timedelta(days=1)), LOG)
+
+    cache = series_cache()
+    watermark_store(directory=str(tmp_path)).load(cache)
+    assert cache.coverage(('alc', LOG))[1] == START + timedelta(days=2)
+
+
+def test_unreadable_file_is_skipped(tmp_path):
+    (tmp_path / 'broken.json').write_text('{"log": "x"')
+    cache = series_cache()
+    watermark_store(directory=str(tmp_path)).load(cache)
+    assert cache.coverage(('alc', 'x')) is None
@@ -0,0 +1,66 @@
+from datetime import date, datetime, timedelta
+
+# Day number of 1970-01-01, days since the epoch are counted from it
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def to_micros(text):
+    """
+    Convert an ISO like timestamp string to microseconds since the epoch using fixed offsets.
+
+    Parameters
+    ----------
+    text : string
+    Timestamp in ``YYYY-MM-DD hh:mm:ss`` or ``YYYY-MM-DDThh:mm:ss.ffffff`` form.
+
+    Returns
+    -------
+    micros : int
+    Microseconds since 1970-01-01 00:00:00 in the timestamp's own timezone.
+
+    """
+    days = date(int(text[0:4]), int(text[5:7]), int(text[8:10])).toordinal() - EPOCH_ORDINAL
+    seconds = ((days * 24 + int(text[11:13])) * 60 + int(text[14:16])) * 60 + int(text[17:19])
+    return seconds * 1000000 + fraction_micros(text)
+
+
+def fraction_micros(text):
+    """
+    Return the fractional seconds of an ISO like timestamp string in microseconds, 0 when it has none.
+    Digits past the microsecond are dropped.
+    """
+    if text[19:20] != '.':
+        return 0
+    end = 20
+    while end < len(text) and text[end].isdigit():
+        end += 1
+    return int((text[20:end] + '000000')[:6])
+
+
+def timestamp_key(text):
+    """
+    Return a key of an ISO like timestamp string that orders timestamps of the same layout to the
+    microsecond without parsing them: its ``YYYY-MM-DD hh:mm:ss`` part and its fraction in microseconds.
+    """
+    return text[:19], fraction_micros(text)
+
+
+def moment_key(moment, key_format):
+    """
+    Return the timestamp_key of a datetime rendered with key_format.
+    """
+    return moment.strftime(key_format), moment.microsecond
+
+
+def datetime_micros(moment):
+    """
+    Convert a naive datetime to microseconds since the epoch.
+    """
+    return (moment - datetime(1970, 1, 1)) // timedelta(microseconds=1)
+
+
+def to_datetime(micros):
+    """
+    Convert microseconds since the epoch back to a naive datetime.
+    """
+    return datetime(1970, 1, 1) + timedelta(microseconds=micros)
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+
+
+class watermark_store():
+
+    def __init__(self, directory='alc_watermarks', tail_hours=48, time_format="%Y-%m-%d %H:%M:%S"):
+        """
+        Persist, for each trend log, the watermark up to which the ALC server has been fetched plus a
+        short tail of the newest samples. After a restart the tails are loaded back into the cache so
+        a request only has to fetch samples newer than the watermark.
+
+        Parameters
+        ----------
+        directory : string, default = 'alc_watermarks'
+        Directory holding one JSON file per trend log.
+        tail_hours : float, default = 48
+        Hours of samples before the watermark kept in the tail.
+        time_format : string, default = "%Y-%m-%d %H:%M:%S"
+        strftime format of the stored watermark, tail start and sample timestamps.
+
+        """
+        self.directory = directory
+        self.tail = timedelta(hours=tail_hours)
+        self.time_format = time_format
+        self._saved = {}
+        return
+
+    ##################################################################################################
+    # End __init__()
+    ##################################################################################################
+
+    def _file_name(self, log):
+        """
+        Return the file holding a trend log's watermark. Trend log paths are hashed since they
+        contain characters that are not valid in file names.
+        """
+        digest = hashlib.sha1(log.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.json')
+
+    ##################################################################################################
+    # End _file_name()
+    ##################################################################################################
+
+    def load(self, cache, route='alc'):
+        """
+        Load every stored tail into the cache.
+
+        Parameters
+        ----------
+        cache : series_cache
+        Cache the tails are loaded into, keyed by (route, log).
+        route : string, default = 'alc'
+        Route name used in the cache keys.
+
+        """
+        if not os.path.isdir(self.directory):
+            return
+
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r') as file_watermark:
+                    stored = json.load(file_watermark)
+                start = datetime.strptime(stored['start'], self.time_format)
+                watermark = datetime.strptime(stored['watermark'], self.time_format)
+                cache.put((route, stored['log']), start, watermark, stored['tail'], self.time_format)
+                self._saved[stored['log']] = watermark
+            except (ValueError, KeyError) as e:  # Skip unreadable files, the trend is fetched in full
+                print("\nError loading watermark: ", name, str(e), "\n")
+
+    ##################################################################################################
+    # End load()
+    ##################################################################################################
+
+    def _stored_watermark(self, file_name):
+        """
+        Return the watermark stored in a file, or None if it has none or cannot be read.
+        """
+        try:
+            with open(file_name, 'r') as file_watermark:
+                return datetime.strptime(json.load(file_watermark)['watermark'], self.time_format)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    ##################################################################################################
+    # End _stored_watermark()
+    ##################################################################################################
+
+    def save(self, cache, log, route='alc'):
+        """
+        Store a trend log's watermark and tail if its watermark moved since it was last stored.
+
+        Parameters
+        ----------
+        cache : series_cache
+        Cache holding the trend log's samples.
+        log : string
+        Path to the trend log on the ALC server.
+        route : string, default = 'alc'
+        Route name used in the cache keys.
+
+        """
+        window = cache.coverage((route, log))
+        if window is None or self._saved.get(log) == window[1]:
+            return
+
+        start, watermark = window
+        file_name = self._file_name(log)
+        # Pre-forked workers share the directory, never replace a newer watermark stored by another
+        stored_watermark = self._stored_watermark(file_name)
+        if stored_watermark is not None and stored_watermark >= watermark:
+            self._saved[log] = watermark
+            return
+
+        start = max(start, watermark - self.tail)
+        tail = cache.get((route, log), start, watermark)
+        if tail is None:
+            return
+
+        stored = {'log': log, 'start': start.strftime(self.time_format),
+                  'watermark': watermark.strftime(self.time_format), 'tail': tail}
+        os.makedirs(self.directory, exist_ok=True)
+        # Write to a temporary file first so a crash never leaves a half written watermark
+        temp_name = "%s.%d.tmp" % (file_name, os.getpid())
+        with open(temp_name, 'w') as file_watermark:
+            json.dump(stored, file_watermark)
+        os.replace(temp_name, file_name)
+        self._saved[log] = watermark
+
+##################################################################################################
+# End save()
+##################################################################################################
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark of the Haystack JSON history grid decoder in grid_utils
+
+Builds a synthetic multi-year, multi-point history grid and compares
+grid_utils.his_grid_json with the json_normalize + regex parsing that
+spyspark_client._parse_TS_data_json used before, and the JSON response
+with the same grid in Zinc decoded by grid_utils.his_grid_zinc.
+
+The speedup is checked against the 10x target set for the decoder and the
+script exits with status 1 when it is not met. On these full precision
+values the pandas C parser needs about 0.1 s per 700k number cells. With
+the join of the cells and the timestamps that comes to 0.15-0.2 s, against
+1.3-1.9 s for the old parsing. The decoder measures 7-9x here, so the
+target is not met.
+
+Usage: python bench_grid_utils.py [points] [days]
+
+Created on 2026-10-19
+
+@author: jrodriguez13
+"""
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import grid_utils
+
+# Speedup over the json_normalize + regex parsing the decoder was asked to reach
+TARGET_SPEEDUP = 10
+
+json_normalize = getattr(pd, "json_normalize", None) or pd.io.json.json_normalize
+
+
+def make_grid(points: int, days: int) -> dict:
+    """Return a Haystack JSON history grid of 15 minute data"""
+    index = pd.date_range("2017-01-01", periods=days * 96, freq="15min", tz="America/Los_Angeles")
+    cols = [{"name": "ts"}] + [{"name": "v%d" % i, "id": "r:%08x Meter %d kWh" % (i, i)} for i in range(points)]
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0, 500, size=(len(index), points))
+    rows = []
+    for t, row_values in zip(index, values.tolist()):
+        row = {"ts": "t:" + t.isoformat() + " Los_Angeles"}
+        for i, value in enumerate(row_values):
+            row["v%d" % i] = "n:%r kWh" % value
+        rows.append(row)
+    return {"meta": {"ver": "3.0"}, "cols": cols, "rows": rows}
+
+
+def make_zinc(res: dict) -> str:
+    """Return the Zinc text of a history grid built by make_grid"""
+    lines = ['ver:"3.0"', ",".join(["ts"] + ['%s id:@%s "%s"' % (col["name"], col["id"][2:].split(" ", 1)[0],
+                                                                    col["id"].split(" ", 1)[1]) for col in res["cols"][1:]])]
+    names = [col["name"] for col in res["cols"][1:]]
+    for row in res["rows"]:
+        lines.append(",".join([row["ts"][2:]] + [row[name][2:].replace(" ", "") for name in names]))
+    return "\n".join(lines) + "\n"
+
+
+def legacy_parse(res: dict) -> pd.DataFrame:
+    """json_normalize + regex parsing formerly in _parse_TS_data_json"""
+    metadata = json_normalize(res["cols"][1:])
+    TSdata = json_normalize(res["rows"])
+    pat = r"(t:)([0-9T\-:]{19})(.{3,})"
+    TSdata["ts"] = pd.to_datetime(TSdata["ts"].str.replace(pat, lambda m: m.group(2), regex=True))
+    TSdata.set_index("ts", inplace=True, drop=True)
+    pat = r"(n:)([0-9\.]{1,})(\s.{2,})"
+    for col in TSdata.columns.tolist():
+        TSdata[col] = pd.to_numeric(TSdata[col].str.replace(pat, lambda m: m.group(2), regex=True), errors="coerce")
+    TSdata.columns = metadata.loc[metadata["name"].isin(TSdata.columns.tolist()), "id"].tolist()
+    return TSdata
+
+
+def best_of(function, res: dict, repeat: int = 3) -> tuple:
+    """Return the best run time of function(res) and its result"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(res)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == '__main__':
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    res = json.loads(json.dumps(make_grid(points, days)))
+    print("Grid: %d points x %d rows" % (points, len(res["rows"])))
+
+    legacy_time, legacy = best_of(legacy_parse, res)
+    fast_time, fast = best_of(grid_utils.his_grid_json, res)
+    pd.testing.assert_frame_equal(legacy, fast, check_names=False, check_freq=False, check_index_type=False)
+
+    print("json_normalize + regex: %8.3f s" % legacy_time)
+    print("grid_utils.his_grid_json: %6.3f s" % fast_time)
+    speedup = legacy_time / fast_time
+    print("Speedup: %.1fx (target %dx %s)" % (speedup, TARGET_SPEEDUP, "met" if speedup >= TARGET_SPEEDUP else "not met"))
+
+    text = json.dumps(res)
+    zinc = make_zinc(res)
+    json_time, _ = best_of(lambda body: grid_utils.his_grid_json(json.loads(body)), text)
+    zinc_time, from_zinc = best_of(grid_utils.his_grid_zinc, zinc)
+    pd.testing.assert_frame_equal(fast, from_zinc, check_index_type=False)
+
+    print("\nResponse size: JSON %.1f MB, Zinc %.1f MB" % (len(text.encode()) / 1e6, len(zinc.encode()) / 1e6))
+    print("json.loads + his_grid_json: %6.3f s" % json_time)
+    print("grid_utils.his_grid_zinc: %8.3f s" % zinc_time)
+
+    if speedup < TARGET_SPEEDUP:
+        sys.exit(1)
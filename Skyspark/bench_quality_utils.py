@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark of the vectorized data quality kernel in quality_utils
+
+Builds a wide synthetic frame of 15 minute meter data with missing samples,
+zeros, flatlines and spikes, and compares quality_utils.data_quality_frame
+with the per-metric pandas passes and row by row DataFrame.apply that
+spyspark_client.data_quality_analysis used before. When ts_util
+(TS_Util_Clean_Data_test) can be imported, its metrics are compared too.
+The ts_util counts of a small fixed frame are pinned in
+tests/test_quality_utils.py, which runs without ts_util.
+
+Usage: python bench_quality_utils.py [points] [days]
+
+Created on 2026-10-19
+
+@author: jrodriguez13
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import quality_utils
+
+
+def make_frame(points: int, days: int) -> pd.DataFrame:
+    """Return a frame of 15 minute data with missing samples, zeros, flatlines and spikes"""
+    index = pd.date_range("2017-01-01", periods=days * 96, freq="15min")
+    rng = np.random.default_rng(0)
+    values = rng.normal(100, 10, size=(len(index), points)).round(1)
+    values[rng.random(values.shape) < 0.05] = np.nan
+    values[rng.random(values.shape) < 0.02] = 0
+    values[rng.random(values.shape) < 0.001] *= 10
+    flat = rng.random(values.shape) < 0.03
+    values[1:][flat[1:]] = values[:-1][flat[1:]]
+    values[:, 0] = np.nan     # A point without data
+    return pd.DataFrame(values, index=index, columns=["r:%08x Meter %d" % (i, i) for i in range(points)])
+
+
+def legacy_quality(data: pd.DataFrame) -> pd.DataFrame:
+    """One pandas pass per metric and DataFrame.apply per row, as data_quality_analysis did with ts_util"""
+    rows = data.shape[0]
+    missing = data.isnull().sum()
+    zeros = (data == 0).sum()
+    flatlines = (data.diff() == 0).sum()
+    outliers = ((data - data.mean()).abs() > 3 * data.std()).sum()
+
+    curr_sens = pd.DataFrame()
+    curr_sens["first_valid"] = data.apply(lambda col: col.first_valid_index())
+    curr_sens["last_valid"] = data.apply(lambda col: col.last_valid_index())
+    curr_sens["period_length"] = curr_sens["last_valid"] - curr_sens["first_valid"]
+    curr_sens["count"] = data.count()
+    curr_sens["missing_n"] = data.isnull().sum()
+    curr_sens["missing_perc"] = missing / rows * 100
+    curr_sens["zeroVal_n"] = zeros
+    curr_sens["zeroVal_perc"] = (data == 0).sum() / rows * 100
+    curr_sens["flatline_n"] = flatlines
+    curr_sens["flatline_perc"] = (data.diff() == 0).sum() / rows * 100
+    curr_sens["outliersStdv_n"] = outliers
+    curr_sens["outliersStdv_perc"] = ((data - data.mean()).abs() > 3 * data.std()).sum() / rows * 100
+
+    def dominate_issue(frame):
+        maxNum = max(frame['missing_perc'], frame['zeroVal_perc'], frame['flatline_perc'], frame['outliersStdv_perc'])
+        if maxNum == 0:
+            return 'All percentages zero'
+        for column in quality_utils.ISSUE_COLUMNS:
+            if frame[column] == maxNum:
+                return column
+
+    curr_sens["dominate_issue"] = curr_sens.apply(dominate_issue, axis=1)
+    curr_sens["% ok"] = curr_sens.apply(lambda frame: 100 - sum(frame[quality_utils.ISSUE_COLUMNS]), axis=1)
+    return curr_sens
+
+
+def ts_util_quality(data: pd.DataFrame):
+    """Return the ts_util metrics compared with the kernel, None if ts_util cannot be imported"""
+    try:
+        from TS_Util_Clean_Data_test import ts_util
+    except ImportError:
+        return None
+    tu = ts_util()
+    return pd.DataFrame({"missing_n": tu.count_missing(data, output="number"),
+                         "zeroVal_n": tu.count_if(data, operator="=", val=0, output="number"),
+                         "flatline_n": tu.count_flatlines(data, output="number"),
+                         "outliersStdv_n": tu.count_outliers(data, method="std", coeff=3)})
+
+
+def best_of(function, data: pd.DataFrame, repeat: int = 3) -> tuple:
+    """Return the best run time of function(data) and its result"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == '__main__':
+    points = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 90
+    data = make_frame(points, days)
+    print("Frame: %d points x %d rows" % data.shape[::-1])
+
+    legacy_time, legacy = best_of(legacy_quality, data)
+    fast_time, fast = best_of(quality_utils.data_quality_frame, data)
+    pd.testing.assert_frame_equal(legacy, fast, check_dtype=False)
+
+    print("pandas passes + apply:            %6.3f s" % legacy_time)
+    print("quality_utils.data_quality_frame: %6.3f s" % fast_time)
+    print("Speedup: %.1fx" % (legacy_time / fast_time))
+
+    reference = ts_util_quality(data)
+    if reference is None:
+        print("\nts_util not installed, not compared")
+    else:
+        pd.testing.assert_frame_equal(reference, fast[reference.columns], check_dtype=False)
+        print("\nMatches ts_util counts")
@@ -0,0 +1,525 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Utility functions to decode SkySpark Haystack grids into pandas objects
+
+Module includes the following functions:
+olson_tz             Return the IANA timezone name of a Haystack timezone name
+decode_numbers       Decode Haystack number cells into a float array
+decode_times         Decode Haystack DateTime cells into a DatetimeIndex
+decode_grid_numbers  Decode every number cell of a grid in one C parser pass
+his_grid_json        Decode a Haystack JSON history grid into a time series DataFrame
+zinc_scalar          Decode one Zinc value into its Haystack JSON encoding
+zinc_lines           Iterate the lines of Zinc text or of a streamed response
+zinc_grid            Decode a Zinc grid into the dictionary of a Haystack JSON grid
+his_grid_zinc        Decode a Zinc history grid into a time series DataFrame, in chunks of rows
+csv_grid             Decode a CSV grid into a DataFrame of strings and markers
+his_grid_csv         Decode a CSV history grid into a time series DataFrame, in chunks of rows
+
+Cells are decoded with fixed-offset string operations and bulk parsers with an
+explicit format, instead of matching a regex on every cell.
+
+Created on 2026-10-19
+
+@author: jrodriguez13
+"""
+import csv
+import io
+import json
+import re
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
+import pandas as pd
+
+try:
+    from zoneinfo import available_timezones
+except ImportError:     # Python < 3.9
+    from pytz import all_timezones as _all_timezones
+    available_timezones = lambda: set(_all_timezones)
+
+# Layout of a DateTime without fractional seconds: YYYY-MM-DDThh:mm:ss+hh:mm
+WALL_LENGTH = 19
+ISO_LENGTH = 25
+# Rows of a Zinc history grid decoded per read_csv call
+ZINC_CHUNK_ROWS = 50000
+# Rows of a Zinc history grid sampled for the units of its columns
+ZINC_UNIT_ROWS = 100
+
+_ZINC_STR = r'"(?:[^"\\]|\\.)*"'
+ZINC_SCALAR = re.compile(
+    r'(?P<str>' + _ZINC_STR + r')'
+    r'|(?P<uri>`(?:[^`\\]|\\.)*`)'
+    r'|(?P<ref>@[A-Za-z0-9_:\-.~]+)(?: (?P<dis>' + _ZINC_STR + r'))?'
+    r'|(?P<datetime>\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?(?:Z|[+-]\d\d:\d\d)(?: [A-Za-z][\w+\-/]*)?)'
+    r'|(?P<date>\d{4}-\d\d-\d\d)'
+    r'|(?P<time>\d\d:\d\d(?::\d\d(?:\.\d+)?)?)'
+    r'|(?P<coord>C\(-?[\d.]+,-?[\d.]+\))'
+    r'|(?P<xstr>[A-Z][A-Za-z0-9_]*\(' + _ZINC_STR + r'\))'
+    r'|(?P<number>-?(?:INF|\d[\d_]*(?:\.\d[\d_]*)?(?:[eE][+-]?\d+)?))(?P<unit>[A-Za-z%_/$\u0080-\uffff]*)'
+    r'|(?P<keyword>NaN|NA|N|M|R|T|F)(?![A-Za-z0-9_])')
+ZINC_KINDS = ("str", "uri", "ref", "datetime", "date", "time", "coord", "xstr", "number", "keyword")
+ZINC_NAME = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+# Markers are written as a checkmark in CSV grids
+CSV_MARKER = "\u2713"
+CSV_NUMBER = re.compile(r'(-?(?:INF|\d[\d_]*(?:\.\d[\d_]*)?(?:[eE][+-]?\d+)?))(.*)$')
+
+_olson_names = {}
+
+
+def olson_tz(name: str) -> str:
+    """Return the IANA timezone name ending in a Haystack timezone name (e.g. Los_Angeles)"""
+    if name not in _olson_names:
+        if name in ("UTC", "Rel"):
+            _olson_names[name] = "UTC"
+        else:
+            matches = sorted(tz for tz in available_timezones() if tz.endswith("/" + name))
+            _olson_names[name] = matches[0] if matches else "UTC"
+    return _olson_names[name]
+
+
+def decode_numbers(cells: list) -> np.ndarray:
+    """Decode Haystack JSON number cells into a float array
+
+    Number cells look like 'n:74.5999984741211 °F' or 'n:-3'. The 'n:' prefix
+    and the unit are cut off by position. Booleans decode to 1.0 / 0.0 and any
+    other cell (missing, markers, strings) decodes to NaN.
+
+    Keyword arguments:
+    cells -- list of cells of one grid column
+    """
+    text = []
+    for cell in cells:
+        if cell.__class__ is str:
+            if cell[:2] == "n:":
+                space = cell.find(" ", 2)
+                text.append(cell[2:space] if space > 0 else cell[2:])
+            else:
+                text.append("nan")
+        elif cell is True or cell is False:
+            text.append("1" if cell else "0")
+        elif cell is None:
+            text.append("nan")
+        else:
+            text.append(cell)
+    # float() parses the Haystack special values NaN, INF and -INF
+    return np.array(text, dtype=float)
+
+
+def decode_times(cells: list, keep_tz: bool = False, prefix: str = "t:") -> pd.DatetimeIndex:
+    """Decode Haystack DateTime cells into a DatetimeIndex
+
+    DateTime cells look like 't:2017-11-26T00:25:00-08:00 Los_Angeles' in JSON
+    and have no prefix in Zinc. By default the wall clock time is returned as a
+    naive index. With keep_tz the offsets are applied and the index is
+    converted to the cells' timezone.
+
+    Keyword arguments:
+    cells   -- list of DateTime cells
+    keep_tz -- return a timezone aware index (default False)
+    prefix  -- type prefix of the cells (default 't:', '' for Zinc)
+    """
+    if not cells:
+        return pd.DatetimeIndex([])
+    p = len(prefix)
+    first = cells[0]
+    space = first.find(" ", p)
+    tz_name = first[space + 1:] if space > 0 else "UTC"
+
+    # Fast path: the cells of a history grid share one timezone, so when they all have the length of
+    # the first cell and it has whole seconds and a +hh:mm offset, every cell is cut by position
+    if space == ISO_LENGTH + p and len(set(map(len, cells))) == 1:
+        wall = np.array([cell[p:p + WALL_LENGTH] for cell in cells], dtype="datetime64[s]")
+        offsets = [cell[p + WALL_LENGTH:p + ISO_LENGTH] for cell in cells] if keep_tz else None
+    # Fractional seconds or a UTC 'Z': cut the offset from the end of the ISO text
+    else:
+        iso = [cell[p:cell.find(" ", p)] if cell.find(" ", p) > 0 else cell[p:] for cell in cells]
+        wall = [text[:-1] if text[-1] == "Z" else text[:-6] if text[-6] in "+-" else text for text in iso]
+        offsets = [text[-6:] if text[-6] in "+-" else "+00:00" for text in iso] if keep_tz else None
+
+    times = pd.DatetimeIndex(np.array(wall, dtype="datetime64[ns]"))
+    if not keep_tz:
+        return times
+    minutes = np.array([(-1 if text[0] == "-" else 1) * (int(text[1:3]) * 60 + int(text[4:6])) for text in offsets],
+                       dtype="int64")
+    utc = times - pd.to_timedelta(minutes, unit="m")
+    return utc.tz_localize("UTC").tz_convert(olson_tz(tz_name))
+
+
+def decode_grid_numbers(rows: list, names: list) -> np.ndarray:
+    """Decode the number cells of several grid columns in one C parser pass
+
+    Every cell becomes one 'n:value unit' line that pandas.read_csv splits on
+    ':' and cuts at the space before the unit. Return a float array of shape
+    (rows, columns), or None if a cell is missing or not a string, in which
+    case the columns have to be decoded one by one with decode_numbers.
+
+    Keyword arguments:
+    rows  -- list of grid rows
+    names -- names of the columns to decode
+    """
+    getter = itemgetter(*names) if len(names) > 1 else lambda row: (row[names[0]],)
+    try:
+        text = "\n".join(chain.from_iterable(map(getter, rows)))
+    except (KeyError, TypeError):   # Missing value or a non string cell
+        return None
+    # Bytes skip the Python text reader that read_csv wraps around a StringIO
+    block = pd.read_csv(io.BytesIO(text.encode("utf-8")), header=None, sep=":", comment=" ", usecols=[1],
+                        names=["kind", "value"], lineterminator="\n")
+    # Cells other than numbers (markers, strings with spaces or newlines) leave text or extra lines
+    if len(block) != len(rows) * len(names) or block["value"].dtype.kind != "f":
+        return None
+    return block["value"].to_numpy().reshape(len(rows), len(names))
+
+
+def his_grid_json(res: dict, keep_tz: bool = False) -> pd.DataFrame:
+    """Decode a Haystack JSON history grid into a time series DataFrame
+
+    Return a DataFrame indexed by the 'ts' column with one float column per
+    value column, named by the column's 'id' meta (its name if it has none).
+    Return None if the grid has no rows.
+
+    Keyword arguments:
+    res     -- Haystack JSON grid as returned by json.loads
+    keep_tz -- timezone aware index (default False, naive wall clock time)
+    """
+    rows = res["rows"]
+    if not rows or "ts" not in rows[0]:
+        return None
+
+    index = decode_times([row["ts"] for row in rows], keep_tz=keep_tz)
+    index.name = "ts"
+    cols = [col for col in res["cols"] if col["name"] != "ts"]
+    columns = [col.get("id", col["name"]) for col in cols]
+
+    values = decode_grid_numbers(rows, [col["name"] for col in cols]) if cols else None
+    if values is not None:
+        return pd.DataFrame(values, index=index, columns=columns)
+
+    data = {}
+    for column, col in zip(columns, cols):
+        name = col["name"]
+        data[column] = decode_numbers([row.get(name) for row in rows])
+    return pd.DataFrame(data, index=index, columns=columns)
+
+
+def _zinc_string(token: str) -> str:
+    """Unescape a quoted Zinc string"""
+    return json.loads(token.replace("\\$", "$"))
+
+
+def _zinc_nested(line: str, pos: int) -> int:
+    """Return the position after the list, dict or grid starting at pos"""
+    depth = 0
+    while pos < len(line):
+        char = line[pos]
+        if char == '"':
+            pos = ZINC_SCALAR.match(line, pos).end()
+            continue
+        if char in "[{(<":
+            depth += 1
+        elif char in "]})>":
+            depth -= 1
+            if depth == 0:
+                return pos + 1
+        pos += 1
+    return pos
+
+
+def zinc_scalar(line: str, pos: int) -> tuple:
+    """Decode the Zinc value starting at pos
+
+    Return the value in Haystack JSON encoding ('n:74.5 °F', 'r:id dis', 'm:',
+    plain text for strings, True/False, None for null) and the position after
+    it. Lists, dicts and nested grids are returned as their Zinc text.
+
+    Keyword arguments:
+    line -- Zinc text
+    pos  -- position of the value
+    """
+    if line.startswith(("[", "{", "<<"), pos):
+        end = _zinc_nested(line, pos)
+        return line[pos:end], end
+
+    match = ZINC_SCALAR.match(line, pos)
+    if match is None:
+        raise ValueError("Invalid Zinc value at %d: %s" % (pos, line[pos:pos + 40]))
+    kind = next(kind for kind in ZINC_KINDS if match.group(kind) is not None)
+    token = match.group(kind)
+
+    if kind == "str":
+        value = _zinc_string(token)
+        # Strings that look like a JSON type prefix are marked as strings
+        value = "s:" + value if value[1:2] == ":" else value
+    elif kind == "number":
+        unit = match.group("unit")
+        value = "n:" + token.replace("_", "") + (" " + unit if unit else "")
+    elif kind == "ref":
+        dis = match.group("dis")
+        value = "r:" + token[1:] + (" " + _zinc_string(dis) if dis else "")
+    elif kind == "keyword":
+        value = {"NaN": "n:NaN", "NA": "z:", "N": None, "M": "m:", "R": "-:", "T": True, "F": False}[token]
+    else:
+        prefix = {"uri": "u:", "datetime": "t:", "date": "d:", "time": "h:", "coord": "c:", "xstr": "x:"}[kind]
+        if kind == "uri":
+            token = token[1:-1]
+        elif kind == "coord":
+            token = token[2:-1]
+        elif kind == "xstr":
+            name, _, text = token.partition("(")
+            token = name + ":" + _zinc_string(text[:-1])
+        value = prefix + token
+    return value, match.end()
+
+
+def _zinc_tags(line: str, pos: int = 0) -> tuple:
+    """Decode the space separated name or name:value tags starting at pos, up to a comma or the end of the line"""
+    tags = {}
+    while pos < len(line) and line[pos] != ",":
+        if line[pos] == " ":
+            pos += 1
+            continue
+        match = ZINC_NAME.match(line, pos)
+        if match is None:
+            raise ValueError("Invalid Zinc tag at %d: %s" % (pos, line[pos:pos + 40]))
+        name = match.group()
+        pos = match.end()
+        if pos < len(line) and line[pos] == ":":
+            tags[name], pos = zinc_scalar(line, pos + 1)
+        else:
+            tags[name] = "m:"
+    return tags, pos
+
+
+def _zinc_cols(line: str) -> list:
+    """Decode the column line of a Zinc grid into a list of {name, meta...} dictionaries"""
+    cols = []
+    pos = 0
+    while pos < len(line):
+        match = ZINC_NAME.match(line, pos)
+        if match is None:
+            raise ValueError("Invalid Zinc column at %d: %s" % (pos, line[pos:pos + 40]))
+        meta, pos = _zinc_tags(line, match.end())
+        col = {"name": match.group()}
+        col.update(meta)
+        cols.append(col)
+        pos += 1    # Comma
+    return cols
+
+
+def _zinc_row(line: str) -> list:
+    """Decode the comma separated cells of a Zinc row, with None for empty cells"""
+    cells = []
+    pos = 0
+    while True:
+        if pos >= len(line) or line[pos] == ",":
+            cells.append(None)
+        else:
+            value, pos = zinc_scalar(line, pos)
+            cells.append(value)
+        if pos >= len(line):
+            return cells
+        pos += 1    # Comma
+
+
+def zinc_lines(text):
+    """Iterate the non empty lines of Zinc text or of an iterable of lines (e.g. a streamed response)"""
+    lines = text.splitlines() if isinstance(text, str) else text
+    for line in lines:
+        line = line.decode("utf-8") if isinstance(line, bytes) else line
+        line = line.rstrip("\r\n")
+        if line:
+            yield line
+
+
+def zinc_grid(text, header_only: bool = False) -> dict:
+    """Decode a Zinc grid into the dictionary of a Haystack JSON grid
+
+    Cells are given the Haystack JSON encoding and null cells are left out of
+    their row, so the result can go through the same parsing as a JSON grid.
+
+    Keyword arguments:
+    text        -- Zinc text, or an iterable of lines
+    header_only -- only decode the grid meta and columns (default False)
+    """
+    lines = zinc_lines(text)
+    meta, _ = _zinc_tags(next(lines))
+    cols = _zinc_cols(next(lines, ""))
+    rows = []
+    if not header_only:
+        names = [col["name"] for col in cols]
+        for line in lines:
+            rows.append({name: cell for name, cell in zip(names, _zinc_row(line)) if cell is not None})
+    return {"meta": meta, "cols": cols, "rows": rows}
+
+
+def _zinc_number_cell(cell) -> float:
+    """Return the float of a decoded Zinc cell, NaN if it is not a number or bool"""
+    if cell is True or cell is False:
+        return float(cell)
+    if cell.__class__ is str and cell[:2] == "n:":
+        space = cell.find(" ", 2)
+        return float(cell[2:space] if space > 0 else cell[2:])
+    return np.nan
+
+
+def _his_text_block(lines: list, columns: list, units: list, keep_tz: bool, decode_cells) -> pd.DataFrame:
+    """Decode a block of Zinc or CSV history rows with one read_csv call
+
+    decode_cells returns the floats of the value cells of one row, for rows
+    the bulk parse cannot type.
+    """
+    if not columns:
+        return pd.DataFrame(index=decode_times(lines, keep_tz=keep_tz, prefix=""))
+    parts = [line.split(",", 1) for line in lines]
+    index = decode_times([part[0] for part in parts], keep_tz=keep_tz, prefix="")
+
+    # Units follow the number directly, strip them before each comma and line end
+    text = "\n".join([part[1] if len(part) > 1 else "" for part in parts]) + "\n"
+    for unit in units:
+        text = text.replace(unit + ",", ",").replace(unit + "\n", "\n")
+    block = pd.read_csv(io.BytesIO(text.encode("utf-8")), header=None, names=list(range(len(columns))),
+                        na_values=["N", "NA"], true_values=["T", "true", CSV_MARKER], false_values=["F", "false"],
+                        skip_blank_lines=False)
+
+    if len(block) == len(lines) and all(dtype.kind in "fib" for dtype in block.dtypes):
+        values = block.to_numpy(dtype=float)
+    else:
+        # Strings, refs or units not seen in the sampled rows: decode every cell
+        values = np.full((len(lines), len(columns)), np.nan)
+        for i, part in enumerate(parts):
+            if len(part) > 1:
+                for j, value in enumerate(decode_cells(part[1])[:len(columns)]):
+                    values[i, j] = value
+    return pd.DataFrame(values, index=index, columns=columns)
+
+
+def _zinc_cells(text: str) -> list:
+    """Return the floats of the cells of a Zinc row"""
+    return [_zinc_number_cell(cell) for cell in _zinc_row(text)]
+
+
+def _zinc_units(lines: list, count: int) -> list:
+    """Return the units found in the first rows of a Zinc history grid, longest first"""
+    units = set()
+    for line in lines[:ZINC_UNIT_ROWS]:
+        for cell in _zinc_row(line)[1:count + 1]:
+            if cell.__class__ is str and cell[:2] == "n:" and " " in cell:
+                units.add(cell[cell.index(" ") + 1:])
+    return sorted(units, key=len, reverse=True)
+
+
+def his_grid_zinc(text, keep_tz: bool = False, chunk_rows: int = ZINC_CHUNK_ROWS) -> pd.DataFrame:
+    """Decode a Zinc history grid into a time series DataFrame
+
+    Rows are decoded chunk_rows at a time with pandas.read_csv, so the text can
+    be a streamed iterable of lines. Return a DataFrame indexed by 'ts' with
+    one float column per value column, named by the column's 'id' meta (its
+    name if it has none), or None if the grid is not a history grid or has no rows.
+
+    Keyword arguments:
+    text       -- Zinc text, or an iterable of lines
+    keep_tz    -- timezone aware index (default False, naive wall clock time)
+    chunk_rows -- rows decoded per read_csv call (default ZINC_CHUNK_ROWS)
+    """
+    lines = zinc_lines(text)
+    next(lines, None)   # Grid meta
+    cols = _zinc_cols(next(lines, ""))
+    if not cols or cols[0]["name"] != "ts":
+        return None
+    columns = [col.get("id", col["name"]) for col in cols[1:]]
+
+    frames = []
+    units = None
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) >= chunk_rows:
+            # Units are sampled from the first rows of the grid
+            units = _zinc_units(block, len(columns)) if units is None else units
+            frames.append(_his_text_block(block, columns, units, keep_tz, _zinc_cells))
+            block = []
+    if block:
+        units = _zinc_units(block, len(columns)) if units is None else units
+        frames.append(_his_text_block(block, columns, units, keep_tz, _zinc_cells))
+    if not frames:
+        return None
+    TSdata = pd.concat(frames) if len(frames) > 1 else frames[0]
+    TSdata.index.name = "ts"
+    return TSdata
+
+
+def csv_grid(text: str) -> pd.DataFrame:
+    """Decode a CSV grid into a DataFrame of strings, with markers as True
+
+    Keyword arguments:
+    text -- CSV text, decoded as UTF-8
+    """
+    grid = pd.read_csv(io.StringIO(text), dtype=str, keep_default_na=False, na_values=[""])
+    return grid.replace(CSV_MARKER, True)
+
+
+def _csv_number_cell(cell: str) -> float:
+    """Return the float of a CSV cell, NaN if it is not a number, bool or marker"""
+    if cell in ("true", CSV_MARKER):
+        return 1.0
+    if cell == "false":
+        return 0.0
+    match = CSV_NUMBER.match(cell)
+    return float(match.group(1).replace("_", "")) if match else np.nan
+
+
+def _csv_cells(text: str) -> list:
+    """Return the floats of the cells of a CSV row"""
+    return [_csv_number_cell(cell) for cell in next(csv.reader([text]))]
+
+
+def _csv_units(lines: list, count: int) -> list:
+    """Return the units found in the first rows of a CSV history grid, longest first"""
+    units = set()
+    for line in lines[:ZINC_UNIT_ROWS]:
+        for cell in line.split(",")[1:count + 1]:
+            match = CSV_NUMBER.match(cell)
+            if match and match.group(2):
+                units.add(match.group(2))
+    return sorted(units, key=len, reverse=True)
+
+
+def his_grid_csv(text, keep_tz: bool = False, chunk_rows: int = ZINC_CHUNK_ROWS) -> pd.DataFrame:
+    """Decode a CSV history grid into a time series DataFrame
+
+    CSV grids only carry the display name of each column in their header row,
+    which names the columns of the DataFrame. The first column holds the
+    timestamps, written like Zinc DateTimes. Rows are decoded chunk_rows at a
+    time with pandas.read_csv, so the text can be a streamed iterable of lines.
+    Return None if the grid has no rows.
+
+    Keyword arguments:
+    text       -- CSV text, or an iterable of lines
+    keep_tz    -- timezone aware index (default False, naive wall clock time)
+    chunk_rows -- rows decoded per read_csv call (default ZINC_CHUNK_ROWS)
+    """
+    lines = zinc_lines(text)    # Same line handling as Zinc
+    header = next(lines, None)
+    if header is None:
+        return None
+    columns = next(csv.reader([header]))[1:]
+
+    frames = []
+    units = None
+    block = []
+    for line in lines:
+        block.append(line)
+        if len(block) >= chunk_rows:
+            units = _csv_units(block, len(columns)) if units is None else units
+            frames.append(_his_text_block(block, columns, units, keep_tz, _csv_cells))
+            block = []
+    if block:
+        units = _csv_units(block, len(columns)) if units is None else units
+        frames.append(_his_text_block(block, columns, units, keep_tz, _csv_cells))
+    if not frames:
+        return None
+    TSdata = pd.concat(frames) if len(frames) > 1 else frames[0]
+    TSdata.index.name = "ts"
+    return TSdata
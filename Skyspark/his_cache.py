@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""On-disk cache of SkySpark point histories for spyspark_client
+
+Each fetched day span of a point is stored in its own chunk file, Parquet
+when pyarrow is installed and pickle otherwise, next to a small JSON file
+listing the chunks and the days they cover. A hisRead then only has to fetch
+the days that are not covered yet, and storing them only writes their chunk.
+Days from today on are never marked as covered, so the newest tail is always
+fetched again. Timezone aware and naive histories are cached apart.
+
+Created on 2026-10-19
+
+@author: jrodriguez13
+"""
+import datetime
+import hashlib
+import json
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    CACHE_FORMAT = "parquet"
+except ImportError:     # Parquet needs pyarrow, fall back to pickle
+    CACHE_FORMAT = "pickle"
+
+DATE_FORMAT = "%Y-%m-%d"
+MAX_CHUNKS = 64     # Chunks of a point merged into one file once it has more
+
+
+class his_cache(object):
+
+###############################################################################
+    def __init__(self, directory="his_cache", file_format=CACHE_FORMAT, keep_tz=False, max_chunks=MAX_CHUNKS):
+
+        """ Cache point histories under directory.
+
+        Parameters
+        ----------
+        directory : str
+            Directory holding the cached histories (default: "his_cache").
+        file_format : str
+            "parquet" or "pickle" (default: parquet when pyarrow is installed).
+        keep_tz : bool
+            Histories have a timezone aware index, as read by spyspark_client(keep_tz=True). They are
+            cached apart from naive ones, so clients of either mode can share a directory (default: False).
+        max_chunks : int
+            Chunks of a point merged into one file once it has more (default: MAX_CHUNKS).
+
+        """
+        self.directory = directory
+        self.file_format = file_format
+        self.keep_tz = keep_tz
+        self.max_chunks = max_chunks
+        self._lock = threading.Lock()
+        self._point_locks = {}
+        return
+
+###############################################################################
+    def _file_name(self, ref, extension):
+
+        """ Return the file of a point's coverage or history chunks. Refs are hashed with the timezone
+        mode since they may contain characters that are not valid in file names.
+        """
+        key = ref + "|tz" if self.keep_tz else ref
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + extension)
+
+###############################################################################
+    def _point_lock(self, ref):
+
+        """ Return the lock serializing updates of one point. """
+        with self._lock:
+            return self._point_locks.setdefault(ref, threading.Lock())
+
+###############################################################################
+    def _read_coverage(self, ref):
+
+        """ Return the stored coverage of a point: its column name, covered day spans and
+        [start, end, file name, format] of each chunk.
+        """
+        try:
+            with open(self._file_name(ref, ".json"), "r") as file_coverage:
+                return json.load(file_coverage)
+        except (OSError, ValueError):   # Not cached yet, or unreadable: the point is fetched in full
+            return {"ref": ref, "column": None, "spans": [], "chunks": []}
+
+###############################################################################
+    def _write_coverage(self, coverage):
+
+        """ Store the coverage of a point. """
+        def write(name):
+            with open(name, "w") as file_coverage:
+                json.dump(coverage, file_coverage)
+        self._replace(self._file_name(coverage["ref"], ".json"), write)
+
+###############################################################################
+    def _replace(self, file_name, write):
+
+        """ Write a file through a temporary file so a crash never leaves it half written. """
+        os.makedirs(self.directory, exist_ok=True)
+        temp_name = "%s.%d.%d.tmp" % (file_name, os.getpid(), threading.get_ident())
+        write(temp_name)
+        os.replace(temp_name, file_name)
+
+###############################################################################
+    def _read_chunk(self, chunk):
+
+        """ Return the samples of a chunk. """
+        name = os.path.join(self.directory, chunk[2])
+        return pd.read_parquet(name) if chunk[3] == "parquet" else pd.read_pickle(name)
+
+###############################################################################
+    def _write_chunk(self, ref, frame, start, end):
+
+        """ Store the samples of a day span in a chunk file of its own and return the chunk. """
+        extension = ".parquet" if self.file_format == "parquet" else ".pkl"
+        file_name = self._file_name(ref, ".%s_%s%s" % (start, end, extension))
+        self._replace(file_name, frame.to_parquet if self.file_format == "parquet" else frame.to_pickle)
+        return [start, end, os.path.basename(file_name), self.file_format]
+
+###############################################################################
+    def _remove_chunk(self, chunk):
+
+        """ Remove the file of a chunk. """
+        try:
+            os.remove(os.path.join(self.directory, chunk[2]))
+        except OSError:     # Already removed
+            pass
+
+###############################################################################
+    def missing(self, ref, start, end):
+
+        """ Return the day spans of a range that are not covered by the cache.
+
+        Parameters
+        ----------
+        ref : str
+            Point Ref without the '@'.
+        start : datetime.date
+            First day of the range.
+        end : datetime.date
+            Last day of the range, included.
+
+        Returns
+        -------
+        spans : list
+            List of (start, end) date tuples to fetch, in order.
+
+        """
+        spans = []
+        for covered_start, covered_end in self._read_coverage(ref)["spans"]:
+            covered_start = datetime.datetime.strptime(covered_start, DATE_FORMAT).date()
+            covered_end = datetime.datetime.strptime(covered_end, DATE_FORMAT).date()
+            if covered_end < start:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > start:
+                spans.append((start, covered_start - datetime.timedelta(days=1)))
+            start = covered_end + datetime.timedelta(days=1)
+        if start <= end:
+            spans.append((start, end))
+        return spans
+
+###############################################################################
+    def get(self, ref, start, end):
+
+        """ Return the cached samples of a point between two days, included.
+
+        Returns
+        -------
+        pd.DataFrame()
+            One column DataFrame indexed by timestamp, None if the point has no cached samples in the range.
+
+        """
+        start = start.strftime(DATE_FORMAT)
+        end = end.strftime(DATE_FORMAT)
+        frames = [self._read_chunk(chunk) for chunk in self._read_coverage(ref)["chunks"]
+                  if chunk[0] <= end and start <= chunk[1]]
+        if not frames:
+            return None
+        frame = pd.concat(frames).sort_index() if len(frames) > 1 else frames[0]
+        return frame.loc[start:end]
+
+###############################################################################
+    def column(self, ref):
+
+        """ Return the column name of a cached point, None if it has no cached samples. """
+        return self._read_coverage(ref)["column"]
+
+###############################################################################
+    def put(self, ref, frame, start, end):
+
+        """ Store the samples fetched for a day span in a chunk of their own and mark the span covered.
+
+        Only chunks overlapping the span, such as the uncovered tail fetched last time, are rewritten
+        without the span's samples. Days from today on are not marked covered since their samples may still change.
+
+        Parameters
+        ----------
+        ref : str
+            Point Ref without the '@'.
+        frame : pd.DataFrame()
+            One column DataFrame of the samples fetched, or None if the span has no samples.
+        start : datetime.date
+            First day fetched.
+        end : datetime.date
+            Last day fetched, included.
+
+        """
+        span_start = start.strftime(DATE_FORMAT)
+        span_end = end.strftime(DATE_FORMAT)
+        with self._point_lock(ref):
+            coverage = self._read_coverage(ref)
+            chunks = []
+            removed = []
+            for chunk in coverage["chunks"]:
+                if chunk[1] < span_start or span_end < chunk[0]:
+                    chunks.append(chunk)
+                    continue
+                # Samples of the fetched span replace the stored ones, the rest of the chunk is written back
+                stored = self._read_chunk(chunk)
+                kept = stored.drop(stored.loc[span_start:span_end].index)
+                if len(kept):
+                    chunks.append(self._write_chunk(ref, kept, chunk[0], chunk[1]))
+                if not len(kept) or chunks[-1][2] != chunk[2]:
+                    removed.append(chunk)
+
+            if frame is not None and len(frame):
+                if coverage["column"] is None:
+                    coverage["column"] = str(frame.columns[0])
+                added = self._write_chunk(ref, frame.set_axis([coverage["column"]], axis=1), span_start, span_end)
+                chunks = [chunk for chunk in chunks if chunk[2] != added[2]] + [added]
+                removed = [chunk for chunk in removed if chunk[2] != added[2]]
+
+            if len(chunks) > self.max_chunks:
+                # Merge the chunks so reads do not open too many files
+                frame = pd.concat([self._read_chunk(chunk) for chunk in chunks]).sort_index()
+                merged = self._write_chunk(ref, frame, min(chunk[0] for chunk in chunks),
+                                           max(chunk[1] for chunk in chunks))
+                removed += [chunk for chunk in chunks if chunk[2] != merged[2]]
+                chunks = [merged]
+            coverage["chunks"] = sorted(chunks)
+
+            end = min(end, datetime.date.today() - datetime.timedelta(days=1))
+            if start <= end:
+                coverage["spans"] = self._merge_spans(coverage["spans"] + [[span_start, end.strftime(DATE_FORMAT)]])
+            self._write_coverage(coverage)
+            # Replaced chunks are removed once the coverage no longer lists them
+            for chunk in removed:
+                self._remove_chunk(chunk)
+
+###############################################################################
+    def _merge_spans(self, spans):
+
+        """ Merge overlapping and adjacent day spans. """
+        merged = []
+        for start, end in sorted(spans):
+            if merged:
+                last_end = datetime.datetime.strptime(merged[-1][1], DATE_FORMAT).date()
+                if datetime.datetime.strptime(start, DATE_FORMAT).date() <= last_end + datetime.timedelta(days=1):
+                    merged[-1][1] = max(merged[-1][1], end)
+                    continue
+            merged.append([start, end])
+        return merged
+
+###############################################################################
+    def clear(self, ref=None):
+
+        """ Remove a point from the cache, or every point when ref is None. """
+        if not os.path.isdir(self.directory):
+            return
+        if ref is not None:
+            names = [chunk[2] for chunk in self._read_coverage(ref)["chunks"]]
+            names.append(os.path.basename(self._file_name(ref, ".json")))
+        else:
+            names = os.listdir(self.directory)
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:     # Not stored in this format
+                pass
+###############################################################################
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Inverted tag index of a snapshot of SkySpark records for spyspark_client
+
+The index maps each tag to the records that have it, and each (tag, value)
+pair of ref, string and number tags to the records with that value, so the
+tag filters of spyspark_client.get_metadata can be evaluated locally instead
+of with a readAll round trip. Ref tags are followed through paths like
+equipRef->link when the referenced records are in the snapshot.
+
+Created on 2026-10-19
+
+@author: jrodriguez13
+"""
+import re
+
+TAG_PATH = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(?:->[A-Za-z_][A-Za-z0-9_]*)*$')
+
+
+class meta_index(object):
+
+###############################################################################
+    def __init__(self, rows=None):
+
+        """ Index the rows of a Haystack JSON grid of records.
+
+        Parameters
+        ----------
+        rows : list
+            List of records, as the rows of a Haystack JSON grid.
+
+        """
+        self.rows = []
+        self._ids = []
+        self._positions = {}
+        self._tags = {}
+        self._values = {}
+        self.update(rows or [])
+        return
+
+###############################################################################
+    def _value(self, cell):
+
+        """ Return the indexed value of a Haystack JSON cell: the id of refs, the float of numbers,
+        the text of strings. Return None for markers and values that are not indexed.
+        """
+        if not isinstance(cell, str):
+            return cell if isinstance(cell, bool) else None
+        if cell[:2] == "r:":
+            return cell[2:].split(" ", 1)[0]
+        if cell[:2] == "n:":
+            try:
+                return float(cell[2:].split(" ", 1)[0])
+            except ValueError:      # INF, NaN
+                return None
+        if cell[:2] == "s:":
+            return cell[2:]
+        if len(cell) > 1 and cell[1] == ":":    # Marker, date, time and other typed values
+            return None
+        return cell
+
+###############################################################################
+    def _index(self, position, row, add):
+
+        """ Add or remove the entries of one record. """
+        for tag, cell in row.items():
+            entries = [self._tags.setdefault(tag, set())]
+            value = self._value(cell)
+            if value is not None:
+                entries.append(self._values.setdefault((tag, value), set()))
+            for entry in entries:
+                if add:
+                    entry.add(position)
+                else:
+                    entry.discard(position)
+
+###############################################################################
+    def update(self, rows):
+
+        """ Add records to the index, replacing the records already indexed with the same id.
+
+        Parameters
+        ----------
+        rows : list
+            List of records, as the rows of a Haystack JSON grid.
+
+        """
+        for row in rows:
+            record_id = self._value(row.get("id"))
+            position = self._positions.get(record_id)
+            if position is None:
+                position = len(self.rows)
+                self.rows.append(row)
+                self._ids.append(record_id)
+                if record_id is not None:
+                    self._positions[record_id] = position
+            else:
+                self._index(position, self.rows[position], add=False)
+                self.rows[position] = row
+            self._index(position, row, add=True)
+
+###############################################################################
+    def _follow(self, path, positions):
+
+        """ Return the records whose ref path leads to one of positions, e.g. the points whose
+        equipRef is one of positions for path ['equipRef', 'link'].
+        """
+        for tag in reversed(path[:-1]):
+            matched = set()
+            for position in positions:
+                matched |= self._values.get((tag, self._ids[position]), set())
+            positions = matched
+        return positions
+
+###############################################################################
+    def has(self, path):
+
+        """ Return the records that have a tag, or None if path is not a tag or ref path. """
+        if not TAG_PATH.match(path):
+            return None
+        path = path.split("->")
+        return self._follow(path, self._tags.get(path[-1], set()))
+
+###############################################################################
+    def equals(self, path, value):
+
+        """ Return the records whose tag equals value, or None if path is not a tag or ref path. """
+        if not TAG_PATH.match(path):
+            return None
+        path = path.split("->")
+        return self._follow(path, self._values.get((path[-1], value), set()))
+
+###############################################################################
+    def select(self, tags):
+
+        """ Evaluate the tag filters of spyspark_client.get_metadata.
+
+        Parameters
+        ----------
+        tags : dictionary
+            Dictionary of tags for filtering meters, as passed to get_metadata.
+
+        Returns
+        -------
+        rows : list
+            Matching records in snapshot order, or None if a filter cannot be evaluated locally.
+
+        """
+        everything = set(range(len(self.rows)))
+        selected = everything
+        for key, value in tags.items():
+            if ( ('elec or gas' in key) or ('gas or elec' in key) ) and value in (True, False):
+                matched = self._tags.get('elec', set()) | self._tags.get('gas', set())
+                if value == False:
+                    matched = everything - matched
+            elif value == True:
+                matched = self.has(key)
+            elif value == False:
+                matched = self.has(key)
+                matched = None if matched is None else everything - matched
+            elif ('id' in key):
+                matched = self.equals(key, str(value).lstrip('@'))
+            elif ('link' in key):
+                matched = self.equals(key, value)
+            elif ('combustionVolume' in key):
+                try:
+                    matched = self.equals(key, float(value))
+                except ValueError:
+                    return None
+            elif ('navName' in key):
+                matched = self.equals(key, value)
+            elif ('siteRef' in key):
+                matched = self.equals(key, str(value).lstrip('@'))
+            else:   # Not part of the composed query either
+                continue
+            if matched is None:
+                return None
+            selected = selected & matched
+        return [self.rows[position] for position in sorted(selected)]
+###############################################################################
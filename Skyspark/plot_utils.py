@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Headless rendering of meter comparison charts
+
+Module includes the following functions:
+plot_reads  Render the manual and Skyspark reads of one meter to an image file
+
+Charts are drawn on a matplotlib Figure without pyplot, so no window or
+global figure is created and each figure is freed once it is saved. The
+functions only take picklable arguments and can run in a process pool.
+
+Created on 2026-10-19
+
+@author: jrodriguez13
+"""
+import pandas as pd
+
+
+def plot_reads(result: pd.DataFrame, file_name: str) -> str:
+    """Render the bar chart of run_analysis_from_meta for one meter
+
+    Return file_name, or None without writing it if the meter has no reads.
+
+    Keyword arguments:
+    result    -- DataFrame with 'Manual Read' and 'Skyspark Read' columns, indexed by read date
+    file_name -- image file written, its extension sets the format (e.g. 'Link_28.75.png')
+    """
+    if result.empty:
+        return None
+    from matplotlib.figure import Figure    # Only needed when charts are rendered
+
+    fig = Figure(figsize=(22, 10))
+    ax = fig.subplots()
+    result.plot.bar(y=["Manual Read", "Skyspark Read"], rot=0, ax=ax)
+    fig.autofmt_xdate()
+    fig.savefig(file_name)
+    return file_name
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Incremental data quality metrics of SkySpark points, persisted between runs
+
+Each point keeps mergeable statistics of every sample seen so far: sample,
+valid, zero, flatline and outlier counts, the running mean and sum of
+squared deviations (merged with Chan's parallel update), the last sample and
+current flatline run, and its first and last valid timestamps. An update only
+reads the samples newer than the last one counted, so a daily refresh costs
+as much as a day of data.
+
+Outliers are counted against the mean and standard deviation of the history
+up to and including the update that brought them in; earlier samples are not
+counted again when the statistics move.
+
+Created on 2026-10-19
+
+@author: jrodriguez13
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import quality_utils
+
+
+class quality_state(object):
+
+###############################################################################
+    def __init__(self, path="quality_state.json", coeff=3):
+
+        """ Load the quality statistics stored in path, if any.
+
+        Parameters
+        ----------
+        path : str
+            JSON file holding the statistics of every point (default: "quality_state.json").
+        coeff : float
+            Standard deviations beyond which a sample is an outlier (default: 3).
+
+        """
+        self.path = path
+        self.coeff = coeff
+        self.points = {}
+        if os.path.exists(path):
+            with open(path, "r") as file_state:
+                self.points = json.load(file_state)
+        return
+
+###############################################################################
+    def last_time(self, key):
+
+        """ Return the timestamp of the last sample counted for a point, None if it has none. """
+        point = self.points.get(key)
+        return pd.Timestamp(point["last_time"]) if point and point["last_time"] else None
+
+###############################################################################
+    def update(self, key, series, name=None):
+
+        """ Count the samples of a series that are newer than the last sample counted for a point.
+
+        Parameters
+        ----------
+        key : str
+            Point key, e.g. its Ref.
+        series : pd.Series()
+            Samples of the point indexed by timestamp, NaN for missing samples.
+        name : str
+            Name of the point in the quality table (default: the series name).
+
+        """
+        point = self.points.setdefault(key, {"name": None, "rows": 0, "count": 0, "zeros": 0, "flatlines": 0,
+                                             "outliers": 0, "mean": 0.0, "m2": 0.0, "first_valid": None,
+                                             "last_valid": None, "last_time": None, "last_value": None,
+                                             "flat_run": 0})
+        point["name"] = str(name if name is not None else series.name)
+        if point["last_time"]:
+            series = series[series.index > pd.Timestamp(point["last_time"])]
+        if not len(series):
+            return
+        series = series.sort_index()
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+        valid = ~np.isnan(values)
+        count = int(valid.sum())
+
+        # Flatlines continue across updates, the previous last sample leads the new ones
+        previous = np.nan if point["last_value"] is None else point["last_value"]
+        equal = np.concatenate([[previous], values[:-1]]) == values
+        trailing = int(np.cumprod(equal[::-1]).sum())
+        point["flat_run"] = point["flat_run"] + trailing if trailing == len(values) else trailing
+        point["flatlines"] += int(equal.sum())
+        point["zeros"] += int((values == 0).sum())
+        point["rows"] += len(values)
+        point["last_value"] = None if np.isnan(values[-1]) else float(values[-1])
+        point["last_time"] = series.index[-1].isoformat()
+
+        if count:
+            # Chan's update of the running mean and sum of squared deviations
+            mean = values[valid].mean()
+            m2 = ((values[valid] - mean) ** 2).sum()
+            total = point["count"] + count
+            delta = mean - point["mean"]
+            point["mean"] += delta * count / total
+            point["m2"] += m2 + delta ** 2 * point["count"] * count / total
+            point["count"] = total
+
+            if total > 1:
+                std = np.sqrt(point["m2"] / (total - 1))
+                point["outliers"] += int((np.abs(values[valid] - point["mean"]) > self.coeff * std).sum())
+            times = series.index[valid]
+            point["first_valid"] = point["first_valid"] or times[0].isoformat()
+            point["last_valid"] = times[-1].isoformat()
+
+###############################################################################
+    def table(self, keys=None):
+
+        """ Return the data quality table of points, with the columns of data_quality_analysis and the
+        current flatline run of each point in 'flatline_run'.
+
+        Parameters
+        ----------
+        keys : list
+            Keys of the points in the table (default: every point).
+
+        Returns
+        -------
+        pd.DataFrame()
+            DataFrame containing the quality metrics of the points, indexed by their names.
+
+        """
+        points = [self.points[key] for key in (self.points if keys is None else keys) if key in self.points]
+
+        def column(name):
+            return np.array([point[name] for point in points], dtype="int64")
+
+        def times(name):
+            return [pd.Timestamp(point[name]) if point[name] else pd.NaT for point in points]
+
+        counts = {"count": column("count"), "missing": column("rows") - column("count"), "zeros": column("zeros"),
+                  "flatlines": column("flatlines"), "outliers": column("outliers")}
+        curr_sens = quality_utils.issue_table([point["name"] for point in points], times("first_valid"),
+                                              times("last_valid"), counts, column("rows"))
+        curr_sens["flatline_run"] = column("flat_run")
+        return curr_sens
+
+###############################################################################
+    def save(self):
+
+        """ Store the statistics, writing to a temporary file first so a crash never leaves a half written state. """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_name = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(temp_name, "w") as file_state:
+            json.dump(self.points, file_state)
+        os.replace(temp_name, self.path)
+###############################################################################
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Vectorized data quality metrics of meter time series
+
+Module includes the following functions:
+quality_counts      Count valid, missing, zero, flatline and outlier samples of every column in one kernel
+dominant_issue      Name the largest issue percentage of every column
+issue_table         Return the data quality table of counted points
+quality_table       Return the data quality table of the counts of quality_counts
+data_quality_frame  Return the data quality table of spyspark_client.data_quality_analysis
+
+The metrics are those of ts_util used by data_quality_analysis: missing samples
+are nulls, zeros equal 0, flatlines repeat the previous sample and outliers
+are more than coeff sample standard deviations from the column mean.
+Percentages are relative to the number of rows.
+
+Created on 2026-10-19
+
+@author: jrodriguez13
+"""
+import numpy as np
+import pandas as pd
+
+# Issue percentages in the order ties are resolved by dominant_issue
+ISSUE_COLUMNS = ["missing_perc", "zeroVal_perc", "flatline_perc", "outliersStdv_perc"]
+NO_ISSUE = "All percentages zero"
+
+
+def quality_counts(values: np.ndarray, coeff: float = 3) -> dict:
+    """Count the quality metrics of every column of a 2-D float array
+
+    Return a dictionary of 1-D arrays, one value per column: 'count',
+    'missing', 'zeros', 'flatlines', 'outliers', and 'first' and 'last', the
+    row positions of the first and last valid samples (-1 if none).
+
+    Keyword arguments:
+    values -- 2-D float array, rows are samples and NaN marks missing samples
+    coeff  -- standard deviations beyond which a sample is an outlier (default 3)
+    """
+    rows = values.shape[0]
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=0)
+    any_valid = count > 0
+    if rows:
+        first = np.where(any_valid, valid.argmax(axis=0), -1)
+        last = np.where(any_valid, rows - 1 - valid[::-1].argmax(axis=0), -1)
+    else:
+        first = last = np.full(values.shape[1], -1)
+
+    # NaN compares unequal, so missing samples are never zeros, flatlines or outliers
+    zeros = (values == 0).sum(axis=0)
+    flatlines = (values[1:] == values[:-1]).sum(axis=0)
+
+    filled = np.where(valid, values, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = filled.sum(axis=0) / count
+        deviation = np.abs(values - mean)
+        std = np.sqrt((np.where(valid, deviation, 0.0) ** 2).sum(axis=0) / (count - 1))
+        outliers = (deviation > coeff * std).sum(axis=0)
+
+    return {"count": count, "missing": rows - count, "zeros": zeros, "flatlines": flatlines,
+            "outliers": outliers, "first": first, "last": last}
+
+
+def dominant_issue(percents: np.ndarray) -> np.ndarray:
+    """Name the largest issue of every row of an array of ISSUE_COLUMNS percentages
+
+    Ties go to the first of ISSUE_COLUMNS, and rows whose percentages are all
+    zero are named NO_ISSUE.
+
+    Keyword arguments:
+    percents -- 2-D array with one column per ISSUE_COLUMNS
+    """
+    names = np.array(ISSUE_COLUMNS, dtype=object)[percents.argmax(axis=1)]
+    names[percents.max(axis=1) == 0] = NO_ISSUE
+    return names
+
+
+def issue_table(columns, first_valid, last_valid, counts: dict, rows) -> pd.DataFrame:
+    """Return the data quality table of counted points
+
+    Keyword arguments:
+    columns     -- point names, the rows of the table
+    first_valid -- timestamp of the first valid sample of each point (NaT if none)
+    last_valid  -- timestamp of the last valid sample of each point (NaT if none)
+    counts      -- dictionary of 'count', 'missing', 'zeros', 'flatlines' and 'outliers' arrays
+    rows        -- samples counted per point, a number or an array
+    """
+    rows = np.maximum(rows, 1)
+    curr_sens = pd.DataFrame(index=columns)
+    curr_sens["first_valid"] = list(first_valid)
+    curr_sens["last_valid"] = list(last_valid)
+    curr_sens["period_length"] = curr_sens["last_valid"] - curr_sens["first_valid"]
+    curr_sens["count"] = counts["count"]
+    curr_sens["missing_n"] = counts["missing"]
+    curr_sens["missing_perc"] = counts["missing"] / rows * 100
+    curr_sens["zeroVal_n"] = counts["zeros"]
+    curr_sens["zeroVal_perc"] = counts["zeros"] / rows * 100
+    curr_sens["flatline_n"] = counts["flatlines"]
+    curr_sens["flatline_perc"] = counts["flatlines"] / rows * 100
+    curr_sens["outliersStdv_n"] = counts["outliers"]
+    curr_sens["outliersStdv_perc"] = counts["outliers"] / rows * 100
+
+    percents = curr_sens[ISSUE_COLUMNS].to_numpy(dtype=float)
+    curr_sens["dominate_issue"] = dominant_issue(percents)
+    curr_sens["% ok"] = 100 - percents.sum(axis=1)
+    return curr_sens
+
+
+def quality_table(counts: dict, index: pd.Index, columns: pd.Index) -> pd.DataFrame:
+    """Return the data quality table of the counts of quality_counts
+
+    Keyword arguments:
+    counts  -- dictionary returned by quality_counts
+    index   -- time index of the counted frame, for the first and last valid timestamps
+    columns -- columns of the counted frame, the rows of the table
+    """
+    def at(positions):
+        if not len(index):
+            return pd.Series(pd.NaT, index=columns)
+        return pd.Series(index[np.maximum(positions, 0)], index=columns).where(positions >= 0)
+
+    return issue_table(columns, at(counts["first"]), at(counts["last"]), counts, len(index))
+
+
+def data_quality_frame(data: pd.DataFrame, coeff: float = 3) -> pd.DataFrame:
+    """Return the data quality table of every column of a time series DataFrame
+
+    Same columns as spyspark_client.data_quality_analysis, computed by
+    quality_counts on the frame's values instead of one pass per metric.
+
+    Keyword arguments:
+    data  -- DataFrame indexed by timestamp, one column per point
+    coeff -- standard deviations beyond which a sample is an outlier (default 3)
+    """
+    counts = quality_counts(data.to_numpy(dtype=float, na_value=np.nan), coeff=coeff)
+    return quality_table(counts, data.index, data.columns)
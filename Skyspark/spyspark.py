@@ -15,29 +15,80 @@ Last updated on 2019-03-12
 
 """
 import configparser
-import re
 import requests
 import urllib.parse
 import pandas as pd
+import numpy as np
 import json
 import datetime
 import threading
 import math
 import time
+import itertools
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
-from TS_Util_Clean_Data_test import ts_util
 import gspread
 from IPython.display import display
 import ipywidgets as widgets
 from oauth2client.service_account import ServiceAccountCredentials
 
 import scram
+import grid_utils
+import quality_utils
+import plot_utils
+from quality_state import quality_state
+from his_cache import his_cache
+from meta_index import meta_index
 
 # Define constants
 DEFAULT_URL = "http://skyspark.lbl.gov/api/lbnl/"
 CONFIG_FILE = "./spyspark.cfg"
 MAX_ATTEMPTS = 3
-tu = ts_util() # For data quality analysis
+MAX_WORKERS = 8 # Concurrent requests per client, also the size of the keep-alive connection pool
+STREAMED_FORMATS = ("text/zinc", "text/csv") # Response bodies decoded line by line as they arrive
+_NO_INITIAL = object() # Default initial of reduce_ts_from_meta, the fold starts from the first result
+
+# Bulk hisWrite: points per multi-point grid, timestamps per upload and timezone of naive indexes
+HIS_WRITE_POINTS = 50
+HIS_WRITE_ROWS = 10000
+HIS_WRITE_TZ = "America/Los_Angeles"
+
+# Batched hisRead: longest request URI, most points per batch and samples a batch may return,
+# assuming 1-minute points when sizing batches from the date range
+MAX_URL_LENGTH = 8000
+HIS_READ_BATCH_POINTS = 100
+HIS_READ_BATCH_SAMPLES = 2000000
+HIS_READ_SAMPLES_PER_DAY = 1440
+
+# Chunked hisRead: days of history per request and requests fetched ahead of the one being consumed, per worker
+HIS_READ_SPAN_DAYS = 31
+HIS_READ_AHEAD = 2
+
+# Incremental data quality: file holding the statistics of every point between runs
+QUALITY_STATE_FILE = "quality_state.json"
+
+# Rollup reads: aggregation functions and interval units of hisRollup
+HIS_ROLLUP_FUNCTIONS = ("sum", "avg", "min", "max", "count")
+HIS_ROLLUP_INTERVAL = re.compile(r'^\d+(?:\.\d+)?(?:min|hr|day|wk|mo|yr)$')
+
+# Pipeline sync: local_server address and days of history fetched and written per window
+PIPELINE_URL = "http://localhost:9000/"
+PIPELINE_SPAN_DAYS = 7
+PIPELINE_TIMEOUT = 600 # Seconds to wait on the local_server before a window counts as failed
+ELASTIC_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+ALC_URL_TIME_FORMAT = "%Y-%m-%d %I:%M:%S %p"
+
+# History cache: single point hisRead queries over a date range are served from the cache
+HIS_READ_QUERY = re.compile(r'^readAll\((?P<filter>.+)\)\.hisRead\(date\((?P<start>[\d\-, ]+)\)\.\.'
+                            r'date\((?P<end>[\d\-, ]+)\), \{limit: null\}\)$')
+POINT_FILTER = re.compile(r'^id==@(?P<ref>[A-Za-z0-9_:\-.~]+)$')
+
+# Metadata cache: records kept in the local snapshot that get_metadata filters are evaluated on, and the
+# markers a filter must require for all its matches to be in the snapshot
+METADATA_SNAPSHOT_FILTER = "site or equip or point"
+METADATA_SNAPSHOT_TAGS = ("site", "equip", "point")
 
 # Define global module variables, in particular config object
 config = configparser.ConfigParser()
@@ -52,16 +103,42 @@ class AxonException(Exception):
     pass
 
 
+# Exception raised by pipeline_sync once every window is synced if some could not be fetched. failed
+# lists the (point id, window start, window end) that were not written, written counts the values that were.
+class PipelineSyncException(Exception):
+    def __init__(self, message, failed, written):
+        Exception.__init__(self, message)
+        self.failed = failed
+        self.written = written
+
+
 class spyspark_client(object):
 
 ###############################################################################    
-    def __init__(self, URL=None):
+    def __init__(self, URL=None, max_workers=MAX_WORKERS, keep_tz=False, cache_dir=None, metadata_ttl=None):
 
         if URL:
             self.URL = URL
         else:
             self.URL  = host_addr
 
+        # keep-alive connections shared by every request of the client, one per worker thread
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._token_lock = threading.Lock()
+        # timezone aware time series index instead of naive wall clock time
+        self.keep_tz = keep_tz
+        # on-disk history cache, hisReads only fetch the days it does not cover yet
+        self.his_cache = his_cache(cache_dir, keep_tz=keep_tz) if cache_dir else None
+        # metadata snapshot, get_metadata filters it locally and it is reloaded every metadata_ttl seconds
+        self.metadata_ttl = metadata_ttl
+        self.meta_index = None
+        self._meta_checked = 0
+        self._meta_lock = threading.Lock()
+
         # authentication is now at the beginning when the class is instantiated
         self.volume_button = None
         self.rate_button = None
@@ -118,10 +195,60 @@ class spyspark_client(object):
         headers= {"authorization": "BEARER authToken="+self.auth_token,
                   "accept": result_type}
         try:
-            r = requests.get(request_uri, headers=headers)
-        except e:
-            print("Error in request: "+e)
-            return None
+            # Zinc and CSV grids are decoded line by line as they arrive
+            r = self.session.get(request_uri, headers=headers, stream=(result_type in STREAMED_FORMATS))
+        except requests.exceptions.RequestException as e:
+            print("Error in request: "+str(e))
+            raise
+        return r
+
+###############################################################################
+    def _refresh_token(self, used_header=None):
+        
+        """ Update the auth token shared by all requests of the client.
+        
+        Concurrent requests that are refused with the same token refresh it only once: a request
+        whose token was already replaced by another thread just picks up the new token.
+        
+        Parameters
+        ----------
+        used_header : str
+            Authorization header of the refused request. The token is always refreshed when None.
+            
+        """
+        with self._token_lock:
+            if used_header is None or used_header == "BEARER authToken="+self.auth_token:
+                scram.update_token()
+                self.auth_token = scram.current_token()
+
+###############################################################################
+    def _send_post(self, request_uri, body, result_type="application/json"):
+        
+        """ Send a Haystack JSON grid to a Skyspark op with a POST request.
+        
+        Parameters
+        ----------
+        request_uri : str
+            URI string of the Skyspark op (e.g. host address + "hisWrite").
+        body : str
+            Haystack JSON grid to send.
+        result_type : str
+            Resulting format of returned data (default: application/json).
+            
+        Returns
+        -------
+        r : requests.Response
+            Response from Skyspark, after one token refresh if the first attempt was not authorized.
+            
+        """
+        for i in range(0, MAX_ATTEMPTS):
+            headers = {"authorization": "BEARER authToken="+self.auth_token,
+                       "content-type": "application/json; charset=utf-8",
+                       "accept": result_type}
+            r = self.session.post(request_uri, data=body.encode("utf-8"), headers=headers)
+            if r.status_code != 403:
+                break
+            self._manage_errors(r, result_type) # Updates the auth token before the next attempt
         return r
 
 ###############################################################################
@@ -143,7 +270,7 @@ class spyspark_client(object):
             
         """
         if r.status_code == 200:
-            if r.text != "empty\n":
+            if result_type in STREAMED_FORMATS or r.text != "empty\n": # Body is left unread to be streamed
                 return
             else:
                 raise AxonException("Empty result, check query")
@@ -154,12 +281,46 @@ class spyspark_client(object):
         if r.status_code == 406:    # Invalid "accept" header
             raise Exception("Unsupported MIME type requested")
         if r.status_code == 403:    # Authorization issue, try to reauthorize
-            scram.update_token()
-            self.auth_token = scram.current_token() # added to save new auth_token in class variable
+            self._refresh_token(r.request.headers.get("authorization"))
 
         else:
             raise Exception("HTTP error: %d" % r.status_code)
 
+###############################################################################
+    def _check_empty(self, text):
+
+        """ Raise AxonException if a Zinc or CSV response body is SkySpark's empty result.
+        
+        Streamed bodies skip the check in _manage_errors, so it is made here on their first line.
+        
+        Parameters
+        ----------
+        text : str or iterable
+            Response body, or an iterable of its lines (e.g. r.iter_lines() of a streamed response).
+            
+        Returns
+        -------
+        str or iterable
+            The body, or an iterable of all its lines including the first one.
+            
+        Raises
+        -------
+        AxonException
+            If the body is 'empty\n'.
+            
+        """
+        if isinstance(text, str):
+            if text.rstrip("\r\n") == "empty":
+                raise AxonException("Empty result, check query")
+            return text
+
+        lines = iter(text)
+        first = next(lines, "")
+        first = first.decode("utf-8") if isinstance(first, bytes) else first
+        if first.rstrip("\r\n") == "empty":
+            raise AxonException("Empty result, check query")
+        return itertools.chain([first], lines)
+
 ###############################################################################
     def _parse_metadata_table_json(self, res):
         
@@ -200,43 +361,84 @@ class spyspark_client(object):
         
         ## get metadata info
         metadata = (pd.io.json.json_normalize(res["cols"][1:len(res["cols"])]))
-        ## transform json into dataframe (TODO: add example for documentation)
 
-        TSdata = (pd.io.json.json_normalize(res["rows"]))
+        ## build the columns straight from the grid rows, named by the id of each column
+        # timestamps: 't:2017-11-26T00:25:00-08:00 Los_Angeles', values: 'n:74.5999984741211 °F'
+        TSdata = grid_utils.his_grid_json(res, keep_tz=self.keep_tz)
+        if TSdata is None:
+            print("No time series data returned from query")
+            return None
+
+        if result_type == "both":
+            return metadata, TSdata
+        elif result_type == "ts": 
+            return TSdata
+
+###############################################################################
+    def _parse_TS_data_zinc(self, text, result_type):
         
+        """ Parse Zinc response body from get request if time series is returned.
         
-        ## format timestamp data inside the dataframe
-        # remove intial 't:' and final tz from timestamp: 't:2017-11-26T00:25:00-08:00 Los_Angeles',
-        pat = r"(t:)([0-9T\-:]{19})(.{3,})" # regex to separate into three groups
-        repl = lambda m: m.group(2) # take central group
-        try:
-            TSdata["ts"] = pd.to_datetime(TSdata["ts"].str.replace(pat, repl)) # change into datetime type and apply regex
-        except:
-            #raise Exception("No time series data returned from query")
+        Parameters
+        ----------
+        text : str or iterable
+            Zinc response body, or an iterable of its lines (e.g. r.iter_lines() of a streamed response).
+        result_type : str
+            Returned data that is request by user (ts for time series or both for time series and metadata).
+            
+        Returns
+        -------
+        pd.DataFrame()
+            DataFrame containing meter time series data and/or metadata from Skyspark 
+            
+        """
+        text = self._check_empty(text)
+        if result_type == "both":
+            # Column meta comes from the header, decode it before the rows are consumed
+            lines = grid_utils.zinc_lines(text)
+            header = [next(lines, ""), next(lines, "")]
+            metadata = pd.io.json.json_normalize(grid_utils.zinc_grid(header, header_only=True)["cols"][1:])
+            text = itertools.chain(header, lines)
+
+        TSdata = grid_utils.his_grid_zinc(text, keep_tz=self.keep_tz)
+        if TSdata is None:
             print("No time series data returned from query")
             return None
-        TSdata.set_index("ts", inplace=True, drop=True) # set datetime as index
-        #### need to do: need to correct for timezone!!!
-
-        ## format numerical values inside the dataframe
-        # remove intial 'n:' and final unit from value: 'n:74.5999984741211 °F',    
-        pat = r"(n:)([0-9\.]{1,})(\s.{2,})" # regex to separate into three groups
-        repl = lambda m: m.group(2) # take central group    
-        cols = TSdata.columns.tolist()
-        for col in cols:
-            TSdata[col] = pd.to_numeric(TSdata[col].str.replace(pat, repl),errors="coerce") # get value
-
-        ## rename columns based on id from the metadata
-        #regx = r"(\s)(.+)"
-        #test_str = res["cols"][1]["id"]
-        #matches = re.search(regx, test_str)
-        #matches.group(2)
-        #cols_name = res["cols"][1]["id"]
-        TSdata.columns = metadata.loc[metadata["name"].isin(TSdata.columns.tolist()),"id"].tolist()
-        
+
         if result_type == "both":
             return metadata, TSdata
-        elif result_type == "ts": 
+        elif result_type == "ts":
+            return TSdata
+
+###############################################################################
+    def _parse_TS_data_csv(self, text, result_type):
+        
+        """ Parse CSV response body from get request if time series is returned.
+        
+        CSV grids carry no column meta, so columns are named by their display names
+        and the metadata returned with "both" only holds those names.
+        
+        Parameters
+        ----------
+        text : str or iterable
+            CSV response body, or an iterable of its lines (e.g. r.iter_lines() of a streamed response).
+        result_type : str
+            Returned data that is request by user (ts for time series or both for time series and metadata).
+            
+        Returns
+        -------
+        pd.DataFrame()
+            DataFrame containing meter time series data and/or metadata from Skyspark 
+            
+        """
+        TSdata = grid_utils.his_grid_csv(self._check_empty(text), keep_tz=self.keep_tz)
+        if TSdata is None:
+            print("No time series data returned from query")
+            return None
+
+        if result_type == "both":
+            return pd.DataFrame({"dis": TSdata.columns.tolist()}), TSdata
+        elif result_type == "ts":
             return TSdata
 
 ###############################################################################
@@ -252,6 +454,8 @@ class spyspark_client(object):
             Requested MIME type in which to receive results (default: "text/csv" for CSV format).    
         result_type : str
             Returned data that is request by user (ts for time series or both for time series and metadata).
+            With "text/csv", "meta" (default) and "text" return the CSV text itself and "grid" returns it as a
+            DataFrame; with "application/json", "grid" returns the decoded grid.
             
         Returns
         -------
@@ -263,9 +467,16 @@ class spyspark_client(object):
         ## this method manages the different result_formats: csv, json, zinc
         ## csv
         if result_format == "text/csv":
-            text = re.sub('â\x9c\x93','True',r.text)    # Checkmarks
-            text = re.sub('Â','',text)
-            return text
+
+            r.encoding = "utf-8"    # Checkmarks and degree signs are UTF-8
+            if result_type == "text" or result_type == "meta":
+                return self._check_empty(r.text).replace(grid_utils.CSV_MARKER, "True")
+            elif result_type == "grid":
+                return grid_utils.csv_grid(self._check_empty(r.text))
+            elif result_type == "ts":
+                return self._parse_TS_data_csv(r.iter_lines(decode_unicode=True), result_type=result_type)
+            elif result_type == "both":
+                return self._parse_TS_data_csv(r.iter_lines(decode_unicode=True), result_type=result_type)
 
         ## json
         elif result_format == "application/json" :
@@ -278,11 +489,19 @@ class spyspark_client(object):
                 return self._parse_TS_data_json(res=res,result_type=result_type)
             elif result_type == "both":
                 return self._parse_TS_data_json(res=res,result_type=result_type)
+            elif result_type == "grid":
+                return res
 
-            ## TODO: add zinc
-            elif result_format == "text/zinc":
-                return r
-                
+        ## zinc
+        elif result_format == "text/zinc":
+
+            r.encoding = "utf-8"
+            if result_type == "meta":
+                return self._parse_metadata_table_json(grid_utils.zinc_grid(self._check_empty(r.text)))
+            elif result_type == "ts":
+                return self._parse_TS_data_zinc(r.iter_lines(decode_unicode=True), result_type=result_type)
+            elif result_type == "both":
+                return self._parse_TS_data_zinc(r.iter_lines(decode_unicode=True), result_type=result_type)
 
 
 ###############################################################################
@@ -305,9 +524,10 @@ class spyspark_client(object):
         query : str
             Axon query as string.
         result_format : str
-            Requested MIME type in which to receive results (default: "text/csv" for CSV format).
+            Requested MIME type in which to receive results: "application/json" (default), "text/zinc" or "text/csv".
         result_type : str
-            Requested return type of data (ts or meta).
+            Requested return type of data (ts, meta or both). With "text/csv", meta returns the CSV text and
+            grid returns it as a DataFrame.
             
         Returns
         -------
@@ -331,6 +551,9 @@ class spyspark_client(object):
             ## 3 - manage exceptions
             err = self._manage_errors(r, result_format)
 
+            if r.status_code == 403: # token refreshed, send again
+                continue
+
             if err:
                 return err
 
@@ -340,8 +563,7 @@ class spyspark_client(object):
                 try:
                     res= self._parse_results(r,result_format, result_type)
                 except ValueError:
-                    scram.update_token()
-                    self.auth_token = scram.current_token()
+                    self._refresh_token(r.request.headers.get("authorization"))
                     r = self._send_request(request_uri, result_format)
                     err = self._manage_errors(r, result_format)
 
@@ -400,6 +622,58 @@ class spyspark_client(object):
 
         return self.request(query=query, result_format=result_format, result_type=result_type)
 
+###############################################################################
+    def _his_read_point(self, ref, start, end):
+        
+        """ Return the history of one point between two days, fetching only the days not in the cache.
+        
+        Parameters
+        ----------
+        ref : str
+            Point Ref without the '@'.
+        start : datetime.date
+            First day of the range.
+        end : datetime.date
+            Last day of the range, included.
+            
+        Returns
+        -------
+        pd.DataFrame()
+            One column DataFrame indexed by timestamp, None if the point has no samples in the range.
+            
+        """
+        for span_start, span_end in self.his_cache.missing(ref, start, end):
+            span = 'date('+span_start.strftime('%Y-%m-%d')+')..date('+span_end.strftime('%Y-%m-%d')+')'
+            TSdata = self._hisRead('readAll(id==@'+ref+').hisRead('+span+', {limit: null})')
+            self.his_cache.put(ref, TSdata, span_start, span_end)
+        return self.his_cache.get(ref, start, end)
+
+###############################################################################
+    def _his_read_cached(self, match):
+        
+        """ Serve a readAll(id==@ref).hisRead(date(...)..date(...)) query from the history cache.
+        
+        Multi-point filters are not cached, so batched and concurrent reads keep their single hisRead.
+        
+        Parameters
+        ----------
+        match : re.Match
+            Match of the query with HIS_READ_QUERY.
+            
+        Returns
+        -------
+        pd.DataFrame()
+            One column DataFrame indexed by timestamp, None if the point has no samples.
+            
+        """
+        start = datetime.date(*[int(part) for part in re.split(r'[-,]\s*', match.group('start').strip())])
+        end = datetime.date(*[int(part) for part in re.split(r'[-,]\s*', match.group('end').strip())])
+
+        TSdata = self._his_read_point(POINT_FILTER.match(match.group('filter')).group('ref'), start, end)
+        if TSdata is None:
+            print("No time series data returned from query")
+        return TSdata
+
 ###############################################################################
     def read(self,):
 
@@ -415,9 +689,220 @@ class spyspark_client(object):
 
         return
 ###############################################################################
-    def hisWrite(self, query):
+    def _point_ref(self, column):
+
+        """ Return the bare Ref of a point from an id as returned by Skyspark ('r:1f2a... Dis', '@1f2a...' or '1f2a...'). """
+
+        ref = str(column).split(' ')[0]
+        if ref.startswith('r:'):
+            return ref[2:]
+        return ref.lstrip('@')
+
+###############################################################################
+    def hisWrite(self, data, units=None, tz=HIS_WRITE_TZ, batch_points=HIS_WRITE_POINTS, batch_rows=HIS_WRITE_ROWS):
      
-        return
+        """ Write time series into the histories of Skyspark points in bulk.
+        
+        Columns are written as multi-point Haystack grids of up to batch_points points, and every grid
+        is uploaded in chunks of up to batch_rows timestamps, so one call can load years of history.
+        Missing values are left out of the grid.
+        
+        Parameters
+        ----------
+        data : pd.DataFrame() or pd.Series()
+            Time series with a DatetimeIndex and one column per point, named by the point id as
+            returned by get_metadata ('r:1f2a... Dis') or as a Ref ('@1f2a...').
+        units : dictionary
+            Optional dictionary of {column -> unit} (e.g. {'@1f2a...': 'kWh'}) for points with a unit.
+        tz : str
+            Timezone of the points. Naive timestamps are taken to be in it (default: America/Los_Angeles).
+        batch_points : int
+            Number of points per grid (default: HIS_WRITE_POINTS).
+        batch_rows : int
+            Number of timestamps per upload (default: HIS_WRITE_ROWS).
+            
+        Returns
+        -------
+        written : int
+            Number of values written.
+            
+        """
+        if isinstance(data, pd.Series):
+            data = data.to_frame()
+        data = data[~data.index.duplicated(keep="last")].sort_index()
+        if data.empty:
+            return 0
+        units = units or {}
+
+        # Skyspark requires timestamps in the timezone of the points
+        if data.index.tz is None:
+            index = data.index.tz_localize(tz, ambiguous="infer", nonexistent="shift_forward")
+        else:
+            index = data.index.tz_convert(tz)
+        tz_name = tz.split('/')[-1]
+        times = ["t:" + t.isoformat() + " " + tz_name for t in index]
+
+        written = 0
+        columns = data.columns.tolist()
+        for first_point in range(0, len(columns), batch_points):
+            batch = columns[first_point:first_point+batch_points]
+            cols = [{"name": "ts"}]
+            values = []
+            for j, column in enumerate(batch):
+                cols.append({"name": "v%d" % j, "id": "r:" + self._point_ref(column)})
+                unit = " " + units[column] if column in units else ""
+                values.append(("v%d" % j, unit, data[column].astype(float).tolist()))
+
+            for first_row in range(0, len(times), batch_rows):
+                rows = []
+                for i in range(first_row, min(first_row+batch_rows, len(times))):
+                    row = {"ts": times[i]}
+                    for name, unit, column_values in values:
+                        value = column_values[i]
+                        if value != value: # Skip NaN
+                            continue
+                        if math.isinf(value):   # Haystack spells infinities INF and -INF
+                            row[name] = ("n:INF" if value > 0 else "n:-INF") + unit
+                        else:
+                            row[name] = "n:" + repr(value) + unit
+                    if len(row) > 1:
+                        rows.append(row)
+                if not rows:
+                    continue
+
+                grid = {"meta": {"ver": "3.0"}, "cols": cols, "rows": rows}
+                r = self._send_post(host_addr + "hisWrite", json.dumps(grid))
+                if r.status_code == 403:
+                    raise Exception("HTTP error: 403, authorization failed after %d attempts" % MAX_ATTEMPTS)
+                self._manage_errors(r, "application/json")
+                written += sum(len(row) - 1 for row in rows)
+
+        return written
+
+###############################################################################
+    def _fetch_pipeline(self, source, start, end, route="elastic", server=PIPELINE_URL):
+
+        """ Fetch one window of a point from a route of the HTTP pipeline local_server.
+        
+        Parameters
+        ----------
+        source : dict or str
+            ElasticSearch query without start and end for the elastic route, or trend log path for the alc route.
+        start : datetime.datetime
+            Start of the window (UTC for elastic, ALC server local time for alc).
+        end : datetime.datetime
+            End of the window, inclusive.
+        route : str
+            Pipeline route, 'elastic' or 'alc' (default: elastic).
+        server : str
+            Address of the local_server (default: PIPELINE_URL).
+            
+        Returns
+        -------
+        pd.Series()
+            Time series of the window, UTC aware for elastic and naive local time for alc, or None if
+            the window has no data.
+            
+        Raises
+        ------
+        Exception
+            The pipeline answered with an error status (503 when the upstream failed) or did not answer
+            within PIPELINE_TIMEOUT seconds.
+            
+        """
+        if route == "elastic":
+            query = dict(source, start=start.strftime(ELASTIC_TIME_FORMAT), end=end.strftime(ELASTIC_TIME_FORMAT))
+            parts = [json.dumps(query), "elastic"]
+        else:
+            parts = [source, start.strftime(ALC_URL_TIME_FORMAT), end.strftime(ALC_URL_TIME_FORMAT), "alc"]
+        request_uri = server + "?" + "?".join(urllib.parse.quote(part, safe="") for part in parts)
+
+        r = requests.get(request_uri, timeout=PIPELINE_TIMEOUT)
+        if r.status_code == 204:
+            return None
+        if not 200 <= r.status_code < 300:
+            raise Exception("Pipeline error %d for %s from %s to %s" % (r.status_code, source, start, end))
+
+        rows = r.json().get("value", [])
+        if not rows:
+            return None
+        values = pd.Series([row[1] for row in rows], index=pd.to_datetime([row[0] for row in rows]), dtype=float)
+        if route == "elastic" and values.index.tz is None:  # Timestamps without Z or an offset are UTC
+            values.index = values.index.tz_localize("UTC")
+        return values[~values.index.duplicated(keep="last")]
+
+###############################################################################
+    def pipeline_sync(self, points, date_range, route="elastic", span_days=PIPELINE_SPAN_DAYS, server=PIPELINE_URL,
+                      units=None, tz=HIS_WRITE_TZ):
+
+        """ Pull history from the HTTP pipeline local_server and push it straight into Skyspark with hisWrite.
+        
+        The date range is synced window by window of span_days, fetching every point of a window from
+        the pipeline and writing the window as bulk multi-point grids. A point whose window cannot be
+        fetched is skipped and the sync goes on; the windows that failed are raised at the end.
+        
+        Parameters
+        ----------
+        points : dictionary
+            Dictionary of {Skyspark point id -> source}, with the ElasticSearch query (without start and
+            end) as source for the elastic route or the trend log path for the alc route.
+        date_range : List
+            List containing start and end date strings (YYYY-MM-DD) of the days to sync, in UTC for the
+            elastic route and ALC server local time for the alc route.
+        route : str
+            Pipeline route, 'elastic' or 'alc' (default: elastic).
+        span_days : int
+            Days of history fetched and written per window (default: PIPELINE_SPAN_DAYS).
+        server : str
+            Address of the local_server (default: PIPELINE_URL).
+        units : dictionary
+            Optional dictionary of {Skyspark point id -> unit} passed to hisWrite.
+        tz : str
+            Timezone of the Skyspark points (default: America/Los_Angeles).
+            
+        Returns
+        -------
+        written : int
+            Number of values written.
+            
+        Raises
+        ------
+        PipelineSyncException
+            Some windows could not be fetched. Its failed attribute lists them as (point id, window
+            start, window end) to sync again, its written attribute counts the values written.
+            
+        """
+        start = datetime.datetime.strptime(date_range[0], '%Y-%m-%d')
+        end = datetime.datetime.strptime(date_range[1], '%Y-%m-%d') + datetime.timedelta(days=1)
+        span = datetime.timedelta(days=span_days)
+
+        written = 0
+        failed = []
+        window_start = start
+        while window_start < end:
+            window_end = min(window_start + span, end)
+            columns = {}
+            for point_id, source in points.items():
+                # Windows are inclusive on both ends, stop a second before the next window
+                try:
+                    values = self._fetch_pipeline(source, window_start, window_end - datetime.timedelta(seconds=1),
+                                                  route=route, server=server)
+                except Exception as e:
+                    print(e)
+                    failed.append((point_id, window_start, window_end))
+                    continue
+                if values is not None:
+                    columns[point_id] = values
+
+            if columns:
+                written += self.hisWrite(pd.DataFrame(columns), units=units, tz=tz)
+            print("Synced %s to %s: %d values written" % (window_start, window_end, written))
+            window_start = window_end
+
+        if failed:
+            raise PipelineSyncException("%d point windows could not be fetched from the pipeline, %d values written"
+                                        % (len(failed), written), failed, written)
+        return written
 ###############################################################################
 # Added functionality 7/10/18 @jbrodriguez@ucdavis.edu
     def query_data(self, query, result_type):
@@ -441,6 +926,102 @@ class spyspark_client(object):
         elif result_type == "ts":
             df = self._hisRead(query)
         return df
+###############################################################################
+    def _fetch_all(self, queries, function=None, max_workers=None):
+        
+        """ Run Axon queries concurrently on the client's pooled connections.
+        
+        Parameters
+        ----------
+        queries : list
+            List of Axon query strings.
+        function : callable
+            Optional function applied to each result in its worker thread (e.g. data_quality_analysis).
+        max_workers : int
+            Number of concurrent requests (default: the client's max_workers).
+            
+        Returns
+        -------
+        results : list
+            Results of the queries, in the order of queries.
+            
+        """
+        def fetch(query):
+            result = self.query(query)
+            return function(result) if function else result
+
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as executor:
+            return list(executor.map(fetch, queries))
+
+###############################################################################
+    def _fetch_iter(self, queries, function=None, max_workers=None, read_ahead=None):
+        
+        """ Run Axon queries concurrently and yield their results in order, with a bounded number in flight.
+        
+        Unlike _fetch_all, at most read_ahead results are fetched ahead of the one being consumed, so memory
+        is bounded by the size of a few results whatever the number of queries.
+        
+        Parameters
+        ----------
+        queries : iterable
+            Axon query strings.
+        function : callable
+            Optional function applied to each result in its worker thread (e.g. data_quality_analysis).
+        max_workers : int
+            Number of concurrent requests (default: the client's max_workers).
+        read_ahead : int
+            Most results fetched and not consumed yet (default: HIS_READ_AHEAD per worker).
+            
+        Yields
+        ------
+        result
+            Results of the queries, in the order of queries.
+            
+        """
+        def fetch(query):
+            result = self.query(query)
+            return function(result) if function else result
+
+        max_workers = max_workers or self.max_workers
+        read_ahead = max(read_ahead or HIS_READ_AHEAD * max_workers, 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = []
+            for query in queries:
+                pending.append(executor.submit(fetch, query))
+                if len(pending) >= read_ahead:
+                    yield pending.pop(0).result()
+            while pending:
+                yield pending.pop(0).result()
+
+###############################################################################
+    def _date_spans(self, start_date, end_date, span_days=HIS_READ_SPAN_DAYS):
+        
+        """ Split a date range into consecutive spans of at most span_days days.
+        
+        Parameters
+        ----------
+        start_date : str
+            First day, YYYY-MM-DD.
+        end_date : str
+            Last day, YYYY-MM-DD, included.
+        span_days : int
+            Most days per span (default: HIS_READ_SPAN_DAYS).
+            
+        Returns
+        -------
+        spans : list
+            List of Axon spans 'date(YYYY-MM-DD)..date(YYYY-MM-DD)' covering the range.
+            
+        """
+        start = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.datetime.strptime(end_date, '%Y-%m-%d').date()
+        spans = []
+        while start <= end:
+            span_end = min(start + datetime.timedelta(days=span_days - 1), end)
+            spans.append('date('+start.isoformat()+')..date('+span_end.isoformat()+')')
+            start = span_end + datetime.timedelta(days=1)
+        return spans
+
 ###############################################################################
     def _query_now(self, metadata):
         """ Private function to query Skyspark for timeseries data from metadata.
@@ -456,13 +1037,12 @@ class spyspark_client(object):
             Dataframe containing time series of current time (now).
             
         """
-        main_df = pd.DataFrame()
-        
-        for item in metadata['id']: # for each meter id in metadata dataframe, query for timeseries data and append to main dataframe
-            query = 'readAll(equipRef==@'+item.split(' ')[0][2:]+').hisRead(now, {limit: null})'
-            ts = self._hisRead(query)
-            main_df = main_df.append(ts)
-        return main_df 
+        # for each meter id in metadata dataframe, query for timeseries data and concatenate once at the end
+        queries = ['readAll(equipRef==@'+item.split(' ')[0][2:]+').hisRead(now, {limit: null})' for item in metadata['id']]
+        list_of_dfs = [ts for ts in self._fetch_all(queries) if ts is not None]
+        if not list_of_dfs:
+            return pd.DataFrame()
+        return pd.concat(list_of_dfs)
 ###############################################################################
     def get_metadata(self, tags):
         
@@ -545,8 +1125,56 @@ class spyspark_client(object):
                         
             query = query + ')'
             print(query) # Output composed query to user
+            # Only filters requiring site, equip or point are answered from the snapshot, others may match
+            # records outside of it. Empty local results are checked with the server as well.
+            if self.metadata_ttl is not None and any(tags.get(tag) == True for tag in METADATA_SNAPSHOT_TAGS):
+                rows = self._metadata_snapshot().select(tags)
+                if rows: # Otherwise a filter cannot be evaluated locally or matched nothing, ask the server
+                    return self._parse_metadata_table_json({"rows": rows})
             df = self._readAll(query)
             return df     
+###############################################################################
+    def refresh_metadata(self):
+        
+        """ Reload the metadata snapshot that get_metadata filters locally.
+        
+        Returns
+        -------
+        meta_index
+            Index of the records matching METADATA_SNAPSHOT_FILTER.
+            
+        """
+        with self._meta_lock:
+            return self._load_metadata()
+
+###############################################################################
+    def _load_metadata(self):
+        
+        """ Read every record of the snapshot from the server and index it. Called with _meta_lock held. """
+        res = self.request('readAll('+METADATA_SNAPSHOT_FILTER+')', result_type="grid")
+        self.meta_index = meta_index(res["rows"])
+        self._meta_checked = time.time()
+        return self.meta_index
+
+###############################################################################
+    def _metadata_snapshot(self):
+        
+        """ Return the metadata snapshot, loading it on first use.
+        
+        Once metadata_ttl seconds have passed since it was loaded, the snapshot is read again in full, so
+        records removed on the server also leave it.
+        
+        Returns
+        -------
+        meta_index
+            Index of the records matching METADATA_SNAPSHOT_FILTER.
+            
+        """
+        with self._meta_lock:
+            if self.meta_index is None or time.time() - self._meta_checked >= self.metadata_ttl:
+                return self._load_metadata()
+            return self.meta_index
+
 ###############################################################################
 # Function to create list of clickable options to exclude meters from analysis
     def show_clickable_options(self):
@@ -583,7 +1211,7 @@ class spyspark_client(object):
         display(self.raw_button)
 ###############################################################################
 # Function takes in dataframe of metadata information and returns timeseries data in dataframe format
-    def get_ts_from_meta(self, metadata, date_range, quality_check=False):
+    def get_ts_from_meta(self, metadata, date_range, quality_check=False, max_workers=None):
         
         """ Return time series data in specified range from given point OR return data quality results.
         
@@ -595,6 +1223,8 @@ class spyspark_client(object):
             List containing start and end date strings to set date range for time series query.
         quality_check : Boolean
             Boolean value to determine if running data quality analysis on data and to return results only. Default: False
+        max_workers : int
+            Number of meters fetched concurrently (default: the client's max_workers).
             
         Returns
         -------
@@ -603,26 +1233,288 @@ class spyspark_client(object):
         
         """
         
-        list_of_dfs = []
-        return_df = pd.DataFrame()
-        
         start_date = date_range[0]
         end_date = date_range[1]
         
-        if not quality_check:
-            for meter in metadata['id']: # for each meter id in metadata dataframe, query for timeseries data and append to main dataframe
-                query = 'readAll(id==@'+meter.split(' ')[0][2:]+').hisRead(date('+start_date+')..date('+end_date+'), {limit: null})'
-                timeseries = self.query(query)
-                list_of_dfs.append(timeseries)
+        # for each meter id in metadata dataframe, query for timeseries data, fetching several meters at once
+        queries = ['readAll(id==@'+meter.split(' ')[0][2:]+').hisRead(date('+start_date+')..date('+end_date+'), {limit: null})'
+                   for meter in metadata['id']]
         
+        if not quality_check:
+            list_of_dfs = self._fetch_all(queries, max_workers=max_workers)
         else:
-            for meter in metadata['id']: # for each meter id in metadata dataframe, query for timeseries data and append to main dataframe
-                query = 'readAll(id==@'+meter.split(' ')[0][2:]+').hisRead(date('+start_date+')..date('+end_date+'), {limit: null})'
-                timeseries = self.query(query)
-                data_quality_analysis_info = self.data_quality_analysis(timeseries)
-                list_of_dfs.append(data_quality_analysis_info)
+            list_of_dfs = self._fetch_all(queries, function=self.data_quality_analysis, max_workers=max_workers)
         return_df = pd.concat(list_of_dfs)
         return return_df
+###############################################################################
+    def iter_ts_from_meta(self, metadata, date_range, batch_size=1, function=None, max_workers=None, read_ahead=None):
+        
+        """ Yield time series data in specified range meter by meter, or batch by batch, as it arrives.
+        
+        Only the meters fetched ahead of the one being consumed are held in memory, so a whole fleet can be
+        processed in constant memory.
+        
+        Parameters
+        ----------
+        metadata : pd.DataFrame()
+            DataFrame containing meter metadata.
+        date_range : List
+            List containing start and end date strings to set date range for time series query.
+        batch_size : int
+            Points read per query, returned together as one wide DataFrame (default: 1).
+        function : callable
+            Optional function applied to each DataFrame in its worker thread (e.g. data_quality_analysis),
+            whose results are yielded instead.
+        max_workers : int
+            Number of queries fetched concurrently (default: the client's max_workers).
+        read_ahead : int
+            Most results fetched and not consumed yet (default: HIS_READ_AHEAD per worker).
+            
+        Yields
+        ------
+        pd.DataFrame()
+            DataFrame indexed by timestamp with one column per point of the meter or batch, or the result
+            of function. Meters without data in the range are skipped.
+        
+        """
+        refs = [meter.split(' ')[0][2:] for meter in metadata['id']]
+        queries = self._batch_queries(refs, 'date('+date_range[0]+')..date('+date_range[1]+')', batch_size=batch_size)
+
+        def apply(TSdata):
+            return function(TSdata) if function and TSdata is not None else TSdata
+
+        for result in self._fetch_iter(queries, function=apply, max_workers=max_workers, read_ahead=read_ahead):
+            if result is not None:
+                yield result
+
+###############################################################################
+    def reduce_ts_from_meta(self, metadata, date_range, function, combine=None, initial=_NO_INITIAL, batch_size=1,
+                            max_workers=None, read_ahead=None):
+        
+        """ Reduce the time series of a fleet of meters without holding them in memory together.
+        
+        function is applied to each meter's DataFrame as it arrives, and its results are folded with combine.
+        
+        Parameters
+        ----------
+        metadata : pd.DataFrame()
+            DataFrame containing meter metadata.
+        date_range : List
+            List containing start and end date strings to set date range for time series query.
+        function : callable
+            Function applied to each meter's (or batch's) DataFrame in its worker thread, e.g.
+            data_quality_analysis or lambda df: df.sum().
+        combine : callable
+            Optional function(accumulated, result) folding each result into the accumulated value. By default
+            the results are concatenated with pd.concat at the end.
+        initial : object
+            Initial accumulated value for combine, None included (default: the first result).
+        batch_size : int
+            Points read per query (default: 1).
+        max_workers : int
+            Number of queries fetched concurrently (default: the client's max_workers).
+        read_ahead : int
+            Most results fetched and not consumed yet (default: HIS_READ_AHEAD per worker).
+            
+        Returns
+        -------
+        object
+            Concatenated results, or the accumulated value of combine.
+        
+        """
+        results = self.iter_ts_from_meta(metadata, date_range, batch_size=batch_size, function=function,
+                                         max_workers=max_workers, read_ahead=read_ahead)
+        if combine is None:
+            list_of_results = list(results)
+            return pd.concat(list_of_results) if list_of_results else pd.DataFrame()
+
+        accumulated = initial
+        for result in results:
+            accumulated = result if accumulated is _NO_INITIAL else combine(accumulated, result)
+        return None if accumulated is _NO_INITIAL else accumulated
+
+###############################################################################
+    def _batch_queries(self, refs, span, batch_size=HIS_READ_BATCH_POINTS, suffix=''):
+        
+        """ Compose multi-point hisRead queries of the form readAll(id==@a or id==@b ...).hisRead(span).
+        
+        Parameters
+        ----------
+        refs : list
+            List of point Refs without the '@'.
+        span : str
+            Axon span passed to hisRead (e.g. 'date(2019-01-01)..date(2019-02-01)').
+        batch_size : int
+            Most points per query (default: HIS_READ_BATCH_POINTS). Batches are also cut so that the request
+            URI stays under MAX_URL_LENGTH.
+        suffix : str
+            Axon appended after the hisRead of each query (e.g. '.hisRollup(sum, 1day)').
+            
+        Returns
+        -------
+        queries : list
+            List of Axon query strings.
+            
+        """
+        tail = ').hisRead('+span+', {limit: null})'+suffix
+        base_length = len(self._compose_url('readAll(' + tail))
+        queries = []
+        batch = []
+        length = base_length
+        for ref in refs:
+            term = ('id==@' if not batch else ' or id==@') + ref
+            term_length = len(urllib.parse.quote(term))
+            if batch and (len(batch) >= batch_size or length + term_length > MAX_URL_LENGTH):
+                queries.append('readAll(' + ' or '.join('id==@' + item for item in batch) + tail)
+                batch = []
+                term_length = len(urllib.parse.quote('id==@' + ref))
+                length = base_length
+            batch.append(ref)
+            length += term_length
+        if batch:
+            queries.append('readAll(' + ' or '.join('id==@' + item for item in batch) + tail)
+        return queries
+###############################################################################
+    def get_ts_batched(self, metadata, date_range, batch_size=None, max_workers=None):
+        
+        """ Return time series data in specified range for all points in metadata as one wide DataFrame.
+        
+        Points are read several at a time with one readAll(id==@a or id==@b ...).hisRead(...) query per
+        batch instead of one query per point, and batches are fetched concurrently.
+        
+        Parameters
+        ----------
+        metadata : pd.DataFrame()
+            DataFrame containing meter metadata.
+        date_range : List
+            List containing start and end date strings to set date range for time series query.
+        batch_size : int
+            Most points per query. By default batches are sized so one response holds at most
+            HIS_READ_BATCH_SAMPLES samples of 1-minute data, up to HIS_READ_BATCH_POINTS points.
+        max_workers : int
+            Number of batches fetched concurrently (default: the client's max_workers).
+            
+        Returns
+        -------
+        pd.DataFrame()
+            DataFrame indexed by timestamp with one column per point id.
+        
+        """
+        start_date = date_range[0]
+        end_date = date_range[1]
+
+        if batch_size is None:
+            days = (datetime.datetime.strptime(end_date, '%Y-%m-%d') - datetime.datetime.strptime(start_date, '%Y-%m-%d')).days + 1
+            batch_size = int(HIS_READ_BATCH_SAMPLES / (max(days, 1) * HIS_READ_SAMPLES_PER_DAY))
+            batch_size = min(max(batch_size, 1), HIS_READ_BATCH_POINTS)
+
+        refs = [meter.split(' ')[0][2:] for meter in metadata['id']]
+        queries = self._batch_queries(refs, 'date('+start_date+')..date('+end_date+')', batch_size=batch_size)
+        list_of_dfs = [df for df in self._fetch_all(queries, max_workers=max_workers) if df is not None]
+        if not list_of_dfs:
+            return pd.DataFrame()
+        return pd.concat(list_of_dfs, axis=1).sort_index()
+###############################################################################
+    def get_ts_rollup(self, metadata, date_range, interval="1day", function="sum", batch_size=HIS_READ_BATCH_POINTS,
+                      max_workers=None):
+        
+        """ Return time series data in specified range rolled up by SkySpark into fixed intervals.
+        
+        Each query is readAll(...).hisRead(...).hisRollup(function, interval), so samples are aggregated on the
+        server and only one row per interval is transferred and parsed.
+        
+        Parameters
+        ----------
+        metadata : pd.DataFrame()
+            DataFrame containing meter metadata.
+        date_range : List
+            List containing start and end date strings to set date range for time series query.
+        interval : str
+            Axon duration of the rollup intervals, e.g. '15min', '1hr', '1day' or '1mo' (default: '1day').
+        function : str
+            Aggregation of each interval: 'sum', 'avg', 'min', 'max' or 'count' (default: 'sum').
+        batch_size : int
+            Most points per query (default: HIS_READ_BATCH_POINTS).
+        max_workers : int
+            Number of batches fetched concurrently (default: the client's max_workers).
+            
+        Returns
+        -------
+        pd.DataFrame()
+            DataFrame indexed by the start of each interval with one column per point id.
+        
+        """
+        if function not in HIS_ROLLUP_FUNCTIONS:
+            raise ValueError("Rollup function must be one of "+", ".join(HIS_ROLLUP_FUNCTIONS))
+        if not HIS_ROLLUP_INTERVAL.match(interval):
+            raise ValueError("Rollup interval must be an Axon duration such as 15min, 1hr, 1day or 1mo")
+
+        refs = [meter.split(' ')[0][2:] for meter in metadata['id']]
+        queries = self._batch_queries(refs, 'date('+date_range[0]+')..date('+date_range[1]+')', batch_size=batch_size,
+                                      suffix='.hisRollup('+function+', '+interval+')')
+        list_of_dfs = [df for df in self._fetch_all(queries, max_workers=max_workers) if df is not None]
+        if not list_of_dfs:
+            return pd.DataFrame()
+        return pd.concat(list_of_dfs, axis=1).sort_index()
+
+###############################################################################
+    def get_ts_chunked(self, metadata, date_range, span_days=HIS_READ_SPAN_DAYS, max_workers=None, out_dir=None):
+        
+        """ Return time series data in specified range for all points in metadata, read span_days at a time.
+        
+        Long ranges are split into spans of span_days days, read with one hisRead per point and span, several
+        at a time. Only a few spans are held in memory besides the result, and none at all with out_dir, so
+        SkySpark never builds one grid of the whole range and the client never parses one.
+        
+        Parameters
+        ----------
+        metadata : pd.DataFrame()
+            DataFrame containing meter metadata.
+        date_range : List
+            List containing start and end date strings to set date range for time series query.
+        span_days : int
+            Days of history per request (default: HIS_READ_SPAN_DAYS).
+        max_workers : int
+            Number of spans fetched concurrently (default: the client's max_workers).
+        out_dir : str
+            Optional directory where each point's spans are appended, in order, to '<point ref>.csv'
+            instead of being returned.
+            
+        Returns
+        -------
+        pd.DataFrame()
+            DataFrame indexed by timestamp with one column per point id, or with out_dir the list of CSV
+            file names written.
+        
+        """
+        refs = [meter.split(' ')[0][2:] for meter in metadata['id']]
+        spans = self._date_spans(date_range[0], date_range[1], span_days)
+        queries = ('readAll(id==@'+ref+').hisRead('+span+', {limit: null})' for ref in refs for span in spans)
+        results = self._fetch_iter(queries, max_workers=max_workers)
+
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+            file_names = []
+            for ref in refs:
+                file_name = os.path.join(out_dir, ref.replace(':', '_')+'.csv')
+                header = True
+                for span in spans:
+                    TSdata = next(results)
+                    if TSdata is not None:
+                        TSdata.to_csv(file_name, mode='w' if header else 'a', header=header)
+                        header = False
+                if not header:
+                    file_names.append(file_name)
+            return file_names
+
+        list_of_dfs = []
+        for ref in refs:
+            chunks = [TSdata for TSdata in (next(results) for span in spans) if TSdata is not None]
+            if chunks:
+                list_of_dfs.append(pd.concat(chunks) if len(chunks) > 1 else chunks[0])
+        if not list_of_dfs:
+            return pd.DataFrame()
+        return pd.concat(list_of_dfs, axis=1).sort_index()
 ############################################################################### 
 # Function is to take in dataframe column (Accumulator, Raw) from gas meters and check if interval data is correct
 # If intervals are fine, returns original frame, else returns reindexed dataframe based on reasoned interval
@@ -685,21 +1577,8 @@ class spyspark_client(object):
             DataFrame containing meter metrics and values achieved for each test.
             
         """
-        curr_sens= pd.DataFrame()
-        curr_sens["first_valid"] = tu.first_valid_per_col(data)
-        curr_sens["last_valid"] = tu.last_valid_per_col(data)
-        curr_sens["period_length"] = curr_sens["last_valid"] - curr_sens["first_valid"]
-        curr_sens["count"] = data.count()
-        curr_sens["missing_n"] = tu.count_missing(data, output="number")
-        curr_sens["missing_perc"] = tu.count_missing(data, output="percent")
-        curr_sens["zeroVal_n"] = tu.count_if(data, operator="=", val=0, output="number")
-        curr_sens["zeroVal_perc"] = tu.count_if(data, operator="=", val=0, output="percent")
-        curr_sens["flatline_n"] = tu.count_flatlines(data, output="number")
-        curr_sens["flatline_perc"] = tu.count_flatlines(data, output="percent")
-        curr_sens["outliersStdv_n"] = tu.count_outliers(data,method="std",coeff=3)
-        curr_sens["outliersStdv_perc"] = tu.count_outliers(data,method="std",coeff=3,output="percent")
-        curr_sens["dominate_issue"] = curr_sens.apply(self._find_dominate_issue, axis=1)
-        curr_sens["% ok"] = curr_sens.apply(self._find_percent_ok, axis=1)
+        # Every metric of every column is computed in one vectorized kernel, with the ts_util definitions
+        curr_sens = quality_utils.data_quality_frame(data)
 
         return curr_sens    
 ###############################################################################
@@ -785,6 +1664,65 @@ class spyspark_client(object):
             dateList.append(value.replace(" ",""))
             
         return dateList
+###############################################################################
+    def _manual_read_index(self, link_num_list):
+        
+        """ Helper function to run_analysis_from_meta() to index manual reads by link number and date.
+        
+        Parameters
+        ----------
+        link_num_list : list
+            Rows of the manual read worksheet: date, link number, ..., read in column 5.
+            
+        Returns
+        -------
+        manual_reads : dictionary
+            Dictionary of {(link number, pd.Timestamp of the read date) -> read}. Rows whose date or read
+            cannot be parsed, like the header, are left out; when a link is read twice on a date the last
+            row is kept.
+            
+        """
+        manual_reads = {}
+        for row in link_num_list:
+            try:
+                manual_reads[(row[1], pd.Timestamp(pd.to_datetime(row[0])))] = float(row[4].replace(',',''))
+            except (ValueError, TypeError, IndexError):
+                continue
+        return manual_reads
+
+###############################################################################
+    def _interval_sums(self, series, months_list):
+        
+        """ Helper function to run_analysis_from_meta() to sum a series between consecutive read dates.
+        
+        Each interval runs from 12:15:00 on a read date to 12:00:00 on the next one, both included. Sums are
+        differences of the cumulative sum at the interval bounds, found with searchsorted.
+        
+        Parameters
+        ----------
+        series : pd.Series()
+            Time series to sum, e.g. a meter's energy column.
+        months_list : list
+            Read dates with form mm/dd/YYYY, in order.
+            
+        Returns
+        -------
+        sums : np.array
+            Sum of each of the len(months_list) - 1 intervals, 0 for intervals without samples.
+            
+        """
+        if not series.index.is_monotonic_increasing:
+            series = series.sort_index()
+        dates = pd.DatetimeIndex([datetime.datetime.strptime(date, '%m/%d/%Y') for date in months_list])
+        starts = dates[:-1] + pd.Timedelta(hours=12, minutes=15)
+        ends = dates[1:] + pd.Timedelta(hours=12)
+        if series.index.tz is not None:
+            starts = starts.tz_localize(series.index.tz)
+            ends = ends.tz_localize(series.index.tz)
+
+        cumulative = np.concatenate([[0.0], np.nancumsum(series.to_numpy(dtype=float, na_value=np.nan))])
+        return cumulative[series.index.searchsorted(ends, side='right')] - cumulative[series.index.searchsorted(starts, side='left')]
+
 ###############################################################################
 # Helper function to build query string with appropriate return points specified
     def _construct_query(self, link_number, start_date, end_date):
@@ -805,14 +1743,15 @@ class spyspark_client(object):
             String representation of query used to retrieve data from Skyspark
             
         """
+        # Options left out when show_clickable_options() was not called, e.g. in headless runs
         ignored_points = []
-        if self.volume_button.value:
+        if self.volume_button is not None and self.volume_button.value:
             ignored_points.append("volume")
-        if self.rate_button.value:
+        if self.rate_button is not None and self.rate_button.value:
             ignored_points.append("rate")
-        if self.power_button.value:
+        if self.power_button is not None and self.power_button.value:
             ignored_points.append("power")
-        if self.raw_button.value:
+        if self.raw_button is not None and self.raw_button.value:
             ignored_points.append("raw")
         
         query = 'readAll(equipRef->link=="'+link_number+'"'
@@ -851,80 +1790,18 @@ class spyspark_client(object):
             
         """
         # Holding dataframes
-        data_quality_df = pd.DataFrame()
+        list_of_quality = []
         comparison_df = pd.DataFrame()
-        
-            # GoogleSheets imports
-        scope = ['https://spreadsheets.google.com/feeds'] # Keep this as the scope
-        credentials = ServiceAccountCredentials.from_json_keyfile_name('My Project-01d0ad43c251.json',scope) # Json comes from Google API                                                    # page. Can just use my email on API page from this to access spreadsheets
-        gc = gspread.authorize(credentials)
-        
-        Spreadsheet = gc.open_by_url(Sheets_url)
-        worksheet = Spreadsheet.get_worksheet(0)
-        months_list = self.get_dates_list(worksheet,month_range)
-        link_num_list = worksheet.get_all_values()
- 
-        last_month_index = (len(months_list)-1)
-        date_time_start = datetime.datetime.strptime(months_list[0], '%m/%d/%Y').strftime('%Y,%m,%d')
-        date_time_end = datetime.datetime.strptime(months_list[last_month_index], '%m/%d/%Y').strftime('%Y,%m,%d')
+        months_list, manual_reads = self._load_manual_reads(Sheets_url, month_range)
         
         for item in metadata['link']: # For each link number in list
-           
-            if not math.isnan(float(item)):
-                link_float = "{:.2f}".format(float(item)) # Need float to retain 2 past decimal point precision
-                single_point_query = self._construct_query(item, date_time_start, date_time_end)
-                info_get = self.query(single_point_query)
-                time_dict = {}
-                manual_read_value = {}
-                skyspark_value = {}
-                energy_column = ""
-                multiplier = 0 # Need multiplier for Skyspark energy data for gas and water
-                
-                for meter in info_get.columns:
-                    if 'BTU' in meter:
-                        multiplier = pow(10,5)
-                        break
-                    elif 'kWh' in meter:
-                        multiplier = 1
-                        break
-                    
-                for column in info_get.columns:
-                    if("Energy" in column and "Accumulator" not in column):
-                        energy_column = column
-
-                for k,i in enumerate(months_list):
-                    #do something with index k
-                    #do something with element i # taking list of dates needed for comparison
-                    if k > (last_month_index - 1):
-                        break
-                    try:
-                        timeStart = i + " 12:15:00"
-                        timeEnd = months_list[k+1] + " 12:00:00"
-                        
-                        ts_data = info_get[energy_column].to_frame()[timeStart : timeEnd]
-                        ts_data = (float(ts_data.sum()[0])) / multiplier # Multiplier = 1 for electricity meters and 10^5 for gas meters
-                        for row in link_num_list:
-                            if row[1] == link_float:
-                                
-                                if pd.to_datetime(row[0]) == datetime.datetime.strptime(months_list[k+1], '%m/%d/%Y'):
-                                    time_dict[months_list[k+1]] = ((float(row[4].replace(',','')) - ts_data) /                                                                                          float(row[4].replace(',',''))) * 100 # Percent different
-                                    manual_read_value[months_list[k+1]] = float(row[4].replace(',',''))
-                                    skyspark_value[months_list[k+1]] = ts_data
-                                    
-
-                    except:
-                        print("Error for data: "+i+" on meter "+item)
+            compared = self._compare_meter(item, months_list, manual_reads)
+            if compared is None:
+                continue
+            result, data_quality_analysis_info = compared
 
             try:
-                data_quality_analysis_info = self.data_quality_analysis(info_get)
-                data_quality_df = data_quality_df.append(data_quality_analysis_info)
-
-                percent_difference = pd.DataFrame(time_dict, index=[0]).T.rename( columns={0:"Percent Dif"})
-                manual_read_dict = pd.DataFrame(manual_read_value, index=[0]).T.rename( columns={0:"Manual Read"})
-                skyspark_dict = pd.DataFrame(skyspark_value, index=[0]).T.rename( columns={0:"Skyspark Read"})
-                result = pd.concat([manual_read_dict, skyspark_dict, percent_difference], axis=1)
-                result.index = pd.to_datetime(result.index, format="%m/%d/%Y")
-                result = result.sort_index()
+                list_of_quality.append(data_quality_analysis_info)
                 comparison_df[item] = result["Percent Dif"]
                 barplot = result.plot.bar(y=["Manual Read", "Skyspark Read"], rot=0, figsize=(22,10))
                 fig = barplot.get_figure()
@@ -938,20 +1815,220 @@ class spyspark_client(object):
             except:    
                     print("Error on link number: "+item)
                     
+        data_quality_df = pd.concat(list_of_quality) if list_of_quality else pd.DataFrame()
+        comparison_df.index = pd.to_datetime(comparison_df.index)
+        comparison_df = comparison_df.sort_index()
+        return comparison_df, data_quality_df
+###############################################################################
+    def run_analysis_batch(self, metadata, Sheets_url, month_range, output_dir=None, plot=True, max_workers=None,
+                           processes=None):
+        
+        """ Run meter comparison and data quality analysis on meters in metadata DataFrame, headless and in parallel.
+        
+        Meters are fetched and compared concurrently and only their numeric results are kept during the run. With
+        output_dir, each meter's reads are then written to CSV and, with plot, rendered to PNG without pyplot, so
+        no figure stays open and memory does not grow with the number of meters.
+        
+        Parameters
+        ----------
+        metadata : pd.DataFrame()
+            DataFrame containing meter metadata.  
+        Sheets_url : String
+            String of the url that points to the Google Sheets document that contains manual read data.
+        month_range : List
+            List containing start and end date Strings to set date range for analysis.
+        output_dir : String
+            Optional directory where 'Link_<link>_Reads.csv' and 'Link_<link>.png' are written for each meter.
+        plot : Boolean
+            Render the PNG charts into output_dir (default is True).
+        max_workers : int
+            Number of meters fetched and compared concurrently (default: the client's max_workers).
+        processes : int
+            Number of processes rendering charts (default: render in this process).
+            
+        Returns
+        -------
+        comparison_df : pd.DataFrame()
+            DataFrame containing all meter's comparison information for given time frame.
+            
+        data_quality_df : pd.DataFrame()
+            DataFrame containing all meter's data quality analysis information for given time frame.
+            
+        """
+        months_list, manual_reads = self._load_manual_reads(Sheets_url, month_range)
+        links = metadata['link'].tolist()
+        def compare(item):
+            try:
+                return self._compare_meter(item, months_list, manual_reads)
+            except Exception as e: # Keep an unattended run going
+                print("Error on link number: "+str(item)+": "+str(e))
+                return None
+
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as executor:
+            results = list(executor.map(compare, links))
+
+        comparison_df = pd.DataFrame()
+        list_of_quality = []
+        charts = []
+        for item, compared in zip(links, results):
+            if compared is None:
+                continue
+            result, data_quality_analysis_info = compared
+            list_of_quality.append(data_quality_analysis_info)
+            comparison_df[item] = result["Percent Dif"]
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+                link_string = os.path.join(output_dir, "Link_"+str(item))
+                result.to_csv(link_string+"_Reads.csv")
+                charts.append((result, link_string+".png"))
+
+        # Charts are only rendered once every meter is compared
+        if plot and charts:
+            with ProcessPoolExecutor(max_workers=processes) if processes else ThreadPoolExecutor(max_workers=1) as executor:
+                futures = [executor.submit(plot_utils.plot_reads, result, file_name) for result, file_name in charts]
+                for future, (result, file_name) in zip(futures, charts):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        print("Error plotting "+file_name+": "+str(e))
+
+        data_quality_df = pd.concat(list_of_quality) if list_of_quality else pd.DataFrame()
         comparison_df.index = pd.to_datetime(comparison_df.index)
         comparison_df = comparison_df.sort_index()
         return comparison_df, data_quality_df
 ###############################################################################
-    def nersc_data_quality(self, metadata, date_range):
+    def _load_manual_reads(self, Sheets_url, month_range):
+        
+        """ Helper function to load the read dates and indexed manual reads of the Google Sheets document.
+        
+        Parameters
+        ----------
+        Sheets_url : String
+            String of the url that points to the Google Sheets document that contains manual read data.
+        month_range : List
+            List containing start and end date Strings to set date range for analysis.
+            
+        Returns
+        -------
+        months_list : list
+            List containing dates for given range data analysis will be ran on.
+        manual_reads : dictionary
+            Dictionary of {(link number, read date) -> read} from _manual_read_index().
+            
+        """
+            # GoogleSheets imports
+        scope = ['https://spreadsheets.google.com/feeds'] # Keep this as the scope
+        credentials = ServiceAccountCredentials.from_json_keyfile_name('My Project-01d0ad43c251.json',scope) # Json comes from Google API                                                    # page. Can just use my email on API page from this to access spreadsheets
+        gc = gspread.authorize(credentials)
+        
+        Spreadsheet = gc.open_by_url(Sheets_url)
+        worksheet = Spreadsheet.get_worksheet(0)
+        months_list = self.get_dates_list(worksheet,month_range)
+        manual_reads = self._manual_read_index(worksheet.get_all_values())
+        return months_list, manual_reads
+###############################################################################
+    def _compare_meter(self, item, months_list, manual_reads):
+        
+        """ Helper function to compare one meter's Skyspark energy with its manual reads and analyze its data quality.
+        
+        Parameters
+        ----------
+        item : String
+            Link number of the meter.
+        months_list : list
+            Read dates with form mm/dd/YYYY, in order.
+        manual_reads : dictionary
+            Dictionary of {(link number, read date) -> read} from _manual_read_index().
+            
+        Returns
+        -------
+        result : pd.DataFrame()
+            DataFrame of the manual read, Skyspark read and percent difference of each read date.
+        data_quality_analysis_info : pd.DataFrame()
+            DataFrame containing the meter's data quality analysis. None is returned instead of both for
+            meters without a link number or whose comparison failed.
+            
+        """
+        if math.isnan(float(item)):
+            return None
+
+        last_month_index = (len(months_list)-1)
+        date_time_start = datetime.datetime.strptime(months_list[0], '%m/%d/%Y').strftime('%Y,%m,%d')
+        date_time_end = datetime.datetime.strptime(months_list[last_month_index], '%m/%d/%Y').strftime('%Y,%m,%d')
+        link_float = "{:.2f}".format(float(item)) # Need float to retain 2 past decimal point precision
+        single_point_query = self._construct_query(item, date_time_start, date_time_end)
+        info_get = self.query(single_point_query)
+        time_dict = {}
+        manual_read_value = {}
+        skyspark_value = {}
+        energy_column = ""
+        multiplier = 0 # Need multiplier for Skyspark energy data for gas and water
+        
+        for meter in info_get.columns:
+            if 'BTU' in meter:
+                multiplier = pow(10,5)
+                break
+            elif 'kWh' in meter:
+                multiplier = 1
+                break
+            
+        for column in info_get.columns:
+            if("Energy" in column and "Accumulator" not in column):
+                energy_column = column
+
+        # Energy of every interval between reads, from 12:15 on a read day to 12:00 on the next, in one pass
+        try:
+            interval_sums = self._interval_sums(info_get[energy_column], months_list)
+        except Exception:
+            interval_sums = None
+
+        for k,i in enumerate(months_list[:last_month_index]):
+            try:
+                ts_data = float(interval_sums[k]) / multiplier # Multiplier = 1 for electricity meters and 10^5 for gas meters
+                read = manual_reads.get((link_float, pd.Timestamp(datetime.datetime.strptime(months_list[k+1], '%m/%d/%Y'))))
+                if read is not None:
+                    time_dict[months_list[k+1]] = ((read - ts_data) / read) * 100 # Percent different
+                    manual_read_value[months_list[k+1]] = read
+                    skyspark_value[months_list[k+1]] = ts_data
+
+            except:
+                print("Error for data: "+i+" on meter "+item)
+
+        try:
+            data_quality_analysis_info = self.data_quality_analysis(info_get)
+
+            percent_difference = pd.DataFrame(time_dict, index=[0]).T.rename( columns={0:"Percent Dif"})
+            manual_read_dict = pd.DataFrame(manual_read_value, index=[0]).T.rename( columns={0:"Manual Read"})
+            skyspark_dict = pd.DataFrame(skyspark_value, index=[0]).T.rename( columns={0:"Skyspark Read"})
+            result = pd.concat([manual_read_dict, skyspark_dict, percent_difference], axis=1)
+            result.index = pd.to_datetime(result.index, format="%m/%d/%Y")
+            result = result.sort_index()
+            return result, data_quality_analysis_info
+
+        except:
+            print("Error on link number: "+item)
+            return None
+###############################################################################
+    def nersc_data_quality(self, metadata, date_range, processes=None, max_workers=None, progress=False):
         
         """ Run data quality analysis on Nersc meters for given range and return results
         
+        Meters are fetched on a thread pool while the quality kernel runs on a process pool. Only the value
+        arrays are sent to the processes and only the counts come back; the tables are assembled here.
+        
         Parameters
         ----------
         metadata : pd.DataFrame()
             DataFrame containing meter metadata.
         date_range : List
             List containing start and end date strings to set date range for time series query.
+        processes : int
+            Number of processes running the quality kernel (default: one per core). With 0 the kernel runs
+            in the fetching threads.
+        max_workers : int
+            Number of meters fetched concurrently (default: the client's max_workers).
+        progress : Boolean or callable
+            Print the number of meters analyzed, or call progress(done, total) after each meter (default: False).
             
         Returns
         -------
@@ -959,8 +2036,89 @@ class spyspark_client(object):
             DataFrame containing data quality results for points in metadata.
         
         """
-        return self.get_ts_from_meta(metadata, date_range, quality_check=True)
+        start_date = date_range[0]
+        end_date = date_range[1]
+        queries = ['readAll(id==@'+meter.split(' ')[0][2:]+').hisRead(date('+start_date+')..date('+end_date+'), {limit: null})'
+                   for meter in metadata['id']]
+        total = len(queries)
+        if progress is True:
+            progress = lambda done, total: print("Data quality: %d/%d meters" % (done, total))
+        list_of_dfs = []
+        pending = []
+        done = 0
+
+        def report(table=None):
+            nonlocal done
+            if table is not None:
+                list_of_dfs.append(table)
+            done += 1
+            if progress:
+                progress(done, total)
+
+        processes = (os.cpu_count() or 1) if processes is None else processes
+        executor = ProcessPoolExecutor(max_workers=processes) if processes else None
+        try:
+            for TSdata in self._fetch_iter(queries, max_workers=max_workers):
+                if TSdata is None: # No data in the range
+                    report()
+                elif executor is None:
+                    report(self.data_quality_analysis(TSdata))
+                else:
+                    values = TSdata.to_numpy(dtype=float, na_value=np.nan)
+                    pending.append((executor.submit(quality_utils.quality_counts, values), TSdata.index, TSdata.columns))
+                # Collect finished counts, fetching waits while too many frames are queued for the processes
+                while pending and (len(pending) > 2 * processes or pending[0][0].done()):
+                    future, index, columns = pending.pop(0)
+                    report(quality_utils.quality_table(future.result(), index, columns))
+            for future, index, columns in pending:
+                report(quality_utils.quality_table(future.result(), index, columns))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return pd.concat(list_of_dfs) if list_of_dfs else pd.DataFrame()
             
+###############################################################################
+    def update_data_quality(self, metadata, start_date, state_file=QUALITY_STATE_FILE, end_date=None, max_workers=None):
+        
+        """ Update the stored data quality statistics of points with their new samples and return their results.
+        
+        Each point is only read from the day of the last sample already counted, or from start_date the first
+        time, so a daily run costs about as much as a day of data.
+        
+        Parameters
+        ----------
+        metadata : pd.DataFrame()
+            DataFrame containing meter metadata.
+        start_date : str
+            First day read for points without stored statistics, YYYY-MM-DD.
+        state_file : str
+            JSON file holding the statistics between runs (default: QUALITY_STATE_FILE).
+        end_date : str
+            Last day read, YYYY-MM-DD (default: today).
+        max_workers : int
+            Number of points fetched concurrently (default: the client's max_workers).
+            
+        Returns
+        -------
+        pd.DataFrame()
+            DataFrame containing data quality results for points in metadata, over every sample counted so far.
+        
+        """
+        state = quality_state(state_file)
+        end_date = end_date or datetime.date.today().isoformat()
+        refs = [meter.split(' ')[0][2:] for meter in metadata['id']]
+        queries = []
+        for ref in refs:
+            last_time = state.last_time(ref)
+            start = last_time.strftime('%Y-%m-%d') if last_time is not None else start_date
+            queries.append('readAll(id==@'+ref+').hisRead(date('+start+')..date('+end_date+'), {limit: null})')
+
+        for ref, TSdata in zip(refs, self._fetch_iter(queries, max_workers=max_workers)):
+            if TSdata is not None:
+                state.update(ref, TSdata.iloc[:, 0])
+        state.save()
+        return state.table(refs)
+
 ###############################################################################
     def query(self, query):
         
@@ -978,6 +2136,9 @@ class spyspark_client(object):
             
         """
         df = pd.DataFrame()
+        match = HIS_READ_QUERY.match(query) if self.his_cache is not None else None
+        if match and POINT_FILTER.match(match.group('filter')):
+            return self._his_read_cached(match)
         if ("->link==" in query) and (".hisRead" not in query):
             df = self._readAll(query)
         elif ("equipRef==" in query) and (".hisRead" not in query):
@@ -0,0 +1,5 @@
+# Skyspark modules import each other by bare name, as when run from the Skyspark directory
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
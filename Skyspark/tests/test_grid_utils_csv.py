@@ -0,0 +1,44 @@
+"""Tests of the CSV grid decoders in grid_utils"""
+import numpy as np
+import pandas as pd
+
+import grid_utils
+
+HIS_CSV = """ts,Meter A,Meter B
+2017-11-26T00:00:00-08:00 Los_Angeles,74.5°F,-3
+2017-11-26T00:15:00-08:00 Los_Angeles,,✓
+2017-11-26T00:30:00-08:00 Los_Angeles,1_000°F,false
+"""
+
+
+def test_his_grid_csv():
+    frame = grid_utils.his_grid_csv(HIS_CSV)
+    assert frame.columns.tolist() == ["Meter A", "Meter B"]
+    assert frame.index.name == "ts"
+    assert frame.index[0] == pd.Timestamp("2017-11-26 00:00")
+    np.testing.assert_array_equal(frame["Meter A"], [74.5, np.nan, 1000.0])
+    np.testing.assert_array_equal(frame["Meter B"], [-3.0, 1.0, 0.0])
+
+
+def test_his_grid_csv_text_cells():
+    text = 'ts,Meter A\n2017-11-26T00:00:00Z UTC,12kWh\n2017-11-26T00:15:00Z UTC,"text, quoted"\n'
+    frame = grid_utils.his_grid_csv(text, keep_tz=True)
+    assert str(frame.index.tz) == "UTC"
+    np.testing.assert_array_equal(frame["Meter A"], [12.0, np.nan])
+
+
+def test_his_grid_csv_streamed_in_chunks():
+    lines = [line.encode("utf-8") for line in HIS_CSV.splitlines(keepends=True)]
+    pd.testing.assert_frame_equal(grid_utils.his_grid_csv(iter(lines), chunk_rows=2), grid_utils.his_grid_csv(HIS_CSV))
+
+
+def test_his_grid_csv_empty():
+    assert grid_utils.his_grid_csv("") is None
+    assert grid_utils.his_grid_csv("ts,Meter A\n") is None
+
+
+def test_csv_grid():
+    grid = grid_utils.csv_grid('id,dis,site,area\n@a A,Site A,✓,1200ft²\n@b,,,\n')
+    assert grid["site"].tolist()[0] is True
+    assert grid.loc[0, "dis"] == "Site A" and pd.isna(grid.loc[1, "dis"])
+    assert grid["area"].tolist()[0] == "1200ft²"
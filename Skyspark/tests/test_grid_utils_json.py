@@ -0,0 +1,55 @@
+"""Tests of the Haystack JSON history grid decoder in grid_utils"""
+import numpy as np
+import pandas as pd
+
+import grid_utils
+from bench_grid_utils import legacy_parse, make_grid
+
+COLS = [{"name": "ts"}, {"name": "v0", "id": "r:aaa Meter A"}, {"name": "v1"}]
+
+
+def test_matches_legacy_parse():
+    res = make_grid(3, 2)
+    pd.testing.assert_frame_equal(legacy_parse(res), grid_utils.his_grid_json(res), check_names=False,
+                                  check_freq=False, check_index_type=False)
+
+
+def test_numbers_units_and_specials():
+    rows = [{"ts": "t:2017-11-26T00:00:00-08:00 Los_Angeles", "v0": "n:74.5 °F", "v1": "n:-3"},
+            {"ts": "t:2017-11-26T00:15:00-08:00 Los_Angeles", "v0": "n:NaN", "v1": "n:INF kWh"},
+            {"ts": "t:2017-11-26T00:30:00-08:00 Los_Angeles", "v0": "n:1e3 kW", "v1": "n:-INF"}]
+    frame = grid_utils.his_grid_json({"cols": COLS, "rows": rows})
+    assert frame.columns.tolist() == ["r:aaa Meter A", "v1"]
+    assert frame.index.tolist() == [pd.Timestamp("2017-11-26 00:00"), pd.Timestamp("2017-11-26 00:15"),
+                                    pd.Timestamp("2017-11-26 00:30")]
+    np.testing.assert_array_equal(frame["r:aaa Meter A"], [74.5, np.nan, 1000.0])
+    np.testing.assert_array_equal(frame["v1"], [-3.0, np.inf, -np.inf])
+
+
+def test_missing_and_non_number_cells():
+    rows = [{"ts": "t:2017-11-26T00:00:00Z UTC", "v0": "n:1 kWh"},
+            {"ts": "t:2017-11-26T00:15:00Z UTC", "v0": True, "v1": "m:"},
+            {"ts": "t:2017-11-26T00:30:00Z UTC", "v0": "s:text with spaces", "v1": "n:2"}]
+    assert grid_utils.decode_grid_numbers(rows, ["v0", "v1"]) is None
+    frame = grid_utils.his_grid_json({"cols": COLS, "rows": rows})
+    np.testing.assert_array_equal(frame["r:aaa Meter A"], [1.0, 1.0, np.nan])
+    np.testing.assert_array_equal(frame["v1"], [np.nan, np.nan, 2.0])
+
+
+def test_keep_tz():
+    rows = [{"ts": "t:2017-11-05T01:30:00-07:00 Los_Angeles", "v0": "n:1"},
+            {"ts": "t:2017-11-05T01:30:00-08:00 Los_Angeles", "v0": "n:2"}]
+    frame = grid_utils.his_grid_json({"cols": COLS[:2], "rows": rows}, keep_tz=True)
+    assert str(frame.index.tz) == "America/Los_Angeles"
+    assert (frame.index[1] - frame.index[0]) == pd.Timedelta(hours=1)
+    naive = grid_utils.his_grid_json({"cols": COLS[:2], "rows": rows})
+    assert naive.index[0] == naive.index[1] == pd.Timestamp("2017-11-05 01:30")
+
+
+def test_fractional_seconds():
+    times = grid_utils.decode_times(["t:2017-11-26T00:00:00.5Z UTC", "t:2017-11-26T00:00:01.25+01:00 Berlin"])
+    assert times.tolist() == [pd.Timestamp("2017-11-26 00:00:00.5"), pd.Timestamp("2017-11-26 00:00:01.25")]
+
+
+def test_empty_grid():
+    assert grid_utils.his_grid_json({"cols": COLS, "rows": []}) is None
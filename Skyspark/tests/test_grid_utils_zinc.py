@@ -0,0 +1,52 @@
+"""Tests of the Zinc grid decoders in grid_utils"""
+import numpy as np
+import pandas as pd
+
+import grid_utils
+from bench_grid_utils import make_grid, make_zinc
+
+HIS_ZINC = """ver:"3.0" hisStart:2017-11-26T00:00:00-08:00 Los_Angeles
+ts,v0 id:@aaa "Meter A",v1
+2017-11-26T00:00:00-08:00 Los_Angeles,74.5°F,-3
+2017-11-26T00:15:00-08:00 Los_Angeles,NaN,INFkWh
+2017-11-26T00:30:00-08:00 Los_Angeles,,T
+"""
+
+
+def test_zinc_scalars():
+    cases = {'"a \\"quoted\\" \\$ text"': 'a "quoted" $ text', '"s:looks typed"': "s:s:looks typed",
+             "74.5°F": "n:74.5 °F", "1_000": "n:1000", "-INF": "n:-INF", "@p:demo:r:1 \"Meter\"": "r:p:demo:r:1 Meter",
+             "M": "m:", "N": None, "T": True, "F": False, "NA": "z:", "2017-11-26": "d:2017-11-26",
+             "12:30:00": "h:12:30:00", "`http://x`": "u:http://x", "C(37.5,-122.2)": "c:37.5,-122.2",
+             "Bin(\"text/plain\")": "x:Bin:text/plain",
+             "2017-11-26T00:00:00-08:00 Los_Angeles": "t:2017-11-26T00:00:00-08:00 Los_Angeles"}
+    for text, expected in cases.items():
+        assert grid_utils.zinc_scalar(text, 0) == (expected, len(text)), text
+
+
+def test_zinc_grid():
+    grid = grid_utils.zinc_grid('ver:"3.0" dis:"Sites"\nid,dis,area,site\n@a "A",,1200ft²,M\n@b,"B",N,\n')
+    assert grid["meta"] == {"ver": "3.0", "dis": "Sites"}
+    assert [col["name"] for col in grid["cols"]] == ["id", "dis", "area", "site"]
+    assert grid["rows"] == [{"id": "r:a A", "area": "n:1200 ft²", "site": "m:"}, {"id": "r:b", "dis": "B"}]
+
+
+def test_his_grid_zinc():
+    frame = grid_utils.his_grid_zinc(HIS_ZINC)
+    assert frame.columns.tolist() == ["r:aaa Meter A", "v1"]
+    assert frame.index.name == "ts"
+    assert frame.index[-1] == pd.Timestamp("2017-11-26 00:30")
+    np.testing.assert_array_equal(frame["r:aaa Meter A"], [74.5, np.nan, np.nan])
+    np.testing.assert_array_equal(frame["v1"], [-3.0, np.inf, 1.0])
+
+
+def test_his_grid_zinc_streamed_in_chunks():
+    res = make_grid(3, 1)
+    lines = [line.encode("utf-8") for line in make_zinc(res).splitlines(keepends=True)]
+    frame = grid_utils.his_grid_zinc(iter(lines), chunk_rows=7)
+    pd.testing.assert_frame_equal(grid_utils.his_grid_json(res), frame, check_index_type=False)
+
+
+def test_his_grid_zinc_not_history():
+    assert grid_utils.his_grid_zinc('ver:"3.0"\nid,dis\n@a,"A"\n') is None
+    assert grid_utils.his_grid_zinc('ver:"3.0"\nts,v0\n') is None
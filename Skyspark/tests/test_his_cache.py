@@ -0,0 +1,78 @@
+"""Tests of the on-disk history cache his_cache"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from his_cache import his_cache
+
+DAY = datetime.timedelta(days=1)
+
+
+def frame_of(start, days, value=1.0, column="r:aaa Meter A"):
+    index = pd.date_range(pd.Timestamp(start), periods=days * 4, freq="6h")
+    return pd.DataFrame({column: np.full(len(index), value)}, index=index)
+
+
+def test_missing_spans(tmp_path):
+    cache = his_cache(directory=str(tmp_path), file_format="pickle")
+    start = datetime.date(2020, 1, 1)
+    assert cache.missing("aaa", start, start + 9 * DAY) == [(start, start + 9 * DAY)]
+
+    cache.put("aaa", frame_of(start + 2 * DAY, 3), start + 2 * DAY, start + 4 * DAY)
+    assert cache.missing("aaa", start, start + 9 * DAY) == [(start, start + DAY), (start + 5 * DAY, start + 9 * DAY)]
+    assert cache.missing("aaa", start + 2 * DAY, start + 4 * DAY) == []
+
+
+def test_today_is_not_covered(tmp_path):
+    cache = his_cache(directory=str(tmp_path), file_format="pickle")
+    today = datetime.date.today()
+    cache.put("aaa", frame_of(today - DAY, 2), today - DAY, today)
+    # Yesterday is covered, today's samples may still change and are fetched again
+    assert cache.missing("aaa", today - DAY, today) == [(today, today)]
+    assert len(cache.get("aaa", today - DAY, today)) == 8
+
+
+def test_put_replaces_overlapping_samples(tmp_path):
+    cache = his_cache(directory=str(tmp_path), file_format="pickle")
+    start = datetime.date(2020, 1, 1)
+    cache.put("aaa", frame_of(start, 4, value=1.0), start, start + 3 * DAY)
+    cache.put("aaa", frame_of(start + DAY, 1, value=2.0), start + DAY, start + DAY)
+
+    cached = cache.get("aaa", start, start + 3 * DAY)
+    assert len(cached) == 16
+    assert cached.index.is_monotonic_increasing
+    assert cached.loc["2020-01-02", "r:aaa Meter A"].tolist() == [2.0] * 4
+    assert cached.loc["2020-01-03", "r:aaa Meter A"].tolist() == [1.0] * 4
+    assert cache.column("aaa") == "r:aaa Meter A"
+
+
+def test_chunks_are_merged(tmp_path):
+    cache = his_cache(directory=str(tmp_path), file_format="pickle", max_chunks=2)
+    start = datetime.date(2020, 1, 1)
+    for day in range(4):
+        cache.put("aaa", frame_of(start + day * DAY, 1), start + day * DAY, start + day * DAY)
+    assert len(cache._read_coverage("aaa")["chunks"]) <= 2
+    assert len(cache.get("aaa", start, start + 3 * DAY)) == 16
+    assert cache.missing("aaa", start, start + 3 * DAY) == []
+
+
+def test_timezone_modes_are_cached_apart(tmp_path):
+    start = datetime.date(2020, 1, 1)
+    naive = his_cache(directory=str(tmp_path), file_format="pickle")
+    aware = his_cache(directory=str(tmp_path), file_format="pickle", keep_tz=True)
+    naive.put("aaa", frame_of(start, 1), start, start)
+    assert aware.missing("aaa", start, start) == [(start, start)]
+    assert aware.get("aaa", start, start) is None
+
+
+def test_clear(tmp_path):
+    cache = his_cache(directory=str(tmp_path), file_format="pickle")
+    start = datetime.date(2020, 1, 1)
+    cache.put("aaa", frame_of(start, 1), start, start)
+    cache.put("bbb", frame_of(start, 1), start, start)
+    cache.clear("aaa")
+    assert cache.get("aaa", start, start) is None
+    assert cache.get("bbb", start, start) is not None
+    cache.clear()
+    assert cache.get("bbb", start, start) is None
@@ -0,0 +1,43 @@
+"""Tests of the inverted tag index meta_index"""
+from meta_index import meta_index
+
+ROWS = [{"id": "r:s1 Site 1", "site": "m:", "dis": "Site 1"},
+        {"id": "r:e1 Main", "equip": "m:", "siteRef": "r:s1", "link": "s:main"},
+        {"id": "r:p1 Elec", "point": "m:", "his": "m:", "elec": "m:", "equipRef": "r:e1", "siteRef": "r:s1",
+         "navName": "Elec"},
+        {"id": "r:p2 Gas", "point": "m:", "his": "m:", "gas": "m:", "combustionVolume": "n:10 ft³",
+         "siteRef": "r:s1", "navName": "Gas"},
+        {"id": "r:p3 Temp", "point": "m:", "equipRef": "r:e1", "siteRef": "r:s1", "navName": "Temp"}]
+
+
+def ids(rows):
+    return [row["id"].split(" ")[0] for row in rows]
+
+
+def test_marker_and_missing_tags():
+    index = meta_index(ROWS)
+    assert ids(index.select({"point": True, "his": True})) == ["r:p1", "r:p2"]
+    assert ids(index.select({"point": True, "his": False})) == ["r:p3"]
+    assert ids(index.select({"elec or gas": True})) == ["r:p1", "r:p2"]
+
+
+def test_values_and_ref_paths():
+    index = meta_index(ROWS)
+    assert ids(index.select({"siteRef": "@s1", "navName": "Gas"})) == ["r:p2"]
+    assert ids(index.select({"combustionVolume": "10"})) == ["r:p2"]
+    assert ids(index.select({"id": "@p3"})) == ["r:p3"]
+    assert ids(index.select({"equipRef->link": "main"})) == ["r:p1", "r:p3"]
+
+
+def test_filters_that_cannot_be_evaluated():
+    index = meta_index(ROWS)
+    assert index.select({"point and his": True}) is None
+    assert index.select({"combustionVolume": "many"}) is None
+
+
+def test_update_replaces_records():
+    index = meta_index(ROWS)
+    index.update([{"id": "r:p3 Temp", "point": "m:", "his": "m:"}])
+    assert len(index.rows) == len(ROWS)
+    assert ids(index.select({"point": True, "his": True})) == ["r:p1", "r:p2", "r:p3"]
+    assert ids(index.select({"equipRef->link": "main"})) == ["r:p1"]
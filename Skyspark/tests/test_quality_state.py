@@ -0,0 +1,61 @@
+"""Tests of the incremental quality statistics in quality_state"""
+import numpy as np
+import pandas as pd
+
+from quality_state import quality_state
+
+INDEX = pd.date_range("2017-01-01", periods=10, freq="h")
+VALUES = [5.0, 5.0, np.nan, 0.0, 3.0, 8.0, 8.0, 8.0, 2.0, 2.0]
+
+
+def test_chan_merge_matches_one_pass(tmp_path):
+    series = pd.Series(VALUES, index=INDEX, name="meter")
+    whole = quality_state(path=str(tmp_path / "whole.json"))
+    whole.update("p", series)
+    split = quality_state(path=str(tmp_path / "split.json"))
+    split.update("p", series.iloc[:4])
+    split.update("p", series.iloc[4:])
+
+    valid = series.dropna().to_numpy()
+    for state in (whole, split):
+        point = state.points["p"]
+        assert point["count"] == 9
+        assert point["rows"] == 10
+        np.testing.assert_allclose(point["mean"], valid.mean())
+        np.testing.assert_allclose(point["m2"] / (point["count"] - 1), valid.var(ddof=1))
+
+    for name in ("zeros", "flatlines", "flat_run", "first_valid", "last_valid", "last_value"):
+        assert split.points["p"][name] == whole.points["p"][name], name
+    assert whole.points["p"]["flatlines"] == 4
+    assert whole.points["p"]["flat_run"] == 1
+
+
+def test_flatline_run_continues_across_updates(tmp_path):
+    state = quality_state(path=str(tmp_path / "state.json"))
+    state.update("p", pd.Series([1.0, 2.0, 2.0], index=INDEX[:3]))
+    state.update("p", pd.Series([2.0, 2.0], index=INDEX[3:5]))
+    # Each sample equal to the one before it is a flatline, the last three samples repeat the first 2.0
+    assert state.points["p"]["flat_run"] == 3
+    assert state.points["p"]["flatlines"] == 3
+
+
+def test_only_newer_samples_are_counted(tmp_path):
+    series = pd.Series(VALUES, index=INDEX)
+    state = quality_state(path=str(tmp_path / "state.json"))
+    state.update("p", series.iloc[:6])
+    state.update("p", series)
+    assert state.points["p"]["rows"] == 10
+    assert state.last_time("p") == INDEX[-1]
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "state.json")
+    state = quality_state(path=path)
+    state.update("p", pd.Series(VALUES, index=INDEX), name="Meter P")
+    state.save()
+    loaded = quality_state(path=path)
+    assert loaded.points == state.points
+    table = loaded.table()
+    assert table.index.tolist() == ["Meter P"]
+    assert table.loc["Meter P", "missing_n"] == 1
+    assert table.loc["Meter P", "flatline_run"] == 1
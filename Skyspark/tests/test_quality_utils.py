@@ -0,0 +1,56 @@
+"""Tests of the vectorized data quality kernel against the ts_util metrics"""
+import numpy as np
+import pandas as pd
+
+import quality_utils
+from bench_quality_utils import legacy_quality
+
+INDEX = pd.date_range("2017-01-01", periods=12, freq="15min")
+
+
+def make_frame() -> pd.DataFrame:
+    """Return a small frame with missing samples, zeros, flatlines, a spike and a point without data"""
+    return pd.DataFrame({"a": [1, 1, 0, 0, np.nan, 2, 2, 2, 3, 4, 5, 6],
+                         "b": [np.nan] * 12,
+                         "c": [10, 11, 10, 11, 10, 11, 10, 11, 10, 11, 10, 100],
+                         "d": list(range(1, 13))}, index=INDEX, dtype=float)
+
+
+def test_counts_match_ts_util():
+    # Counts worked out by hand with the ts_util definitions: count_missing is isnull, count_if '=' 0 is
+    # == 0, count_flatlines is diff() == 0 and count_outliers 'std' is |x - mean| > 3 sample std
+    table = quality_utils.data_quality_frame(make_frame())
+    assert table["count"].tolist() == [11, 0, 12, 12]
+    assert table["missing_n"].tolist() == [1, 12, 0, 0]
+    assert table["zeroVal_n"].tolist() == [2, 0, 0, 0]
+    assert table["flatline_n"].tolist() == [4, 0, 0, 0]
+    assert table["outliersStdv_n"].tolist() == [0, 0, 1, 0]
+
+
+def test_percentages_and_issues():
+    table = quality_utils.data_quality_frame(make_frame())
+    np.testing.assert_allclose(table["missing_perc"], [100 / 12, 100, 0, 0])
+    np.testing.assert_allclose(table["zeroVal_perc"], [200 / 12, 0, 0, 0])
+    np.testing.assert_allclose(table["flatline_perc"], [400 / 12, 0, 0, 0])
+    np.testing.assert_allclose(table["outliersStdv_perc"], [0, 0, 100 / 12, 0])
+    np.testing.assert_allclose(table["% ok"], [100 - 700 / 12, 0, 100 - 100 / 12, 100])
+    assert table["dominate_issue"].tolist() == ["flatline_perc", "missing_perc", "outliersStdv_perc",
+                                                "All percentages zero"]
+
+
+def test_valid_range():
+    table = quality_utils.data_quality_frame(make_frame())
+    assert table.loc["a", "first_valid"] == INDEX[0]
+    assert table.loc["a", "last_valid"] == INDEX[-1]
+    assert table.loc["a", "period_length"] == INDEX[-1] - INDEX[0]
+    assert pd.isna(table.loc["b", "first_valid"]) and pd.isna(table.loc["b", "last_valid"])
+
+
+def test_matches_legacy_passes():
+    data = make_frame()
+    pd.testing.assert_frame_equal(legacy_quality(data), quality_utils.data_quality_frame(data), check_dtype=False)
+
+
+def test_dominant_issue_ties_go_to_first_column():
+    percents = np.array([[10.0, 10.0, 5.0, 0.0], [0.0, 5.0, 5.0, 5.0], [0.0, 0.0, 0.0, 0.0]])
+    assert quality_utils.dominant_issue(percents).tolist() == ["missing_perc", "zeroVal_perc", "All percentages zero"]